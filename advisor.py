@@ -0,0 +1,158 @@
+from psycopg2 import sql
+
+from database import get_pool
+from records import fetch_records
+
+
+# Indexes that serve the searches in Controller.search_data
+RECOMMENDED_INDEXES = [
+    {'name': 'car_make_year_idx', 'table': 'car', 'method': 'btree', 'columns': 'make, year'},
+    {'name': 'mechanic_specialty_idx', 'table': 'mechanic', 'method': 'btree', 'columns': 'specialty'},
+    # Trigram index so LIKE '%John%' can avoid a sequential scan
+    {'name': 'mechanic_name_trgm_idx', 'table': 'mechanic', 'method': 'gin',
+     'columns': 'name gin_trgm_ops', 'extension': 'pg_trgm'},
+    {'name': 'servicerecord_type_date_idx', 'table': 'servicerecord', 'method': 'btree',
+     'columns': 'servicetype, servicedate'},
+    {'name': 'servicerecord_date_idx', 'table': 'servicerecord', 'method': 'btree', 'columns': 'servicedate'},
+]
+
+SCAN_NODES = ('Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan')
+
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def summarize_plan(plan):
+    """
+    Condense the output of EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) into scan
+    types, estimated vs. actual rows per scan and buffer usage.
+    """
+    top = plan[0]
+    root = top['Plan']
+    summary = {
+        'planning_ms': top.get('Planning Time'),
+        'execution_ms': top.get('Execution Time'),
+        'shared_hit_blocks': root.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': root.get('Shared Read Blocks', 0),
+        'seq_scans': [],
+        'index_scans': [],
+        'scans': [],
+    }
+    for node in _walk(root):
+        node_type = node['Node Type']
+        if node_type not in SCAN_NODES:
+            continue
+        scan = {
+            'node': node_type,
+            'relation': node.get('Relation Name'),
+            'index': node.get('Index Name'),
+            'estimated_rows': node.get('Plan Rows'),
+            'actual_rows': node.get('Actual Rows', 0) * node.get('Actual Loops', 1),
+        }
+        summary['scans'].append(scan)
+        if node_type == 'Seq Scan':
+            summary['seq_scans'].append(scan['relation'])
+        elif scan['index']:
+            summary['index_scans'].append(scan['index'])
+    return summary
+
+
+def existing_indexes(table_names):
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = ANY(%s)",
+            (list(table_names),)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def parent_tables(relations):
+    """Map each relation to its partitioned parent (servicerecord_2024_01 -> servicerecord), or itself."""
+    relations = set(relations)
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, p.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE c.relname = ANY(%s) AND c.relnamespace = to_regnamespace(current_schema())",
+            (list(relations),)
+        )
+        parents = dict(cursor.fetchall())
+    return {relation: parents.get(relation, relation) for relation in relations}
+
+
+def partitions(table):
+    """Names of a partitioned table's partitions; [] for an ordinary table."""
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                       "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname", (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def recommend_indexes(summary):
+    """Recommended indexes that are missing on tables the plan scanned sequentially."""
+    relations = {relation for relation in summary['seq_scans'] if relation}
+    if not relations:
+        return []
+    # EXPLAIN names the partitions it scanned, the recommendations name their table
+    tables = set(parent_tables(relations).values())
+    existing = existing_indexes(tables)
+    return [index for index in RECOMMENDED_INDEXES
+            if index['table'] in tables and index['name'] not in existing]
+
+
+def create_index(index):
+    # CONCURRENTLY keeps the table writable; pooled connections are in autocommit
+    statement = "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {method} ({columns})"
+    children = partitions(index['table'])
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        if index.get('extension'):
+            cursor.execute(sql.SQL("CREATE EXTENSION IF NOT EXISTS {}").format(sql.Identifier(index['extension'])))
+        if children:
+            # A partitioned table cannot be indexed CONCURRENTLY: create the
+            # parent index on the table only (invalid and empty until every
+            # partition's index is attached), then each partition's index online
+            statement = "CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} USING {method} ({columns})"
+        cursor.execute(sql.SQL(statement).format(
+            name=sql.Identifier(index['name']),
+            table=sql.Identifier(index['table']),
+            method=sql.SQL(index['method']),
+            columns=sql.SQL(index['columns'])
+        ))
+        suffix = index['name'].removeprefix(index['table'] + '_')
+        for child in children:
+            child_index = f"{child}_{suffix}"
+            cursor.execute(sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {method} ({columns})"
+            ).format(
+                name=sql.Identifier(child_index),
+                table=sql.Identifier(child),
+                method=sql.SQL(index['method']),
+                columns=sql.SQL(index['columns'])
+            ))
+            cursor.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+                sql.Identifier(index['name']), sql.Identifier(child_index)))
+
+
+def top_statements(limit=20):
+    """
+    Snapshot of the most expensive statements of this database from
+    pg_stat_statements, by total execution time. Needs the extension to be
+    installed and preloaded on the server.
+    """
+    with get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT current_setting('server_version_num')::int")
+        # The timing columns were renamed in PostgreSQL 13
+        prefix = '_exec' if cursor.fetchone()[0] >= 130000 else ''
+        cursor.execute(
+            f"SELECT calls, round(total{prefix}_time::numeric, 3) AS total_ms, "
+            f"round(mean{prefix}_time::numeric, 3) AS mean_ms, rows, "
+            "shared_blks_hit, shared_blks_read, left(query, 200) AS query "
+            "FROM pg_stat_statements "
+            "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) "
+            f"ORDER BY total{prefix}_time DESC LIMIT %s",
+            (limit,)
+        )
+        return fetch_records(cursor, 'Statement')
@@ -0,0 +1,262 @@
+"""
+asyncio variant of the model layer on asyncpg.
+
+Each async model mirrors the BaseModel API (create, read_all, read_by_pk,
+update, delete, generate_data, validate_data) and takes its table metadata
+from the matching synchronous model, so both layers stay in step. Queries
+run on a separate asyncpg pool, which lets many lookups and validations run
+concurrently, e.g. all foreign key checks of ServiceMechanic.validate_data.
+
+Unlike psycopg2, asyncpg does not coerce strings, so values must already be
+of the column's Python type (int, date, Decimal, ...).
+"""
+import asyncio
+import datetime
+
+import asyncpg
+
+from cache import get_result_cache
+from database import CONNECTION_KEYS, load_config
+from model import Car, Owner, Mechanic, ServiceRecord, ServiceMechanic, _key, random_expression
+from query import numbered
+from reports import get_report_refresher
+from schema import get_schema_cache
+
+
+# Search criteria holding dates, which asyncpg will not take as text
+DATE_CRITERIA = ('date_from', 'date_to')
+
+_pool = None
+_pool_lock = None
+_acquire_timeout = None
+
+
+async def get_async_pool():
+    """Return the asyncpg pool, creating it on first use from the same settings as the sync pool."""
+    global _pool, _pool_lock, _acquire_timeout
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            config = load_config()
+            _acquire_timeout = config['timeout']
+            connect = {key: config[key] for key in CONNECTION_KEYS}
+            connect['database'] = connect.pop('dbname')
+            _pool = await asyncpg.create_pool(
+                min_size=config['minconn'],
+                max_size=config['maxconn'],
+                max_inactive_connection_lifetime=config['max_idle'],
+                **connect
+            )
+        return _pool
+
+
+async def close_async_pool():
+    # The pool and its lock belong to the running event loop; the next
+    # asyncio.run() starts both afresh
+    global _pool, _pool_lock
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+    _pool_lock = None
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _rowcount(status):
+    # asyncpg returns the command tag, e.g. 'UPDATE 3'
+    return int(status.split()[-1])
+
+
+class AsyncBaseModel:
+    # Synchronous model supplying table_name, pk, columns and references
+    model = None
+
+    def __init__(self):
+        self.table_name = self.model.table_name
+        self.pk = self.model.pk
+        self.columns = self.model.columns
+        self.references = self.model.references
+
+    async def acquire(self):
+        # Waits up to the configured pool timeout, like ConnectionPool.getconn
+        pool = await get_async_pool()
+        return pool.acquire(timeout=_acquire_timeout)
+
+    def invalidate_cache(self):
+        # Same contract as BaseModel.invalidate_cache, for the sync models' cache and reports
+        get_result_cache().invalidate(self.table_name)
+        get_report_refresher().table_changed(self.table_name)
+
+    async def create(self, data):
+        placeholders = ', '.join(f"${i}" for i in range(1, len(data) + 1))
+        cols = ', '.join(data.keys())
+        query = f"INSERT INTO {self.table_name} ({cols}) VALUES ({placeholders}) RETURNING {self.pk}"
+        try:
+            async with await self.acquire() as conn:
+                pk_value = await conn.fetchval(query, *data.values())
+            self.invalidate_cache()
+            return pk_value
+        except Exception as e:
+            print(f"Error inserting into {self.table_name}: {e}")
+
+    async def read_all(self):
+        query = f"SELECT * FROM {self.table_name} LIMIT 100"
+        try:
+            async with await self.acquire() as conn:
+                return await conn.fetch(query)
+        except Exception as e:
+            print(f"Error reading from {self.table_name}: {e}")
+
+    async def read_by_pk(self, pk_value):
+        query = f"SELECT * FROM {self.table_name} WHERE {self.pk}=$1"
+        try:
+            async with await self.acquire() as conn:
+                return await conn.fetchrow(query, pk_value)
+        except Exception as e:
+            print(f"Error reading from {self.table_name}: {e}")
+
+    async def update(self, pk_value, data):
+        set_clause = ', '.join(f"{col}=${i}" for i, col in enumerate(data.keys(), start=1))
+        query = f"UPDATE {self.table_name} SET {set_clause} WHERE {self.pk}=${len(data) + 1}"
+        try:
+            async with await self.acquire() as conn:
+                updated = _rowcount(await conn.execute(query, *data.values(), pk_value))
+            self.invalidate_cache()
+            return updated
+        except Exception as e:
+            print(f"Error updating {self.table_name}: {e}")
+
+    async def delete(self, pk_value):
+        query = f"DELETE FROM {self.table_name} WHERE {self.pk}=$1"
+        try:
+            async with await self.acquire() as conn:
+                deleted = _rowcount(await conn.execute(query, pk_value))
+            self.invalidate_cache()
+            return deleted
+        except Exception as e:
+            print(f"Error deleting from {self.table_name}: {e}")
+
+    async def search(self, criteria, build_query=None):
+        """
+        Run the model's search_query, or build_query (e.g.
+        ServiceRecord.cost_totals_query), with the same criteria.
+        """
+        try:
+            criteria = {key: datetime.date.fromisoformat(value) if key in DATE_CRITERIA and value else value
+                        for key, value in criteria.items()}
+            query, params = (build_query or self.model.search_query)(criteria)
+            async with await self.acquire() as conn:
+                return await conn.fetch(numbered(query), *params)
+        except Exception as e:
+            print(f"Error searching {self.table_name}: {e}")
+
+    async def existing_keys(self, table, column, values):
+        if not values:
+            return set()
+        query = f"SELECT {_quote(column)} FROM {_quote(table)} WHERE {_quote(column)} = ANY($1::int[])"
+        async with await self.acquire() as conn:
+            return {row[0] for row in await conn.fetch(query, list(values))}
+
+    async def validate_batch(self, records):
+        """
+        Async counterpart of BaseModel.validate_batch. The parent-table
+        lookups for all references run concurrently.
+        """
+        records = list(records)
+        errors = [self.model.check_fields(record) for record in records]
+        references = list(self.references.items())
+        lookups = []
+        for column, (table, fk_column, _) in references:
+            values = {_key(record[column]) for record in records if record.get(column) is not None}
+            values.discard(None)
+            lookups.append(self.existing_keys(table, fk_column, values))
+        found = await asyncio.gather(*lookups, return_exceptions=True)
+        for (column, (table, _, label)), existing in zip(references, found):
+            if isinstance(existing, Exception):
+                print(f"Error validating {column} against {table}: {existing}")
+                existing = set()
+            for record, record_errors in zip(records, errors):
+                value = record.get(column)
+                if value is not None and _key(value) not in existing:
+                    record_errors.append(f"{label} with ID {value} does not exist.")
+        return errors
+
+    async def validate_data(self, data):
+        errors = (await self.validate_batch([data]))[0]
+        return len(errors) == 0, errors
+
+    async def generate_data(self, num_rows):
+        """
+        Same single INSERT ... SELECT over generate_series as
+        BaseModel.generate_data, issued through asyncpg.
+        """
+        try:
+            columns = [column for column in self.columns if column != self.pk]
+            # The catalog cache is synchronous; keep it off the event loop
+            table = await asyncio.to_thread(get_schema_cache().table, self.table_name)
+            # Catalog foreign keys, and the references it cannot declare (see BaseModel.generate_data)
+            foreign_keys = {column: (foreign_table, foreign_column)
+                            for column, (foreign_table, foreign_column, _) in self.references.items()}
+            foreign_keys.update(table.foreign_keys)
+            ctes = []
+            samples = []
+            values = []
+            for column in columns:
+                if column in foreign_keys:
+                    foreign_table, foreign_column = foreign_keys[column]
+                    sample = _quote(f"{column}_sample")
+                    ctes.append(f"{sample} AS (SELECT ARRAY(SELECT {_quote(foreign_column)} FROM "
+                                f"{_quote(foreign_table)} ORDER BY RANDOM() LIMIT $2) AS keys)")
+                    samples.append(sample)
+                    values.append(f"{sample}.keys[1 + FLOOR(RANDOM() * CARDINALITY({sample}.keys))::INT]")
+                else:
+                    values.append(random_expression(table.data_type(column)))
+            query = (
+                (f"WITH {', '.join(ctes)} " if ctes else '')
+                + f"INSERT INTO {_quote(self.table_name)} ({', '.join(map(_quote, columns))}) "
+                + f"SELECT {', '.join(values)} FROM generate_series(1, $1) AS g"
+                + ''.join(f", {sample}" for sample in samples)
+                + " ON CONFLICT DO NOTHING"
+            )
+            params = [num_rows, self.model.fk_sample_size] if ctes else [num_rows]
+            async with await self.acquire() as conn:
+                inserted = _rowcount(await conn.execute(query, *params))
+            self.invalidate_cache()
+            return inserted
+        except Exception as e:
+            print(f"Error generating data for {self.table_name}: {e}")
+            return None
+
+
+class AsyncCar(AsyncBaseModel):
+    model = Car
+
+
+class AsyncOwner(AsyncBaseModel):
+    model = Owner
+
+
+class AsyncMechanic(AsyncBaseModel):
+    model = Mechanic
+
+
+class AsyncServiceRecord(AsyncBaseModel):
+    model = ServiceRecord
+
+
+class AsyncServiceMechanic(AsyncBaseModel):
+    model = ServiceMechanic
+
+    async def create(self, data):
+        placeholders = ', '.join(f"${i}" for i in range(1, len(data) + 1))
+        query = f"INSERT INTO {self.table_name} ({', '.join(data.keys())}) VALUES ({placeholders})"
+        try:
+            async with await self.acquire() as conn:
+                inserted = _rowcount(await conn.execute(query, *data.values()))
+            self.invalidate_cache()
+            return inserted
+        except Exception as e:
+            print(f"Error inserting into {self.table_name}: {e}")
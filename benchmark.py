@@ -0,0 +1,482 @@
+"""
+Headless benchmark for the model layer.
+
+Starts a throwaway PostgreSQL cluster with initdb/pg_ctl (or uses the
+configured database with --external), loads schema.sql, seeds every table
+to the requested scale factor and records throughput and p50/p95/p99
+latency per operation. Results are written as JSON; --compare prints the
+change against an earlier run.
+
+    python benchmark.py --scale 1 --iterations 200 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+    python benchmark.py --sqlite --scale 0.1     # no PostgreSQL needed, e.g. in CI
+    python benchmark.py --realistic              # realistic values and fan-out, needs numpy
+    python benchmark.py --partition 1            # servicerecord in monthly partitions
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import psycopg2.extras
+
+from cache import ResultCache
+from database import close_pool, get_pool
+from model import Car, Owner, Mechanic, ServiceRecord, ServiceMechanic
+from partitioning import get_parallel_search, partition_servicerecord
+from records import ResultSet, fetch_records
+from synthetic import LAST_NAMES, PROFILE
+
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# Run in a fresh interpreter: seconds to a ready Controller (the first menu)
+# and to the end of its first query, as main.py would see them
+STARTUP_PROBE = """
+import startup
+from controller import Controller
+controller = Controller(warm_up=False)
+menu = startup.elapsed()
+controller.models['1'].read_page()
+print(menu, startup.elapsed())
+"""
+
+# Rows per table at scale factor 1, in foreign key order
+BASE_ROWS = [
+    (Owner, 1000),
+    (Mechanic, 100),
+    (Car, 2000),
+    (ServiceRecord, 5000),
+    (ServiceMechanic, 5000),
+]
+
+
+class TemporaryPostgres:
+    """A private PostgreSQL cluster in a temporary directory, reachable over a unix socket."""
+
+    def __init__(self, dbname='benchmark'):
+        self.dbname = dbname
+        self.datadir = None
+        self.port = None
+
+    def _free_port(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    def start(self):
+        self.datadir = tempfile.mkdtemp(prefix='pgbench-')
+        self.port = self._free_port()
+        subprocess.run(['initdb', '-D', self.datadir, '-U', 'postgres', '--auth=trust'],
+                       check=True, stdout=subprocess.DEVNULL)
+        options = f"-p {self.port} -k {self.datadir} -c listen_addresses='' -c fsync=off"
+        subprocess.run(['pg_ctl', '-D', self.datadir, '-o', options, '-l',
+                        os.path.join(self.datadir, 'server.log'), '-w', 'start'],
+                       check=True, stdout=subprocess.DEVNULL)
+        conn = psycopg2.connect(dbname='postgres', user='postgres', host=self.datadir, port=self.port)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE "{self.dbname}"')
+        conn.close()
+        # The pool reads its settings from the environment
+        os.environ.update({
+            'DB_DBNAME': self.dbname,
+            'DB_USER': 'postgres',
+            'DB_HOST': self.datadir,
+            'DB_PORT': str(self.port),
+        })
+        close_pool()
+
+    def stop(self):
+        close_pool()
+        if self.datadir:
+            subprocess.run(['pg_ctl', '-D', self.datadir, '-m', 'fast', '-w', 'stop'],
+                           stdout=subprocess.DEVNULL)
+            shutil.rmtree(self.datadir, ignore_errors=True)
+            self.datadir = None
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(fraction * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(timings, rows_per_call=1):
+    if not timings:
+        return {'calls': 0}
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'calls': len(timings),
+        'throughput_per_s': len(timings) * rows_per_call / total if total > 0 else None,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': total / len(timings) * 1000,
+    }
+
+
+def measure(operation, arguments):
+    timings = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def load_schema():
+    with open(SCHEMA_FILE) as f, get_pool().connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f.read())
+
+
+def seed(scale, realistic=False):
+    counts = {}
+    for model_class, base in BASE_ROWS:
+        rows = int(base * scale)
+        start = time.perf_counter()
+        if realistic:
+            inserted = model_class().generate_realistic(rows)
+        else:
+            inserted = model_class().generate_data(rows)
+        counts[model_class.table_name] = {'rows': inserted or 0, 'seconds': time.perf_counter() - start}
+    return counts
+
+
+def key_range(model):
+    with model.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT min({model.pk}), max({model.pk}) FROM {model.table_name}")
+        return cursor.fetchone()
+
+
+def run_benchmarks(iterations, generate_rows, realistic=False):
+    rng = random.Random(42)
+    owner, car, mechanic, service = Owner(), Car(), Mechanic(), ServiceRecord()
+    results = {}
+
+    new_owners = [{'firstname': f'bench{i}', 'lastname': 'owner', 'phone': '000', 'email': f'b{i}@example.com'}
+                  for i in range(iterations)]
+    created = []
+
+    def create(data):
+        created.append(owner.create(data))
+
+    results['create'] = summarize(measure(create, [(data,) for data in new_owners]))
+
+    low, high = key_range(car)
+    car_ids = [(rng.randint(low, high),) for _ in range(iterations)]
+    # The ids repeat, so the cached model mostly measures cache hits; report
+    # real round trips (with the result cache bypassed) separately
+    uncached_car = Car()
+    uncached_car.cache = ResultCache(0, 0, 0)
+    results['read_by_pk'] = summarize(measure(uncached_car.read_by_pk, car_ids))
+    car.cache.invalidate(car.table_name)
+    results['read_by_pk_cached'] = summarize(measure(car.read_by_pk, car_ids))
+    results['update'] = summarize(measure(
+        owner.update, [(pk, {'phone': str(rng.randint(0, 9999))}) for pk in created if pk]
+    ))
+    results['delete'] = summarize(measure(owner.delete, [(pk,) for pk in created if pk]))
+    results['read_all'] = summarize(measure(car.read_all, [()] * max(1, iterations // 10)))
+    results['read_page'] = summarize(measure(car.read_page, [((pk,),) for pk, in car_ids]))
+    results['generate_data'] = summarize(
+        measure(owner.generate_data, [(generate_rows,)] * 5), rows_per_call=generate_rows
+    )
+    if realistic:
+        results['generate_realistic'] = summarize(
+            measure(owner.generate_realistic, [(generate_rows,)] * 5), rows_per_call=generate_rows
+        )
+
+    searches = {
+        'search_car': (car, lambda: {'make': '', 'year_from': str(rng.randint(0, 500)),
+                                     'year_to': str(rng.randint(500, 999))}),
+        'search_mechanic': (mechanic, lambda: {'specialty': '', 'name_pattern': f'%{rng.randint(0, 9)}a%'}),
+        'search_servicerecord': (service, lambda: {'date_from': '2024-03-01', 'date_to': '2024-04-01',
+                                                   'servicetype': ''}),
+    }
+    if realistic:
+        # Criteria with the selectivity real users would see (synthetic.PROFILE)
+        makes = list(PROFILE['car']['makes'])
+        service_types = list(PROFILE['servicerecord']['types'])
+        searches = {
+            'search_car': (car, lambda: {'make': rng.choice(makes), 'year_from': str(rng.randint(2005, 2015)),
+                                         'year_to': str(rng.randint(2016, 2025))}),
+            'search_mechanic': (mechanic, lambda: {'specialty': rng.choice(PROFILE['mechanic']['specialties']),
+                                                   'name_pattern': f"%{rng.choice(LAST_NAMES)}%"}),
+            'search_servicerecord': (service, lambda: {'date_from': '2024-03-01', 'date_to': '2024-04-01',
+                                                       'servicetype': rng.choice(service_types)}),
+        }
+    for name, (model, make_criteria) in searches.items():
+        def search(criteria, model=model):
+            query, params = model.search_query(criteria)
+            with model.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, params)
+                cursor.fetchall()
+        results[name] = summarize(measure(search, [(make_criteria(),) for _ in range(iterations)]))
+
+    # The whole generated date range, as one query and as one query per partition
+    first_year, last_year = (2016, 2025) if realistic else (2024, 2024)
+    wide = [({'date_from': f'{first_year}-01-{rng.randint(1, 28):02d}',
+              'date_to': f'{last_year}-12-{rng.randint(1, 28):02d}', 'servicetype': ''},)
+            for _ in range(max(1, iterations // 10))]
+    results['search_servicerecord_wide'] = summarize(
+        measure(lambda criteria: service.cached_query(*service.search_query(criteria)), wide)
+    )
+    results['search_servicerecord_parallel'] = summarize(measure(get_parallel_search().search, wide))
+    return results
+
+
+def run_row_formats(model, runs=5):
+    """
+    Fetch a whole table as DictRows, as records and as a ResultSet: rows/s
+    and the bytes per row the result holds (tracemalloc, measured apart from
+    the timing runs). On SQLite the DictRow baseline is sqlite3.Row.
+    """
+    formats = {
+        'dictrow': (psycopg2.extras.DictCursor, lambda cursor: cursor.fetchall()),
+        'records': (None, lambda cursor: fetch_records(cursor, type(model).__name__)),
+        'result_set': (None, lambda cursor: ResultSet.from_cursor(cursor, type(model).__name__)),
+    }
+    query = f"SELECT * FROM {model.table_name}"
+
+    def fetch(cursor_factory, convert):
+        with model.connection() as conn, conn.cursor(cursor_factory=cursor_factory) as cursor:
+            cursor.execute(query)
+            return convert(cursor)
+
+    results = {}
+    for name, (cursor_factory, convert) in formats.items():
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            rows = len(fetch(cursor_factory, convert))
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = fetch(cursor_factory, convert)
+            held = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del result
+        results[name] = {
+            'rows': rows,
+            'rows_per_s': round(rows / (sum(timings) / runs), 1) if rows else None,
+            'bytes_per_row': round(held / rows, 1) if rows else None,
+        }
+    return results
+
+
+def run_startup(runs=5):
+    menu, first_query = [], []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(SCHEMA_FILE))
+        menu_seconds, query_seconds = map(float, result.stdout.split()[-2:])
+        menu.append(menu_seconds)
+        first_query.append(query_seconds)
+    return {'startup_first_menu': summarize(menu), 'startup_first_query': summarize(first_query)}
+
+
+def run_concurrency(levels, requests):
+    """
+    Compare the sync models (one thread per client) with the async models
+    (one task per client) on ServiceMechanic validation and primary-key
+    reads at each concurrency level.
+    """
+    from async_model import AsyncCar, AsyncServiceMechanic, close_async_pool
+
+    rng = random.Random(7)
+    service_low, service_high = key_range(ServiceRecord())
+    mechanic_low, mechanic_high = key_range(Mechanic())
+    car_low, car_high = key_range(Car())
+    records = [{'serviceid': rng.randint(service_low, service_high),
+                'mechanicid': rng.randint(mechanic_low, mechanic_high),
+                'hoursworked': 1} for _ in range(requests)]
+    car_ids = [rng.randint(car_low, car_high) for _ in range(requests)]
+
+    sync_car = Car()
+    # Bypass the result cache so both paths do the same database work
+    sync_car.cache = ResultCache(0, 0, 0)
+    sync_operations = {
+        'validate_servicemechanic': (ServiceMechanic().validate_data, records),
+        'read_by_pk': (sync_car.read_by_pk, car_ids),
+    }
+    # The models print errors and return None or an invalid result instead of
+    # raising; every key above exists, so anything else means the call failed
+    succeeded = {
+        'validate_servicemechanic': lambda result: result is not None and result[0],
+        'read_by_pk': lambda result: result is not None,
+    }
+
+    def check(name, argument, result):
+        if not succeeded[name](result):
+            raise RuntimeError(f"{name}({argument!r}) failed: {result!r}")
+
+    def timed(name, operation, argument):
+        start = time.perf_counter()
+        result = operation(argument)
+        elapsed = time.perf_counter() - start
+        check(name, argument, result)
+        return elapsed
+
+    async def async_run(clients, name, operation, arguments):
+        semaphore = asyncio.Semaphore(clients)
+
+        async def call(argument):
+            async with semaphore:
+                start = time.perf_counter()
+                result = await operation(argument)
+                elapsed = time.perf_counter() - start
+                check(name, argument, result)
+                return elapsed
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(call(argument) for argument in arguments))
+        return timings, time.perf_counter() - start
+
+    async def async_level(clients):
+        level = {}
+        operations = {
+            'validate_servicemechanic': (AsyncServiceMechanic().validate_data, records),
+            'read_by_pk': (AsyncCar().read_by_pk, car_ids),
+        }
+        try:
+            for name, (operation, arguments) in operations.items():
+                timings, wall = await async_run(clients, name, operation, arguments)
+                level[name] = dict(summarize(timings), throughput_per_s=len(timings) / wall)
+        finally:
+            await close_async_pool()
+        return level
+
+    results = {}
+    for clients in levels:
+        level = {'sync': {}, 'async': asyncio.run(async_level(clients))}
+        for name, (operation, arguments) in sync_operations.items():
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                timings = list(executor.map(lambda argument: timed(name, operation, argument), arguments))
+            wall = time.perf_counter() - start
+            level['sync'][name] = dict(summarize(timings), throughput_per_s=len(timings) / wall)
+        results[str(clients)] = level
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(SCHEMA_FILE)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path} ({baseline['meta'].get('commit')}):")
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before or not before.get('p50_ms') or not result.get('p50_ms'):
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        print(f"  {name:22} p50 {before['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the seed row counts')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per measured operation')
+    parser.add_argument('--generate-rows', type=int, default=10000, help='rows per generate_data call')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--concurrency', type=int, nargs='*', metavar='CLIENTS',
+                        help='also compare sync and async models at these client counts, e.g. 1 10 100')
+    parser.add_argument('--external', action='store_true',
+                        help='use the configured database instead of a throwaway cluster')
+    parser.add_argument('--realistic', action='store_true',
+                        help='seed with realistic client-side data (needs numpy) and search with matching criteria')
+    parser.add_argument('--sqlite', action='store_true',
+                        help='run against the embedded SQLite backend instead of PostgreSQL')
+    parser.add_argument('--partition', type=int, metavar='MONTHS',
+                        help='range-partition servicerecord by servicedate after seeding, MONTHS per partition')
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        # The backend creates the tables itself; nothing to start
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ':memory:'
+        close_pool()
+    server = None if args.external or args.sqlite else TemporaryPostgres()
+    try:
+        if server:
+            server.start()
+        if not args.sqlite:
+            load_schema()
+        seeded = seed(args.scale, args.realistic)
+        partitioned = None
+        if args.partition and not args.sqlite:
+            start = time.perf_counter()
+            partitions = partition_servicerecord(months=args.partition)
+            partitioned = {'months': args.partition, 'partitions': partitions,
+                           'seconds': time.perf_counter() - start}
+        if args.sqlite:
+            server_version = f"SQLite {sqlite3.sqlite_version}"
+        else:
+            with get_pool().connection() as conn, conn.cursor() as cursor:
+                cursor.execute('SHOW server_version')
+                server_version = cursor.fetchone()[0]
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'scale': args.scale,
+                'iterations': args.iterations,
+                'server_version': server_version,
+                'backend': 'sqlite' if args.sqlite else 'postgresql',
+                'data': 'realistic' if args.realistic else 'random',
+                'partitioning': partitioned,
+            },
+            'seed': seeded,
+            'results': run_benchmarks(args.iterations, args.generate_rows, args.realistic),
+        }
+        report['results'].update(run_startup())
+        report['row_formats'] = run_row_formats(ServiceRecord())
+        if args.concurrency and not args.sqlite:
+            report['concurrency'] = run_concurrency(args.concurrency, args.iterations * 5)
+    finally:
+        if server:
+            server.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, result in report['results'].items():
+        if not result['calls']:
+            continue
+        print(f"{name:30} {result['throughput_per_s'] or 0:12.1f}/s  p50 {result['p50_ms']:8.3f}  "
+              f"p95 {result['p95_ms']:8.3f}  p99 {result['p99_ms']:8.3f} ms")
+    for name, result in report['row_formats'].items():
+        print(f"rows as {name:14} {result['rows_per_s'] or 0:12.1f} rows/s  {result['bytes_per_row'] or 0:8.1f} bytes/row")
+    for clients, level in report.get('concurrency', {}).items():
+        for mode in ('sync', 'async'):
+            for name, result in level[mode].items():
+                print(f"{clients:>4} clients {mode:5} {name:26} {result['throughput_per_s']:10.1f}/s  "
+                      f"p95 {result['p95_ms']:8.3f} ms")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+from database import load_config
+from records import ResultSet
+
+
+class ResultCache:
+    """
+    In-process LRU cache with a TTL for primary-key lookups and search
+    results. Entries are grouped by table so a write can drop everything
+    cached for that table. Holds at most max_entries entries; results with
+    more than max_rows rows are never cached.
+    """
+
+    def __init__(self, max_entries, ttl, max_rows):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (table, key) -> (expires_at, value)
+        self._by_table = {}             # table -> set of keys
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _remove(self, entry_key):
+        del self._entries[entry_key]
+        table_keys = self._by_table.get(entry_key[0])
+        if table_keys is not None:
+            table_keys.discard(entry_key)
+
+    def get(self, table, key):
+        """Return (found, value)."""
+        entry_key = (table, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(entry_key)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end(entry_key)
+            self.counters['hits'] += 1
+            return True, entry[1]
+
+    def put(self, table, key, value):
+        if value is None or (isinstance(value, (list, ResultSet)) and len(value) > self.max_rows):
+            return
+        entry_key = (table, key)
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = (time.monotonic() + self.ttl, value)
+            self._by_table.setdefault(table, set()).add(entry_key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, table):
+        with self._lock:
+            for entry_key in self._by_table.pop(table, set()):
+                self._entries.pop(entry_key, None)
+            self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {'entries': len(self._entries), 'max_entries': self.max_entries}
+            stats.update(self.counters)
+            lookups = self.counters['hits'] + self.counters['misses']
+            stats['hit_ratio'] = round(self.counters['hits'] / lookups, 3) if lookups else 0.0
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = load_config()
+            _cache = ResultCache(config['cache_size'], config['cache_ttl'], config['cache_max_rows'])
+        return _cache
@@ -0,0 +1,214 @@
+"""
+Change feed: the inserts, updates and deletes of car, servicerecord and
+servicemechanic, for consumers that would otherwise poll read_all or the
+searches.
+
+Triggers in schema.sql append every change, whoever makes it (the models,
+COPY, psql), to the change_log table and NOTIFY the change_log channel when
+the writing transaction commits. A change is a record of changeid, txid,
+table, operation ('insert', 'update' or 'delete'), key (the primary key
+columns) and data: the new row for an insert, only the changed columns for
+an update, None for a delete.
+
+Changes are read in (txid, changeid) order, and only once every older
+transaction has finished, so a transaction that commits late cannot slip in
+behind a reader's offset; one long-running transaction holds the feed back
+until it ends. An offset is the (txid, changeid) of the last change consumed.
+Named subscribers keep their offset in change_offsets and resume from it.
+It is saved after each batch has been handled, so after a crash at most one
+batch is delivered again.
+
+    feed = ChangeFeed()
+    feed.subscribe(handle_batch, subscriber='search-index')   # follows until stopped
+    feed.prune()                                              # drop what every subscriber has read
+
+Every write leaves its rows in change_log until pruned (main.py changes
+--prune), e.g. from cron after bulk loads.
+"""
+import json
+import select
+import threading
+from contextlib import contextmanager
+
+from cache import get_result_cache
+from database import get_pool, load_config
+from records import record_class
+from reports import get_report_refresher
+
+
+CHANNEL = 'change_log'
+TABLES = ('car', 'servicerecord', 'servicemechanic')
+OPERATIONS = {'I': 'insert', 'U': 'update', 'D': 'delete'}
+START = (0, 0)
+
+Change = record_class('Change', ('changeid', 'txid', 'table', 'operation', 'key', 'data', 'changedat'))
+
+# Only changes of transactions older than every running one; SQLite has a single writer
+VISIBLE = " AND txid < txid_snapshot_xmin(txid_current_snapshot())"
+
+
+def _json(value):
+    # psycopg2 decodes jsonb itself, SQLite returns the text
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def invalidate_caches(changes):
+    """Handler dropping the cached results and marking stale the reports of the changed tables."""
+    for table in {change.table for change in changes}:
+        get_result_cache().invalidate(table)
+        get_report_refresher().table_changed(table)
+
+
+class ChangeFeed:
+    def __init__(self, tables=TABLES, batch_size=None, poll_interval=None):
+        config = load_config()
+        self.tables = list(tables)
+        self.batch_size = batch_size or config['change_batch_size']
+        self.poll_interval = poll_interval or config['change_poll_interval']
+
+    def read(self, offset=START, limit=None):
+        """Up to limit changes after offset, oldest first, and the offset to continue from."""
+        pool = get_pool()
+        query = ("SELECT changeid, txid, tablename, operation, rowkey, data, changedat FROM change_log "
+                 "WHERE (txid, changeid) > (%s, %s) AND tablename = ANY(%s)")
+        if pool.backend == 'postgresql':
+            query += VISIBLE
+        query += " ORDER BY txid, changeid LIMIT %s"
+        with pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, (offset[0], offset[1], self.tables, limit or self.batch_size))
+            rows = cursor.fetchall()
+        changes = [Change._make((changeid, txid, table, OPERATIONS[operation.strip()], _json(key), _json(data),
+                                 changedat))
+                   for changeid, txid, table, operation, key, data, changedat in rows]
+        if changes:
+            offset = (changes[-1].txid, changes[-1].changeid)
+        return changes, offset
+
+    def latest(self):
+        """Offset of the newest readable change; start from it to skip the history."""
+        pool = get_pool()
+        query = "SELECT txid, changeid FROM change_log WHERE true"
+        if pool.backend == 'postgresql':
+            query += VISIBLE
+        with pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query + " ORDER BY txid DESC, changeid DESC LIMIT 1")
+            row = cursor.fetchone()
+        return (row[0], row[1]) if row else START
+
+    def offset(self, subscriber):
+        """Where a named subscriber left off."""
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT txid, changeid FROM change_offsets WHERE subscriber = %s", (subscriber,))
+            row = cursor.fetchone()
+        return (row[0], row[1]) if row else START
+
+    def commit(self, subscriber, offset):
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO change_offsets (subscriber, txid, changeid) VALUES (%s, %s, %s) "
+                "ON CONFLICT (subscriber) DO UPDATE SET txid = excluded.txid, changeid = excluded.changeid, "
+                "updatedat = CURRENT_TIMESTAMP",
+                (subscriber, offset[0], offset[1])
+            )
+
+    @contextmanager
+    def _listener(self, stop):
+        # Yields wait(timeout), which returns early on a notification or stop
+        pool = get_pool()
+        if pool.backend != 'postgresql':
+            yield stop.wait
+            return
+        # The connection stays borrowed while the subscription follows the feed
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+
+            def wait(timeout):
+                if not conn.notifies and select.select([conn], [], [], timeout) != ([], [], []):
+                    conn.poll()
+                conn.notifies.clear()
+
+            try:
+                yield wait
+            finally:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"UNLISTEN {CHANNEL}")
+
+    def subscribe(self, handler, subscriber=None, offset=None, follow=True, stop=None):
+        """
+        Call handler(changes) with batches of up to batch_size changes, from
+        offset, or from where subscriber left off. A named subscriber's offset
+        is saved after every batch. Without follow, return once caught up;
+        with follow, wait for new changes until stop (a threading.Event) is
+        set. Returns the offset reached.
+        """
+        if offset is None:
+            offset = self.offset(subscriber) if subscriber else START
+        stop = stop or threading.Event()
+
+        def catch_up():
+            nonlocal offset
+            while not stop.is_set():
+                changes, offset_after = self.read(offset)
+                if not changes:
+                    return
+                handler(changes)
+                offset = offset_after
+                if subscriber:
+                    self.commit(subscriber, offset)
+                if len(changes) < self.batch_size:
+                    return
+
+        if not follow:
+            catch_up()
+            return offset
+        with self._listener(stop) as wait:
+            while not stop.is_set():
+                catch_up()
+                # Changes held back behind a running transaction are picked up on the timeout
+                wait(self.poll_interval)
+        return offset
+
+    def start(self, handler, subscriber=None, offset=None):
+        """
+        Follow the feed in a daemon thread, from offset, where subscriber left
+        off, or else the newest change. Returns the Event that stops it.
+        """
+        stop = threading.Event()
+
+        def run():
+            position = offset
+            while not stop.is_set():
+                try:
+                    if position is None and not subscriber:
+                        position = self.latest()
+
+                    def handle(changes):
+                        nonlocal position
+                        handler(changes)
+                        position = (changes[-1].txid, changes[-1].changeid)
+
+                    self.subscribe(handle, subscriber, position, stop=stop)
+                except Exception as e:
+                    print(f"Error following the change feed: {e}")
+                    stop.wait(self.poll_interval)
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop
+
+    def prune(self, offset=None):
+        """
+        Delete the changes up to offset, or those every named subscriber has
+        consumed; with no named subscribers nothing resumes, so every
+        readable change goes. Returns the number of changes deleted.
+        """
+        if offset is None:
+            with get_pool().connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT txid, changeid FROM change_offsets ORDER BY txid, changeid LIMIT 1")
+                offset = cursor.fetchone()
+            offset = offset or self.latest()
+            if offset == START:
+                return 0
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM change_log WHERE (txid, changeid) <= (%s, %s)", (offset[0], offset[1]))
+            return cursor.rowcount
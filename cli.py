@@ -0,0 +1,453 @@
+"""
+Non-interactive command line for scripts, cron jobs and pipelines.
+
+Records are printed as JSON lines, every other command prints a single JSON
+status object, an {"error": ...} one when it failed, with a non-zero exit
+status. Diagnostics (skipped rows, database errors) go to stderr, so stdout
+stays machine-readable.
+
+    python main.py create owner '{"firstname": "Ann", "lastname": "Lee"}'
+    python main.py read car --pk 42
+    python main.py search car make=Toyota year_from=2015
+    python main.py search servicecost date_from=2024-01-01 limit=20
+    python main.py generate servicerecord 100000
+    python main.py dataset owner=100000 car=200000 servicerecord=1000000 --workers 8
+    python main.py dataset owner=100000 car=200000 servicerecord=1000000 --realistic
+    python main.py import car cars.csv
+    python main.py export servicerecord --output history.parquet
+    python main.py export-search servicerecord date_from=2020-01-01 --format csv
+    python main.py report car_service_costs --limit 20
+    python main.py top-statements --limit 10
+    python main.py changes --subscriber search-index --follow
+    python main.py changes --prune
+    python main.py partition --first-year 2015 --months 3
+    python main.py benchmark --scale 2
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import sys
+import time
+
+import export
+from advisor import top_statements
+from changefeed import TABLES as CHANGE_TABLES, ChangeFeed
+from dataio import read_rows, to_json, write_rows
+from dataset import generate_dataset
+from model import MODELS, Car, Mechanic, ServiceRecord
+from partitioning import get_parallel_search, partition_servicerecord
+from reports import REPORTS, get_report_refresher
+
+
+# Model, query builder and accepted criteria of each search, as in Controller.search_data
+SEARCHES = {
+    'car': (Car, Car.search_query, ('make', 'year_from', 'year_to')),
+    'mechanic': (Mechanic, Mechanic.search_query, ('specialty', 'name_pattern')),
+    'servicerecord': (ServiceRecord, ServiceRecord.search_query, ('date_from', 'date_to', 'servicetype')),
+    'servicecost': (ServiceRecord, ServiceRecord.cost_totals_query, ('date_from', 'date_to', 'limit')),
+}
+
+
+# The real stdout; main() points sys.stdout at stderr while a command runs
+stdout = sys.stdout
+
+
+def emit(status, **fields):
+    print(json.dumps(fields, default=str), file=stdout)
+    return 0 if status else 1
+
+
+def open_output(path):
+    return open(path, 'w', newline='', encoding='utf-8') if path else stdout
+
+
+def load_data(args):
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            return json.load(f)
+    return json.loads(args.data)
+
+
+def cmd_create(args):
+    model = MODELS[args.table]()
+    data = load_data(args)
+    valid, errors = model.validate_data(data)
+    if not valid:
+        return emit(False, table=args.table, errors=errors)
+    result = model.create(data)
+    return emit(result is not None, table=args.table, created=result)
+
+
+def cmd_read(args):
+    model = MODELS[args.table]()
+    if args.pk is not None:
+        record = model.read_by_pk(args.pk)
+        if record is None:
+            return emit(False, table=args.table, pk=args.pk, error="not found or not readable")
+        records = [record]
+    elif args.all:
+        records = model.iter_rows()
+    else:
+        after = tuple(args.after) if args.after else None
+        records, _ = model.read_page(after=after, page_size=args.page_size)
+        if records is None:
+            return emit(False, table=args.table, error="read failed")
+    out = open_output(args.output)
+    try:
+        write_rows(records, out, args.format)
+    finally:
+        if out is not stdout:
+            out.close()
+    return 0
+
+
+def cmd_update(args):
+    model = MODELS[args.table]()
+    data = load_data(args)
+    valid, errors = model.validate_data(data)
+    if not valid:
+        return emit(False, table=args.table, errors=errors)
+    result = model.update(args.pk, data)
+    return emit(bool(result), table=args.table, updated=result or 0)
+
+
+def cmd_delete(args):
+    model = MODELS[args.table]()
+    dependents = model.find_dependents(args.pk)
+    if dependents and not args.cascade:
+        return emit(False, table=args.table, error="referenced by other rows", dependents=dependents)
+    result = model.delete_cascade(args.pk) if dependents else model.delete(args.pk)
+    return emit(bool(result), table=args.table, deleted=result or 0)
+
+
+def search_criteria(args):
+    """Criteria dict from key=value arguments; raises ValueError on unknown keys."""
+    fields = SEARCHES[args.search][2]
+    criteria = dict.fromkeys(fields, '')
+    for pair in args.criteria:
+        key, _, value = pair.partition('=')
+        if key not in criteria:
+            raise ValueError(f"unknown criterion {key}, expected one of {', '.join(fields)}")
+        criteria[key] = value
+    return criteria
+
+
+def search_query(args):
+    """Build the search from key=value arguments; raises ValueError on bad criteria."""
+    model_class, build_query, _ = SEARCHES[args.search]
+    query, params = build_query(search_criteria(args))
+    return model_class(), query, params
+
+
+def cmd_search(args):
+    try:
+        model, query, params = search_query(args)
+        criteria = search_criteria(args)
+    except ValueError as e:
+        return emit(False, error=f"invalid criteria: {e}")
+    start_time = time.perf_counter()
+    try:
+        if args.search == 'servicerecord':
+            # One query per partition of the date range, in date order
+            records = get_parallel_search().search(criteria)
+        else:
+            records = model.cached_query(query, params)
+    except Exception as e:
+        return emit(False, search=args.search, error=str(e).strip())
+    elapsed = time.perf_counter() - start_time
+    out = open_output(args.output)
+    try:
+        write_rows(records, out, args.format)
+    finally:
+        if out is not stdout:
+            out.close()
+    print(json.dumps({'rows': len(records), 'elapsed_ms': round(elapsed * 1000, 3)}), file=sys.stderr)
+    return 0
+
+
+def cmd_generate(args):
+    model = MODELS[args.table]()
+    start_time = time.perf_counter()
+    if args.realistic:
+        rows = model.generate_realistic(args.rows)
+    else:
+        rows = model.generate_data(args.rows)
+    success = rows is not None
+    elapsed = time.perf_counter() - start_time
+    return emit(success, table=args.table, rows=rows or 0, elapsed_ms=round(elapsed * 1000, 3),
+                rows_per_s=round((rows or 0) / elapsed) if elapsed > 0 else None)
+
+
+def cmd_dataset(args):
+    counts = {}
+    for pair in args.counts:
+        table, _, rows = pair.partition('=')
+        if table not in MODELS:
+            return emit(False, error=f"unknown table {table}", allowed=list(MODELS))
+        if not rows.isdigit():
+            return emit(False, error=f"invalid row count in {pair}, expected table=rows")
+        counts[table] = int(rows)
+    start_time = time.perf_counter()
+    results = generate_dataset(counts, workers=args.workers, split_rows=args.split_rows, progress=None,
+                               realistic=args.realistic)
+    elapsed = time.perf_counter() - start_time
+    return emit(all(result['success'] for result in results.values()), tables=results,
+                elapsed_ms=round(elapsed * 1000, 3))
+
+
+def cmd_import(args):
+    model = MODELS[args.table]()
+    read = 0
+
+    def rows():
+        nonlocal read
+        for row in read_rows(args.path):
+            read += 1
+            yield row
+
+    start_time = time.perf_counter()
+    loaded = model.bulk_load(rows(), chunk_size=args.chunk_size, validate=not args.no_validate)
+    elapsed = time.perf_counter() - start_time
+    if loaded is None:
+        return emit(False, table=args.table, read=read, error="bulk load failed")
+    if read and not loaded:
+        return emit(False, table=args.table, read=read, loaded=0, error="no valid rows")
+    return emit(True, table=args.table, read=read, loaded=loaded, elapsed_ms=round(elapsed * 1000, 3),
+                rows_per_s=round(loaded / elapsed) if elapsed > 0 else None)
+
+
+def run_export(model, args, query=None, params=None):
+    fmt = args.format or export.format_for(args.output)
+    if fmt == 'parquet' and not args.output:
+        return emit(False, error="parquet export needs --output")
+    start_time = time.perf_counter()
+    if args.output:
+        count = export.export(model, args.output, fmt, query, params)
+    else:
+        count = export.export_stream(model, stdout, fmt, query, params)
+    elapsed = time.perf_counter() - start_time
+    print(json.dumps({'table': model.table_name, 'rows': count, 'elapsed_ms': round(elapsed * 1000, 3)}),
+          file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    return run_export(MODELS[args.table](), args)
+
+
+def cmd_export_search(args):
+    try:
+        model, query, params = search_query(args)
+    except ValueError as e:
+        return emit(False, error=f"invalid criteria: {e}")
+    return run_export(model, args, query, params)
+
+
+def cmd_report(args):
+    try:
+        if args.refresh and not get_report_refresher().refresh(args.report):
+            return emit(False, report=args.report, error="refresh failed")
+        records = get_report_refresher().read(args.report, args.limit)
+    except Exception as e:
+        return emit(False, report=args.report, error=str(e).strip())
+    out = open_output(args.output)
+    try:
+        write_rows(records, out, args.format)
+    finally:
+        if out is not stdout:
+            out.close()
+    return 0
+
+
+def cmd_top_statements(args):
+    try:
+        records = top_statements(args.limit)
+    except Exception as e:
+        return emit(False, error=f"pg_stat_statements is not available: {e}")
+    write_rows(records, stdout, 'jsonl')
+    return 0
+
+
+def cmd_changes(args):
+    feed = ChangeFeed(tables=args.tables or CHANGE_TABLES, batch_size=args.batch_size)
+    offset = None
+    if args.offset:
+        txid, _, changeid = args.offset.partition(':')
+        offset = (int(txid), int(changeid))
+    if args.prune:
+        try:
+            deleted = feed.prune(offset)
+        except Exception as e:
+            return emit(False, error=str(e).strip())
+        return emit(True, pruned=deleted)
+
+    def handle(changes):
+        for change in changes:
+            print(to_json(change), file=stdout)
+        stdout.flush()
+
+    try:
+        offset = feed.subscribe(handle, subscriber=args.subscriber, offset=offset, follow=args.follow)
+    except KeyboardInterrupt:
+        return 0
+    print(json.dumps({'offset': f"{offset[0]}:{offset[1]}"}), file=sys.stderr)
+    return 0
+
+
+def cmd_partition(args):
+    first = datetime.date(args.first_year, 1, 1) if args.first_year else None
+    last = datetime.date(args.last_year, 12, 31) if args.last_year else None
+    try:
+        partitions = partition_servicerecord(first, last, args.months)
+    except Exception as e:
+        return emit(False, table='servicerecord', error=str(e).strip())
+    return emit(True, table='servicerecord', partitions=partitions)
+
+
+def cmd_benchmark(args):
+    import benchmark
+    try:
+        # The benchmark prints a table, not JSON, so it keeps the real stdout
+        with contextlib.redirect_stdout(stdout):
+            benchmark.main(args.benchmark_args)
+    except Exception as e:
+        return emit(False, error=f"benchmark failed: {str(e).strip()}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    tables = list(MODELS)
+
+    def add_data_arguments(command):
+        source = command.add_mutually_exclusive_group(required=True)
+        source.add_argument('data', nargs='?', help='row as a JSON object')
+        source.add_argument('--file', help='JSON file holding the row')
+
+    def add_output_arguments(command):
+        command.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+        command.add_argument('--output', help='write records to a file instead of stdout')
+
+    command = commands.add_parser('create', help='insert one row')
+    command.add_argument('table', choices=tables)
+    add_data_arguments(command)
+    command.set_defaults(handler=cmd_create)
+
+    command = commands.add_parser('read', help='read by key, one page, or the whole table')
+    command.add_argument('table', choices=tables)
+    command.add_argument('--pk', type=int)
+    command.add_argument('--after', type=int, nargs='+', help='key of the last row of the previous page')
+    command.add_argument('--page-size', type=int)
+    command.add_argument('--all', action='store_true', help='stream every row')
+    add_output_arguments(command)
+    command.set_defaults(handler=cmd_read)
+
+    command = commands.add_parser('update', help='update one row by primary key')
+    command.add_argument('table', choices=tables)
+    command.add_argument('pk', type=int)
+    add_data_arguments(command)
+    command.set_defaults(handler=cmd_update)
+
+    command = commands.add_parser('delete', help='delete one row by primary key')
+    command.add_argument('table', choices=tables)
+    command.add_argument('pk', type=int)
+    command.add_argument('--cascade', action='store_true', help='also delete dependent rows')
+    command.set_defaults(handler=cmd_delete)
+
+    command = commands.add_parser('search', help='run one of the predefined searches')
+    command.add_argument('search', choices=list(SEARCHES))
+    command.add_argument('criteria', nargs='*', metavar='key=value')
+    add_output_arguments(command)
+    command.set_defaults(handler=cmd_search)
+
+    command = commands.add_parser('generate', help='generate random rows')
+    command.add_argument('table', choices=tables)
+    command.add_argument('rows', type=int)
+    command.add_argument('--realistic', action='store_true',
+                         help='realistic values and fan-out, generated client-side (needs numpy)')
+    command.set_defaults(handler=cmd_generate)
+
+    command = commands.add_parser('dataset', help='generate several tables in dependency order, in parallel')
+    command.add_argument('counts', nargs='+', metavar='table=rows')
+    command.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    command.add_argument('--split-rows', type=int, default=200000, help='rows per chunk for large tables')
+    command.add_argument('--realistic', action='store_true',
+                         help='realistic values and fan-out, generated client-side (needs numpy)')
+    command.set_defaults(handler=cmd_dataset)
+
+    command = commands.add_parser('import', help='bulk load a CSV or JSONL file')
+    command.add_argument('table', choices=tables)
+    command.add_argument('path')
+    command.add_argument('--chunk-size', type=int)
+    command.add_argument('--no-validate', action='store_true', help='skip foreign key validation')
+    command.set_defaults(handler=cmd_import)
+
+    def add_export_arguments(command):
+        command.add_argument('--format', choices=export.FORMATS,
+                             help='default: from the output file extension, else jsonl')
+        command.add_argument('--output', help='file to write (required for parquet); default stdout')
+
+    command = commands.add_parser('export', help='stream a whole table to CSV, JSONL or Parquet')
+    command.add_argument('table', choices=tables)
+    add_export_arguments(command)
+    command.set_defaults(handler=cmd_export)
+
+    command = commands.add_parser('export-search', help='stream the results of a search to a file')
+    command.add_argument('search', choices=list(SEARCHES))
+    command.add_argument('criteria', nargs='*', metavar='key=value')
+    add_export_arguments(command)
+    command.set_defaults(handler=cmd_export_search)
+
+    command = commands.add_parser('report', help='print one of the aggregate reports')
+    command.add_argument('report', choices=list(REPORTS))
+    command.add_argument('--limit', type=int)
+    command.add_argument('--refresh', action='store_true', help='refresh the report before reading it')
+    add_output_arguments(command)
+    command.set_defaults(handler=cmd_report)
+
+    command = commands.add_parser('top-statements', help='most expensive statements from pg_stat_statements')
+    command.add_argument('--limit', type=int, default=20)
+    command.set_defaults(handler=cmd_top_statements)
+
+    command = commands.add_parser('changes', help='print the change feed of car, servicerecord and servicemechanic')
+    command.add_argument('--subscriber', help='resume from and save the offset under this name')
+    command.add_argument('--offset', metavar='TXID:CHANGEID', help='start after this offset')
+    command.add_argument('--follow', action='store_true', help='keep waiting for new changes')
+    command.add_argument('--tables', nargs='+', choices=CHANGE_TABLES)
+    command.add_argument('--batch-size', type=int)
+    command.add_argument('--prune', action='store_true',
+                         help='instead delete the changes up to --offset, or those every subscriber has read')
+    command.set_defaults(handler=cmd_changes)
+
+    command = commands.add_parser('partition', help='range-partition servicerecord by servicedate (PostgreSQL)')
+    command.add_argument('--first-year', type=int, help='default: year of the oldest service')
+    command.add_argument('--last-year', type=int, help='default: next year, or the newest service')
+    command.add_argument('--months', type=int, default=12, help='months per partition')
+    command.set_defaults(handler=cmd_partition)
+
+    # Everything after "benchmark" is handed to benchmark.py unparsed
+    command = commands.add_parser('benchmark', help='run benchmark.py with the remaining arguments', add_help=False)
+    command.set_defaults(handler=cmd_benchmark)
+    return parser
+
+
+def main(argv=None):
+    global stdout
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'benchmark':
+        args.benchmark_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            status = args.handler(args)
+        except Exception as e:
+            status = emit(False, command=args.command, error=str(e).strip())
+        # The process is about to exit, so refresh reports now rather than after the delay
+        get_report_refresher().flush()
+    return status
@@ -1,13 +1,37 @@
+import contextlib
+import itertools
+import threading
 import time
-import psycopg2
 
 
-from model import Car, Owner, Mechanic, ServiceRecord, ServiceMechanic
+from advisor import create_index, recommend_indexes, summarize_plan, top_statements
+from cache import get_result_cache
+from changefeed import ChangeFeed, invalidate_caches
+from database import get_pool, load_config
+from dataio import read_rows
+from dataset import generate_dataset
+from export import export
+from instrumentation import get_instrumentation
+from model import MODELS, Car, Owner, Mechanic, ServiceRecord, ServiceMechanic
+from partitioning import get_parallel_search
+from query import get_statement_cache
+from reports import REPORTS, get_report_refresher
+from schema import get_schema_cache
+import startup
+from unit_of_work import UnitOfWork
 from view import View
 
 
+# Stand-in criteria values; preparing a search only needs its SQL text. The
+# date range spans every partition, so a parallel search yields each piece shape
+SAMPLE_CRITERIA = {
+    'make': 'x', 'year_from': '0', 'year_to': '0', 'specialty': 'x', 'name_pattern': '%',
+    'date_from': '0001-01-01', 'date_to': '9999-12-31', 'servicetype': 'x', 'limit': '1',
+}
+
+
 class Controller:
-    def __init__(self):
+    def __init__(self, warm_up=True):
         self.view = View()
         self.models = {
             '1': Car(),
@@ -23,8 +47,78 @@ class Controller:
             '4': 'ServiceRecord',
             '5': 'ServiceMechanic',
         }
+        # Menu choice -> (model, criteria prompt, query builder, criteria the prompt returns)
+        self.searches = {
+            '1': (self.models['1'], self.view.get_car_search_input, Car.search_query,
+                  ('make', 'year_from', 'year_to')),
+            '2': (self.models['3'], self.view.get_mechanic_search_input, Mechanic.search_query,
+                  ('specialty', 'name_pattern')),
+            '3': (self.models['4'], self.view.get_service_record_search_input, ServiceRecord.search_query,
+                  ('date_from', 'date_to', 'servicetype')),
+            '4': (self.models['4'], self.view.get_cost_totals_input, ServiceRecord.cost_totals_query,
+                  ('date_from', 'date_to', 'limit')),
+        }
+        # Searches run one query per partition of their date range
+        self.parallel_searches = {'3': get_parallel_search().search}
+        config = load_config()
+        budget = config['startup_budget']
+        if warm_up and budget > 0:
+            threading.Thread(target=self.warm_up, args=(budget,), daemon=True).start()
+        # Writes by other processes (CLI, dataset workers, other instances) reach this cache
+        self.change_sync = ChangeFeed().start(invalidate_caches) if config['change_sync'] else None
+
+    def warm_up(self, budget):
+        """
+        Open the pool's first connections, load the catalog and prepare every
+        search shape, in the background, giving up after budget seconds.
+        Nothing here blocks the menu, so a slow or unreachable database only
+        shows up when an operation needs it.
+        """
+        start = time.perf_counter()
+        steps = [
+            ('connect', get_pool().fill),
+            ('schema', get_schema_cache().tables),
+            ('prepare', self.prepare_searches),
+        ]
+        done = []
+        for name, step in steps:
+            if time.perf_counter() - start > budget:
+                break
+            try:
+                step()
+            except Exception as e:
+                startup.mark('warm_up', steps=done, error=f"{name}: {str(e).strip()}")
+                return
+            done.append(name)
+        startup.mark('warm_up', steps=done, complete=len(done) == len(steps),
+                     seconds=round(time.perf_counter() - start, 3))
+
+    def prepare_searches(self):
+        pool = get_pool()
+        if pool.backend != 'postgresql':
+            return
+        statements = get_statement_cache()
+        # Each subset of a search's own criteria gives one query shape
+        queries = set()
+        for choice, (_, _, build_query, fields) in self.searches.items():
+            for size in range(len(fields) + 1):
+                for chosen in itertools.combinations(fields, size):
+                    criteria = {key: SAMPLE_CRITERIA[key] if key in chosen else '' for key in fields}
+                    if choice in self.parallel_searches:
+                        # These run as ParallelSearch's per-partition queries, not build_query's
+                        queries.update(query for query, _ in get_parallel_search().queries(criteria))
+                    else:
+                        queries.add(build_query(criteria)[0])
+        # Statements are prepared per connection, so prepare them on every idle one
+        with contextlib.ExitStack() as stack:
+            connections = [stack.enter_context(pool.connection()) for _ in range(max(1, pool.stats()['idle']))]
+            for conn in connections:
+                with conn.cursor() as cursor:
+                    for query in queries:
+                        statements.prepare(cursor, query)
 
     def run(self):
+        startup.mark('first_menu')
         while True:
             choice = self.view.show_menu()
             if choice == '1':
@@ -40,6 +134,26 @@ class Controller:
             elif choice == '6':
                 self.search_data()
             elif choice == '7':
+                self.import_data()
+            elif choice == '8':
+                self.view.show_stats("Connection Pool", get_pool().stats())
+                self.view.show_stats("Result Cache", get_result_cache().stats())
+                self.view.show_stats("Prepared Statements", get_statement_cache().stats())
+                self.view.show_stats("Reports", get_report_refresher().stats())
+                self.view.show_stats("Startup (ms since launch)", startup.timings())
+            elif choice == '9':
+                self.generate_dataset()
+            elif choice == '10':
+                self.export_data()
+            elif choice == '11':
+                self.show_reports()
+            elif choice == '12':
+                self.show_query_stats()
+            elif choice == '13':
+                if self.change_sync is not None:
+                    self.change_sync.set()
+                # Do not leave the reports behind the last writes
+                get_report_refresher().flush()
                 break
             else:
                 self.view.show_message("Invalid choice.")
@@ -58,7 +172,8 @@ class Controller:
                 elif choice == '3':
                     data = self.view.get_mechanic_input()
                 elif choice == '4':
-                    data = self.view.get_service_record_input()
+                    self.add_service_record()
+                    continue
                 elif choice == '5':
                     data = self.view.get_service_mechanic_input()
                 valid, errors = model.validate_data(data)
@@ -76,13 +191,51 @@ class Controller:
             else:
                 self.view.show_message("Invalid choice.")
 
+    def add_service_record(self):
+        # The record and its mechanic assignments are written with one commit
+        model, assignment_model = self.models['4'], self.models['5']
+        data = self.view.get_service_record_input()
+        valid, errors = model.validate_data(data)
+        if not valid:
+            for error in errors:
+                self.view.show_message(error)
+            return
+        assignments = self.view.get_mechanic_assignments()
+        start_time = time.perf_counter()
+        assigned = 0
+        try:
+            with UnitOfWork():
+                serviceid = model.create(data)
+                if not serviceid:
+                    self.view.show_message("Failed to add ServiceRecord.")
+                    return
+                for assignment in assignments:
+                    assignment['serviceid'] = serviceid
+                    valid, errors = assignment_model.validate_data(assignment)
+                    if not valid:
+                        for error in errors:
+                            self.view.show_message(error)
+                    elif assignment_model.create(assignment):
+                        assigned += 1
+                    else:
+                        self.view.show_message(f"Failed to assign mechanic {assignment['mechanicid']}.")
+        except Exception as e:
+            self.view.show_message(f"Error adding ServiceRecord: {e}")
+            return
+        end_time = time.perf_counter()
+        self.view.show_message(f"ServiceRecord {serviceid} added with {assigned} mechanic(s) "
+                               f"in {(end_time - start_time)*1000:.2f} ms.")
+
     def view_data(self):
         while True:
             choice = self.view.show_table_menu()
             if choice in self.models:
                 model = self.models[choice]
-                records = model.read_all()
+                records, next_key = model.read_page()
                 self.view.show_records(records)
+                while next_key is not None and self.view.get_next_page():
+                    records, next_key = model.read_page(after=next_key)
+                    self.view.show_records(records)
             elif choice == '6':
                 break
             else:
@@ -125,14 +278,14 @@ class Controller:
                 model = self.models[choice]
                 table_name = self.model_names[choice]
                 pk_value = self.view.get_pk_input(table_name)
-                if table_name == 'Owner':
-                    car_model = Car()
-                    cars = car_model.read_all()
-                    owner_cars = [car for car in cars if car['ownerid'] == pk_value]
-                    if owner_cars:
-                        self.view.show_message("Cannot delete Owner with associated Cars.")
+                dependents = model.find_dependents(pk_value)
+                if dependents:
+                    if not self.view.confirm_cascade(table_name, dependents):
+                        self.view.show_message(f"Cannot delete {table_name} with associated {', '.join(dependents)}.")
                         continue
-                result = model.delete(pk_value)
+                    result = model.delete_cascade(pk_value)
+                else:
+                    result = model.delete(pk_value)
                 if result:
                     self.view.show_message(f"{table_name} deleted successfully.")
                 else:
@@ -149,12 +302,15 @@ class Controller:
                 model = self.models[choice]
                 table_name = self.model_names[choice]
                 num_rows = self.view.get_random_data_count()
-                start_time = time.time()
-                success = model.generate_data(num_rows)
-                end_time = time.time()
-                if success:
+                start_time = time.perf_counter()
+                inserted = model.generate_data(num_rows)
+                end_time = time.perf_counter()
+                if inserted is not None:
+                    elapsed = end_time - start_time
+                    rate = inserted / elapsed if elapsed > 0 else float(inserted)
                     self.view.show_message(
-                        f"Generated {num_rows} random records for {table_name} in {(end_time - start_time)*1000:.2f} ms."
+                        f"Generated {inserted} random records for {table_name} in {elapsed*1000:.2f} ms "
+                        f"({rate:.0f} rows/s)."
                     )
                 else:
                     self.view.show_message(f"Failed to generate random data for {table_name}.")
@@ -163,82 +319,149 @@ class Controller:
             else:
                 self.view.show_message("Invalid choice.")
                 
-    def search_data(self):
+    def generate_dataset(self):
+        counts = self.view.get_dataset_counts(list(MODELS))
+        realistic = self.view.get_realistic_choice()
+        start_time = time.perf_counter()
+        try:
+            results = generate_dataset(counts, progress=self.view.show_message, realistic=realistic)
+        except Exception as e:
+            self.view.show_message(f"Error generating dataset: {e}")
+            return
+        end_time = time.perf_counter()
+        failed = [table for table, result in results.items() if not result['success']]
+        if failed:
+            self.view.show_message(f"Failed to generate data for {', '.join(failed)}.")
+        total = sum(result['rows'] for result in results.values())
+        self.view.show_message(f"Generated {total} records in {(end_time - start_time)*1000:.2f} ms.")
+
+    def show_query_stats(self):
+        self.view.show_query_stats(get_instrumentation().stats())
+        try:
+            statements = top_statements(10)
+        except Exception as e:
+            self.view.show_message(f"pg_stat_statements is not available: {e}")
+            return
+        self.view.show_message("\nTop statements by total time (pg_stat_statements):")
+        self.view.show_records(statements)
+
+    def show_reports(self):
+        names = list(REPORTS)
         while True:
-            choice = self.view.select_search_query()
-            if choice == '1':
-                criteria = self.view.get_car_search_input()
-                car_model = Car()
-                query = "SELECT * FROM car WHERE 1=1"
-                params = []
-                if criteria['make']:
-                    query += " AND make = %s"
-                    params.append(criteria['make'])
-                if criteria['year_from']:
-                    query += " AND year >= %s"
-                    params.append(int(criteria['year_from']))
-                if criteria['year_to']:
-                    query += " AND year <= %s"
-                    params.append(int(criteria['year_to']))
-                start_time = time.time()
+            choice = self.view.select_report([REPORTS[name] for name in names])
+            if choice.isdigit() and 1 <= int(choice) <= len(names):
+                name = names[int(choice) - 1]
                 try:
-                    with car_model.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                        cursor.execute(query, params)
-                        records = cursor.fetchall()
-                        end_time = time.time()
-                        self.view.show_records(records)
-                        self.view.show_message(f"Query executed in {(end_time - start_time)*1000:.2f} ms.")
-                except Exception as e:
-                    self.view.show_message(f"Error executing search: {e}")
-
-            elif choice == '2':
-                criteria = self.view.get_mechanic_search_input()
-                mechanic_model = Mechanic()
-                query = "SELECT * FROM mechanic WHERE 1=1"
-                params = []
-                if criteria['specialty']:
-                    query += " AND specialty = %s"
-                    params.append(criteria['specialty'])
-                if criteria['name_pattern']:
-                    query += " AND name LIKE %s"
-                    params.append(criteria['name_pattern'])
-                start_time = time.time()
+                    limit = self.view.get_report_limit()
+                except ValueError:
+                    self.view.show_message("Invalid number of rows.")
+                    continue
+                start_time = time.perf_counter()
                 try:
-                    with mechanic_model.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                        cursor.execute(query, params)
-                        records = cursor.fetchall()
-                        end_time = time.time()
-                        self.view.show_records(records)
-                        self.view.show_message(f"Query executed in {(end_time - start_time)*1000:.2f} ms.")
+                    records = get_report_refresher().read(name, limit)
                 except Exception as e:
-                    self.view.show_message(f"Error executing search: {e}")
+                    self.view.show_message(f"Error reading report {name}: {e}")
+                    continue
+                end_time = time.perf_counter()
+                self.view.show_records(records)
+                self.view.show_message(f"Report loaded in {(end_time - start_time)*1000:.2f} ms.")
+            elif choice == str(len(names) + 1):
+                break
+            else:
+                self.view.show_message("Invalid choice.")
 
-            elif choice == '3':
-                criteria = self.view.get_service_record_search_input()
-                service_model = ServiceRecord()
-                query = "SELECT * FROM servicerecord WHERE 1=1"
-                params = []
-                if criteria['date_from']:
-                    query += " AND servicedate >= %s"
-                    params.append(criteria['date_from'])
-                if criteria['date_to']:
-                    query += " AND servicedate <= %s"
-                    params.append(criteria['date_to'])
-                if criteria['servicetype']:
-                    query += " AND servicetype = %s"
-                    params.append(criteria['servicetype'])
-                start_time = time.time()
-                try:
-                    with service_model.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                        cursor.execute(query, params)
-                        records = cursor.fetchall()
-                        end_time = time.time()
-                        self.view.show_records(records)
-                        self.view.show_message(f"Query executed in {(end_time - start_time)*1000:.2f} ms.")
-                except Exception as e:
-                    self.view.show_message(f"Error executing search: {e}")
+    def export_data(self):
+        while True:
+            choice = self.view.show_table_menu()
+            if choice in self.models:
+                self.export_to_file(self.models[choice])
+            elif choice == '6':
+                break
+            else:
+                self.view.show_message("Invalid choice.")
 
-            elif choice == '4':
+    def export_to_file(self, model, query=None, params=None):
+        path = self.view.get_export_path()
+        start_time = time.perf_counter()
+        try:
+            count = export(model, path, query=query, params=params)
+        except Exception as e:
+            self.view.show_message(f"Error exporting to {path}: {e}")
+            return
+        end_time = time.perf_counter()
+        self.view.show_message(f"Exported {count} records to {path} in {(end_time - start_time)*1000:.2f} ms.")
+
+    def import_data(self):
+        while True:
+            choice = self.view.show_table_menu()
+            if choice in self.models:
+                model = self.models[choice]
+                table_name = self.model_names[choice]
+                path = self.view.get_import_path()
+                start_time = time.perf_counter()
+                loaded = model.bulk_load(read_rows(path), validate=True)
+                end_time = time.perf_counter()
+                if loaded is None:
+                    self.view.show_message(f"Failed to import data into {table_name}.")
+                    continue
+                elapsed = end_time - start_time
+                rate = loaded / elapsed if elapsed > 0 else float(loaded)
+                self.view.show_message(
+                    f"Imported {loaded} records into {table_name} in {elapsed*1000:.2f} ms ({rate:.0f} rows/s)."
+                )
+            elif choice == '6':
+                break
+            else:
+                self.view.show_message("Invalid choice.")
+
+    def search_data(self):
+        while True:
+            choice = self.view.select_search_query()
+            if choice in self.searches:
+                model, get_criteria, build_query, _ = self.searches[choice]
+                criteria = get_criteria()
+                try:
+                    query, params = build_query(criteria)
+                except ValueError as e:
+                    self.view.show_message(f"Invalid search criteria: {e}")
+                    continue
+                action = self.view.get_search_action()
+                if action == 'explain':
+                    self.explain_search(model, query, params)
+                elif action == 'export':
+                    self.export_to_file(model, query, params)
+                else:
+                    self.run_search(model, query, params, criteria, self.parallel_searches.get(choice))
+            elif choice == '5':
                 break
             else:
                 self.view.show_message("Invalid choice.")
+
+    def run_search(self, model, query, params, criteria=None, parallel=None):
+        start_time = time.perf_counter()
+        try:
+            records = parallel(criteria) if parallel else model.cached_query(query, params)
+            end_time = time.perf_counter()
+            self.view.show_records(records)
+            self.view.show_message(f"Query executed in {(end_time - start_time)*1000:.2f} ms.")
+        except Exception as e:
+            self.view.show_message(f"Error executing search: {e}")
+
+    def explain_search(self, model, query, params):
+        plan = model.explain(query, params)
+        if plan is None:
+            return
+        summary = summarize_plan(plan)
+        self.view.show_plan_summary(summary)
+        try:
+            missing = recommend_indexes(summary)
+        except Exception as e:
+            self.view.show_message(f"Error checking indexes: {e}")
+            return
+        for index in missing:
+            if self.view.confirm_create_index(index):
+                try:
+                    create_index(index)
+                    self.view.show_message(f"Index {index['name']} created.")
+                except Exception as e:
+                    self.view.show_message(f"Error creating index {index['name']}: {e}")
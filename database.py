@@ -0,0 +1,277 @@
+import configparser
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from instrumentation import InstrumentedConnection
+from sqlite_backend import SQLitePool
+
+
+DEFAULT_CONFIG = {
+    # postgresql, or sqlite for the embedded stand-in (sqlite_backend.py)
+    'backend': 'postgresql',
+    'sqlite_path': ':memory:',
+    'dbname': 'electronic-car-database',
+    'user': 'postgres',
+    'password': '1234',
+    'host': 'localhost',
+    'port': 5432,
+    # Pool sizing and housekeeping (seconds)
+    'minconn': 1,
+    'maxconn': 10,
+    'timeout': 30,
+    'max_idle': 300,
+    'max_lifetime': 3600,
+    'health_check_interval': 30,
+    'connect_timeout': 10,
+    # Seconds before cached catalog metadata is reloaded
+    'schema_ttl': 300,
+    # Result cache: entry limit, seconds to live, largest result cached
+    'cache_size': 10000,
+    'cache_ttl': 60,
+    'cache_max_rows': 1000,
+    # Prepared search statements kept per connection
+    'statement_cache_size': 100,
+    # Seconds between a write and the refresh of the reports built on it
+    'report_refresh_delay': 5,
+    # Statement timing: latencies kept per operation, slow statement threshold (ms) and log file
+    'instrument_window': 1000,
+    'slow_query_ms': 200,
+    'slow_query_log': 'slow_queries.log',
+    # Seconds the background warm-up may spend at startup; 0 disables it
+    'startup_budget': 3,
+    # Change feed (changefeed.py): changes per batch, seconds between checks without
+    # a notification, and 1 to drop cached results on writes made by other processes
+    'change_batch_size': 500,
+    'change_poll_interval': 1,
+    'change_sync': 0,
+    # Connections a servicerecord date-range search may use at once (partitioning.py)
+    'search_workers': 4,
+}
+
+CONNECTION_KEYS = ('dbname', 'user', 'password', 'host', 'port')
+
+
+def load_config(path=None):
+    """
+    Build the database configuration from defaults, an optional INI file
+    ([postgresql] section, path from DB_CONFIG or ./database.ini) and
+    DB_* environment variables, in increasing order of precedence.
+    """
+    config = dict(DEFAULT_CONFIG)
+    path = path or os.environ.get('DB_CONFIG', 'database.ini')
+    if os.path.exists(path):
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if parser.has_section('postgresql'):
+            config.update(parser['postgresql'])
+    for key in config:
+        value = os.environ.get(f"DB_{key.upper()}")
+        if value:
+            config[key] = value
+    for key, default in DEFAULT_CONFIG.items():
+        if isinstance(default, int):
+            config[key] = int(config[key])
+    return config
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    pass
+
+
+class ConnectionPool:
+    backend = 'postgresql'
+
+    def __init__(self, config):
+        self.config = config
+        self.minconn = config['minconn']
+        self.maxconn = config['maxconn']
+        self.timeout = config['timeout']
+        self.max_idle = config['max_idle']
+        self.max_lifetime = config['max_lifetime']
+        self.health_check_interval = config['health_check_interval']
+        self._cond = threading.Condition()
+        self._idle = []         # (conn, returned_at), most recently returned last
+        self._created_at = {}   # id(conn) -> creation time
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self.counters = {'borrowed': 0, 'created': 0, 'recycled': 0, 'failed_checks': 0, 'timeouts': 0}
+        # Connections are opened on first use, or ahead of it by fill()
+
+    def _connect(self):
+        # Runs without the lock; the caller has already reserved the slot in _size
+        try:
+            conn = psycopg2.connect(connection_factory=InstrumentedConnection,
+                                    connect_timeout=self.config['connect_timeout'],
+                                    **{key: self.config[key] for key in CONNECTION_KEYS})
+            conn.autocommit = True
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self.counters['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn, returned_at, now):
+        if conn.closed:
+            return True
+        if now - self._created_at.get(id(conn), now) > self.max_lifetime:
+            return True
+        return now - returned_at > self.max_idle and self._size > self.minconn
+
+    def _healthy(self, conn, returned_at, now):
+        if now - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def fill(self):
+        """Open connections until the pool holds minconn of them."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    return
+                self._size += 1
+            conn = self._connect()
+            with self._cond:
+                if self._closed:
+                    self._discard(conn)
+                    return
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        """
+        Borrow a connection. When all maxconn connections are in use the
+        caller waits up to `timeout` seconds for one to be returned.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("connection pool is closed")
+                    now = time.monotonic()
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        if self._expired(conn, returned_at, now):
+                            self._discard(conn)
+                            self.counters['recycled'] += 1
+                            continue
+                        break
+                    if self._size < self.maxconn:
+                        # Reserve the slot; the connection is opened below
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(f"no connection available within {self.timeout} s")
+                    self._waiting += 1
+                    self._cond.wait(remaining)
+                    self._waiting -= 1
+            # Handshakes and health checks run outside the lock, so one slow
+            # server round-trip does not hold up other borrowers and putconn
+            if conn is None:
+                conn = self._connect()
+            elif not self._healthy(conn, returned_at, now):
+                with self._cond:
+                    self.counters['failed_checks'] += 1
+                    self.counters['recycled'] += 1
+                    self._discard(conn)
+                    self._cond.notify()
+                continue
+            with self._cond:
+                self.counters['borrowed'] += 1
+            return conn
+
+    def putconn(self, conn):
+        with self._cond:
+            if self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        self._discard(conn)
+                        self._cond.notify()
+                        return
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+            }
+            stats.update(self.counters)
+            return stats
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = load_config()
+            if config['backend'] == 'sqlite':
+                _pool = SQLitePool(config)
+            else:
+                _pool = ConnectionPool(config)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,41 @@
+import csv
+import json
+
+
+def read_rows(path):
+    """
+    Yield rows from a CSV (by extension) or JSONL file one at a time, so
+    large files are never fully loaded. Empty CSV fields become None.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield {key: (value if value != '' else None) for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def to_json(record):
+    # Dates and numerics have no JSON type; write them as strings
+    return json.dumps(dict(record), default=str)
+
+
+def write_rows(records, stream, fmt='jsonl', columns=None):
+    """Write records to an open text stream as JSONL or CSV. Returns the row count."""
+    count = 0
+    if fmt == 'csv':
+        writer = None
+        for record in records:
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=columns or list(record.keys()))
+                writer.writeheader()
+            writer.writerow(dict(record))
+            count += 1
+    else:
+        for record in records:
+            stream.write(to_json(record))
+            stream.write('\n')
+            count += 1
+    return count
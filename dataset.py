@@ -0,0 +1,127 @@
+"""
+Generate a whole dataset at once, in foreign key dependency order.
+
+Tables are grouped into levels of the FK graph (owner, mechanic -> car ->
+servicerecord -> servicemechanic). All tables of a level are generated at
+the same time in separate worker processes, each with its own pooled
+connection. Tables above split_rows rows are cut into chunks, and every
+chunk samples its leading foreign key from its own slice of the parent's
+key range, so workers do not compete for the same parent rows.
+
+On the SQLite backend the levels are generated in this process, one chunk
+at a time: SQLite has a single writer, and a :memory: database is private
+to the process that opened it.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from database import get_pool
+from model import MODELS
+
+
+def dependency_levels(tables):
+    """
+    Group tables so that every table comes after the tables it references.
+    Raises ValueError on a reference cycle.
+    """
+    remaining = {table: {parent for parent, _, _ in MODELS[table].references.values()
+                         if parent != table and parent in tables}
+                 for table in tables}
+    levels = []
+    while remaining:
+        ready = sorted(table for table, parents in remaining.items() if not parents)
+        if not ready:
+            raise ValueError(f"Foreign key cycle between {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        for table in ready:
+            del remaining[table]
+        for parents in remaining.values():
+            parents.difference_update(ready)
+    return levels
+
+
+def _key_bounds(model, column):
+    table, parent_column, _ = model.references[column]
+    with model.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT min({parent_column}), max({parent_column}) FROM {table}")
+        return cursor.fetchone()
+
+
+def plan_chunks(table, rows, workers, split_rows):
+    """Split one table's rows into (table, rows, key_ranges) tasks."""
+    chunks = min(workers, max(1, rows // split_rows))
+    if chunks == 1:
+        return [(table, rows, None)]
+    model = MODELS[table]()
+    low = high = None
+    column = next(iter(model.references), None)
+    if column:
+        low, high = _key_bounds(model, column)
+    tasks = []
+    for index in range(chunks):
+        chunk_rows = rows // chunks + (1 if index < rows % chunks else 0)
+        key_ranges = None
+        if low is not None and high - low + 1 >= chunks:
+            span = (high - low + 1) / chunks
+            key_ranges = {column: (low + int(span * index), low + int(span * (index + 1)) - 1)}
+            if index == chunks - 1:
+                key_ranges[column] = (key_ranges[column][0], high)
+        tasks.append((table, chunk_rows, key_ranges))
+    return tasks
+
+
+def _generate_chunk(table, rows, key_ranges, realistic=False):
+    # Runs in a worker process with its own connection pool (in this process on SQLite)
+    start = time.perf_counter()
+    model = MODELS[table]()
+    if realistic:
+        inserted = model.generate_realistic(rows, key_ranges=key_ranges)
+    else:
+        inserted = model.generate_data(rows, key_ranges=key_ranges)
+    return table, inserted or 0, inserted is not None, time.perf_counter() - start
+
+
+def generate_dataset(counts, workers=None, split_rows=200000, progress=print, realistic=False):
+    """
+    Generate counts[table] rows for every table, level by level, with
+    generate_data, or with generate_realistic when realistic is set.
+    Returns {table: {'rows', 'seconds', 'rows_per_s', 'success'}}, rows being
+    the rows actually inserted.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {table: rows for table, rows in counts.items() if rows > 0}
+    results = {}
+    if get_pool().backend == 'postgresql':
+        # Spawned workers start with fresh pools instead of inheriting our sockets
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        workers = 1
+        executor = ThreadPoolExecutor(max_workers=1)
+    with executor:
+        for level in dependency_levels(list(counts)):
+            start = time.perf_counter()
+            futures = [executor.submit(_generate_chunk, *task, realistic)
+                       for table in level
+                       for task in plan_chunks(table, counts[table], workers, split_rows)]
+            success = {table: True for table in level}
+            inserted = dict.fromkeys(level, 0)
+            for future in futures:
+                table, chunk_rows, chunk_success, _ = future.result()
+                success[table] = success[table] and chunk_success
+                inserted[table] += chunk_rows
+            elapsed = time.perf_counter() - start
+            for table in level:
+                # The workers wrote through other processes' caches
+                MODELS[table]().invalidate_cache()
+                results[table] = {
+                    'rows': inserted[table],
+                    'seconds': elapsed,
+                    'rows_per_s': inserted[table] / elapsed if elapsed > 0 else None,
+                    'success': success[table],
+                }
+                if progress:
+                    progress(f"{table}: {inserted[table]} rows in {elapsed:.2f} s "
+                             f"({results[table]['rows_per_s'] or 0:.0f} rows/s)")
+    return results
@@ -0,0 +1,184 @@
+"""
+Streaming export of tables and search results.
+
+CSV goes through COPY ... TO STDOUT, which psycopg2 writes to the file as
+the data arrives. JSONL and Parquet read from a named server-side cursor in
+batches. Memory use is bounded by the batch size, whatever the result size.
+Parquet output needs the optional pyarrow package; its columns get their
+types from the catalog, so NULL-only batches and numeric scales survive.
+"""
+import datetime
+import decimal
+import os
+
+import psycopg2.extensions
+from psycopg2 import sql
+
+from dataio import to_json, write_rows
+
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Catalog types (TableSchema.data_type) to pyarrow type factories;
+# numeric and timestamps are handled in arrow_type, anything else is a string
+ARROW_TYPES = {
+    'smallint': 'int16',
+    'integer': 'int32',
+    'bigint': 'int64',
+    'real': 'float32',
+    'double precision': 'float64',
+    'boolean': 'bool_',
+    'date': 'date32',
+}
+# Scale of numeric columns declared without one
+NUMERIC_SCALE = 9
+
+
+def format_for(path, default='jsonl'):
+    extension = os.path.splitext(path or '')[1].lower().lstrip('.')
+    return extension if extension in FORMATS else default
+
+
+def table_query(model):
+    return sql.SQL("SELECT * FROM {table} ORDER BY {keys}").format(
+        table=sql.Identifier(model.table_name),
+        keys=sql.SQL(', ').join(map(sql.Identifier, model.key_columns()))
+    )
+
+
+def export_csv(model, query, params, stream):
+    if model.pool.backend != 'postgresql':
+        return write_rows(model.iter_query(query, params), stream, 'csv')
+    with model.connection() as conn, conn.cursor() as cursor:
+        # COPY takes no parameters, so bind them client-side first
+        bound = cursor.mogrify(query, params).decode(psycopg2.extensions.encodings[conn.encoding])
+        cursor.copy_expert(f"COPY ({bound}) TO STDOUT WITH (FORMAT csv, HEADER)", stream)
+        return cursor.rowcount
+
+
+def export_jsonl(model, query, params, stream):
+    count = 0
+    for row in model.iter_query(query, params):
+        stream.write(to_json(row))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def arrow_type(pa, table_schema, column):
+    """The Arrow type of a table column, from its catalog type."""
+    data_type = table_schema.data_type(column)
+    if data_type == 'numeric':
+        modifier = table_schema.column_info[column]['type'].partition('(')[2].rstrip(')')
+        if not modifier:
+            return pa.decimal128(38, NUMERIC_SCALE)
+        precision, _, scale = modifier.partition(',')
+        return pa.decimal128(int(precision), int(scale or 0))
+    if data_type.startswith('timestamp'):
+        return pa.timestamp('us', tz='UTC' if 'with time zone' in data_type else None)
+    return getattr(pa, ARROW_TYPES.get(data_type, 'string'))()
+
+
+def arrow_schema(pa, model, batch):
+    """
+    Columns of the table take their catalog type. Computed ones (aggregates,
+    expressions) are inferred from the first batch, with Decimal widened to
+    the largest precision and NULL-only columns written as strings.
+    """
+    table_schema = model.schema()
+    fields = []
+    for name in (batch[0] if batch else table_schema.column_names):
+        if name in table_schema.column_info:
+            fields.append(pa.field(name, arrow_type(pa, table_schema, name)))
+            continue
+        inferred = pa.array([row[name] for row in batch]).type
+        if pa.types.is_decimal(inferred):
+            inferred = pa.decimal128(38, max(inferred.scale, 0))
+        elif pa.types.is_null(inferred):
+            inferred = pa.string()
+        fields.append(pa.field(name, inferred))
+    return pa.schema(fields)
+
+
+def _converter(pa, arrow_type):
+    # Backends hand back other Python types than Arrow takes, e.g. SQLite's
+    # floats for numeric and ISO strings for dates
+    if pa.types.is_decimal(arrow_type):
+        exponent = decimal.Decimal(1).scaleb(-arrow_type.scale)
+        return lambda value: decimal.Decimal(str(value)).quantize(exponent, decimal.ROUND_HALF_EVEN)
+    if pa.types.is_date(arrow_type):
+        return lambda value: datetime.date.fromisoformat(value) if isinstance(value, str) else value
+    if pa.types.is_timestamp(arrow_type):
+        return lambda value: datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+    if pa.types.is_string(arrow_type):
+        return lambda value: value if isinstance(value, str) else str(value)
+    return None
+
+
+def export_parquet(model, query, params, path, batch_size=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    batch_size = batch_size or model.itersize
+    writer = None
+    converters = None
+    count = 0
+    batch = []
+    try:
+        for row in model.iter_query(query, params, itersize=batch_size):
+            batch.append(dict(row))
+            if len(batch) >= batch_size:
+                writer, converters = _write_batch(pa, pq, writer, converters, model, path, batch)
+                count += len(batch)
+                batch = []
+        if batch or writer is None:
+            writer, converters = _write_batch(pa, pq, writer, converters, model, path, batch)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _write_batch(pa, pq, writer, converters, model, path, batch):
+    # The schema is fixed before the first write; every batch is built to it
+    if writer is None:
+        schema = arrow_schema(pa, model, batch)
+        writer = pq.ParquetWriter(path, schema)
+        converters = {field.name: _converter(pa, field.type) for field in schema}
+    columns = []
+    for field in writer.schema:
+        convert = converters[field.name]
+        values = [row[field.name] for row in batch]
+        if convert is not None:
+            values = [None if value is None else convert(value) for value in values]
+        columns.append(pa.array(values, type=field.type))
+    writer.write_table(pa.Table.from_arrays(columns, schema=writer.schema))
+    return writer, converters
+
+
+def export(model, path, fmt=None, query=None, params=None):
+    """
+    Export the whole table, or the rows of `query`, to path in the given
+    format (guessed from the extension when omitted). Returns the row count.
+    """
+    fmt = fmt or format_for(path)
+    if query is None:
+        query = table_query(model)
+    if fmt == 'parquet':
+        return export_parquet(model, query, params, path)
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        return export_stream(model, stream, fmt, query, params)
+
+
+def export_stream(model, stream, fmt, query=None, params=None):
+    """Like export, for an already open text stream (CSV or JSONL only)."""
+    if query is None:
+        query = table_query(model)
+    if fmt == 'csv':
+        return export_csv(model, query, params, stream)
+    if fmt == 'jsonl':
+        return export_jsonl(model, query, params, stream)
+    raise ValueError(f"Cannot stream {fmt}; write it to a file instead")
@@ -0,0 +1,222 @@
+"""
+Timing of every statement sent through the connection pool.
+
+Pooled connections are InstrumentedConnections, whose cursors time execute,
+executemany and copy_expert with perf_counter and report the duration, row
+count and outcome to the process-wide Instrumentation. Statements are
+labelled with the table and the model method that issued them (see
+instrument_class); statements issued outside a model are labelled by their
+first SQL keyword. Per label it keeps totals and a rolling window of
+latencies for percentiles and a histogram. Statements slower than
+slow_query_ms, and failed ones, are appended to the slow_query_log file.
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+import startup
+
+
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_local = threading.local()
+
+
+@contextmanager
+def operation(table, name):
+    """Label the statements run inside the block; the outermost label wins."""
+    if getattr(_local, 'label', None):
+        yield
+        return
+    _local.label = (table, name)
+    try:
+        yield
+    finally:
+        _local.label = None
+
+
+def _labelled(function):
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            # Label each step only, not the time the caller spends between rows
+            generator = function(self, *args, **kwargs)
+            try:
+                while True:
+                    with operation(self.table_name, function.__name__):
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                    yield item
+            finally:
+                with operation(self.table_name, function.__name__):
+                    generator.close()
+    else:
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with operation(self.table_name, function.__name__):
+                return function(self, *args, **kwargs)
+    wrapper.labelled = True
+    return wrapper
+
+
+def instrument_class(cls):
+    """Label the statements of every public method defined on a model class."""
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith('_') or name in ('connection', 'transaction'):
+            continue
+        if inspect.isfunction(attribute) and not getattr(attribute, 'labelled', False):
+            setattr(cls, name, _labelled(attribute))
+    return cls
+
+
+def _statement_text(cursor, statement):
+    query = getattr(cursor, 'query', None)
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    if isinstance(statement, str):
+        return statement
+    try:
+        return statement.as_string(cursor)
+    except Exception:
+        return str(statement)
+
+
+class InstrumentedCursorMixin:
+    def _timed(self, method, statement, *args):
+        start = time.perf_counter()
+        error = None
+        try:
+            return method(statement, *args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            get_instrumentation().record(self, statement, time.perf_counter() - start, error)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors, of any cursor_factory, are timed."""
+    _cursor_classes = {}
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        if not issubclass(factory, InstrumentedCursorMixin):
+            instrumented = self._cursor_classes.get(factory)
+            if instrumented is None:
+                instrumented = type(f"Instrumented{factory.__name__}", (InstrumentedCursorMixin, factory), {})
+                self._cursor_classes[factory] = instrumented
+            kwargs['cursor_factory'] = instrumented
+        return super().cursor(*args, **kwargs)
+
+
+class Instrumentation:
+    def __init__(self, window, slow_query_ms, slow_query_log):
+        self.window = window
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._operations = {}
+        self.slow_log = logging.getLogger('slow_queries')
+        if slow_query_log and not self.slow_log.handlers:
+            # Opened on the first slow statement, so runs without one leave no empty log
+            handler = logging.FileHandler(slow_query_log, encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.INFO)
+            self.slow_log.propagate = False
+
+    def record(self, cursor, statement, seconds, error=None):
+        label = getattr(_local, 'label', None)
+        if label:
+            key = f"{label[0]}.{label[1]}"
+            startup.mark('first_query', operation=key)
+        else:
+            text = statement if isinstance(statement, str) else _statement_text(cursor, statement)
+            key = (text.split(None, 1) or ['?'])[0].upper()
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else 0
+        with self._lock:
+            stats = self._operations.get(key)
+            if stats is None:
+                stats = self._operations[key] = {'calls': 0, 'errors': 0, 'rows': 0, 'seconds': 0.0,
+                                                 'samples': deque(maxlen=self.window)}
+            stats['calls'] += 1
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+            stats['samples'].append(seconds)
+            if error is not None:
+                stats['errors'] += 1
+        elapsed_ms = seconds * 1000
+        if error is not None or elapsed_ms >= self.slow_query_ms:
+            outcome = f"error {type(error).__name__}" if error is not None else f"rows={rows}"
+            self.slow_log.info(f"{elapsed_ms:.1f} ms {key} {outcome}: {_statement_text(cursor, statement)[:2000]}")
+
+    def stats(self):
+        """Per label, slowest total first: calls, errors, rows, time and recent percentiles."""
+        with self._lock:
+            operations = [(key, dict(stats, samples=sorted(stats['samples'])))
+                          for key, stats in self._operations.items()]
+        report = {}
+        for key, stats in sorted(operations, key=lambda item: item[1]['seconds'], reverse=True):
+            samples = stats['samples']
+            histogram = {f"<{bound}ms": 0 for bound in BUCKETS_MS}
+            histogram[f">={BUCKETS_MS[-1]}ms"] = 0
+            for seconds in samples:
+                bucket = next((f"<{bound}ms" for bound in BUCKETS_MS if seconds * 1000 < bound),
+                              f">={BUCKETS_MS[-1]}ms")
+                histogram[bucket] += 1
+
+            def percentile(fraction):
+                return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+            report[key] = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'rows': stats['rows'],
+                'total_ms': round(stats['seconds'] * 1000, 3),
+                'mean_ms': round(stats['seconds'] / stats['calls'] * 1000, 3),
+                'p50_ms': percentile(0.50),
+                'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99),
+                'histogram': histogram,
+            }
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation():
+    global _instrumentation
+    # Called for every statement, so skip the lock once created
+    if _instrumentation is not None:
+        return _instrumentation
+    with _instrumentation_lock:
+        if _instrumentation is None:
+            # database imports this module for InstrumentedConnection
+            from database import load_config
+            config = load_config()
+            _instrumentation = Instrumentation(config['instrument_window'], config['slow_query_ms'],
+                                               config['slow_query_log'])
+        return _instrumentation
@@ -1,5 +1,12 @@
+import sys
+
+# First, so startup timings include the remaining imports
+import startup  # noqa: F401
 from controller import Controller
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main())
     controller = Controller()
     controller.run()
@@ -1,23 +1,134 @@
+import datetime
+import io
+import random
+import time
+from contextlib import contextmanager
+
 import psycopg2
 import psycopg2.extras
 from psycopg2 import sql
 
+from cache import get_result_cache
+from database import get_pool
+from instrumentation import instrument_class
+from query import Query, get_statement_cache
+from records import ResultSet, fetch_record, fetch_records, record_class
+from reports import get_report_refresher
+from schema import get_schema_cache
+from synthetic import SyntheticData, copy_rows, copy_text
+from unit_of_work import UnitOfWork
+
+
+def _key(value):
+    # Primary keys in this schema are integer serials
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def random_expression(data_type):
+    # SQL expression producing a random value of the given column type
+    if data_type == 'integer':
+        return 'TRUNC(RANDOM() * 1000)::INTEGER'
+    elif data_type == 'character varying':
+        return "LEFT(MD5(RANDOM()::TEXT), 10)"
+    elif data_type == 'text':
+        return "LEFT(MD5(RANDOM()::TEXT), 20)"
+    elif data_type == 'date':
+        return "DATE '2024-01-01' + (RANDOM() * 365)::INT"
+    elif data_type == 'boolean':
+        return "(RANDOM() < 0.5)"
+    elif data_type in ('double precision', 'numeric'):
+        return "(RANDOM() * 1000)"
+    elif data_type.startswith('timestamp'):
+        return "TIMESTAMP '2024-01-01 00:00:00' + (RANDOM() * INTERVAL '365 days')"
+    return 'NULL'
+
+
+def random_value(data_type):
+    # Python counterpart of random_expression, for backends without those SQL functions
+    if data_type == 'integer':
+        return random.randrange(1000)
+    elif data_type == 'character varying':
+        return f"{random.getrandbits(40):010x}"
+    elif data_type == 'text':
+        return f"{random.getrandbits(80):020x}"
+    elif data_type == 'date':
+        return datetime.date(2024, 1, 1) + datetime.timedelta(days=random.randrange(366))
+    elif data_type == 'boolean':
+        return random.random() < 0.5
+    elif data_type in ('double precision', 'numeric'):
+        return round(random.random() * 1000, 2)
+    elif data_type.startswith('timestamp'):
+        return datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=random.random() * 365 * 86400)
+    return None
+
+
+def _copy_value(value):
+    # Render a value in COPY text format
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
 class Model:
     def __init__(self):
-        self.conn = psycopg2.connect(
-            dbname='electronic-car-database',
-            user='postgres',
-            password='1234',
-            host='localhost',
-            port=5432
-        )
-        self.conn.autocommit = True
+        self.cache = get_result_cache()
+        self.statements = get_statement_cache()
+
+    @property
+    def pool(self):
+        # Looked up on use, so creating a model does not touch the database
+        return get_pool()
+
+    def connection(self):
+        # Borrow a pooled connection for the duration of one operation,
+        # or join the unit of work open on this thread
+        unit = UnitOfWork.current()
+        if unit is not None:
+            return unit.operation()
+        return self.pool.connection()
+
+    @contextmanager
+    def transaction(self):
+        # Borrow a connection and run the block as a single transaction
+        unit = UnitOfWork.current()
+        if unit is not None:
+            with unit.savepoint() as conn:
+                yield conn
+            return
+        with self.connection() as conn:
+            conn.autocommit = False
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
 
 
 class BaseModel(Model):
     table_name = ''
     pk = ''
     columns = []
+    # Foreign keys checked by validation: column -> (parent table, parent column, label)
+    references = {}
+    # Upper bound on parent keys sampled per foreign key by generate_data
+    fk_sample_size = 100000
+    # Rows sent per COPY round-trip by bulk_load
+    copy_chunk_size = 10000
+    # Rows per page for read_page and per network fetch for iter_rows
+    page_size = 50
+    itersize = 2000
+    # Rows per statement for update_many and delete_many
+    batch_size = 1000
 
     def __init__(self):
         super().__init__()
@@ -27,178 +138,745 @@ class BaseModel(Model):
         cols = ', '.join(data.keys())
         query = f"INSERT INTO {self.table_name} ({cols}) VALUES ({placeholders}) RETURNING {self.pk}"
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, list(data.values()))
-                self.conn.commit()
+                conn.commit()
+                self.invalidate_cache()
                 return cursor.fetchone()[0]
         except Exception as e:
             print(f"Error inserting into {self.table_name}: {e}")
-            self.conn.rollback()
 
     def read_all(self):
         query = f"SELECT * FROM {self.table_name} LIMIT 100"
         try:
-            with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query)
-                return cursor.fetchall()
+                return fetch_records(cursor, type(self).__name__)
+        except Exception as e:
+            print(f"Error reading from {self.table_name}: {e}")
+
+    @classmethod
+    def search_query(cls, criteria):
+        """
+        Build (query, params) for a search. By default every criterion names
+        a column that must equal its value; empty values are ignored. Models
+        with range or pattern searches override this.
+        """
+        query = cls.select()
+        for column, value in criteria.items():
+            if column != cls.pk and column not in cls.columns:
+                raise ValueError(f"{cls.table_name} has no column {column}")
+            query.equals(column, None if value == '' else value)
+        return query.build()
+
+    @classmethod
+    def select(cls, columns=None):
+        """Start a Query over this table; see query.py."""
+        return Query(cls.table_name, columns)
+
+    def search(self, query):
+        # Run a Query built with select() through the cache and prepared statements
+        return self.cached_query(*query.build())
+
+    def explain(self, query, params):
+        """Run EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) for a query and return the plan."""
+        if self.pool.backend != 'postgresql':
+            print(f"Error explaining query on {self.table_name}: EXPLAIN ANALYZE needs PostgreSQL")
+            return None
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+                return cursor.fetchone()[0]
+        except Exception as e:
+            print(f"Error explaining query on {self.table_name}: {e}")
+
+    def schema(self):
+        return get_schema_cache().table(self.table_name)
+
+    @classmethod
+    def reflect(cls):
+        """
+        Replace the hardcoded columns, pk and references of every model with
+        what the database catalog reports.
+        """
+        cache = get_schema_cache()
+        labels = {model.table_name: model.__name__ for model in cls.__subclasses__()}
+        for model in cls.__subclasses__():
+            table = cache.table(model.table_name)
+            model.columns = table.writable_columns()
+            model.pk = table.pk[0] if len(table.pk) == 1 else ''
+            model.references = {
+                column: (foreign_table, foreign_column, labels.get(foreign_table, foreign_table))
+                for column, (foreign_table, foreign_column) in table.foreign_keys.items()
+            }
+
+    def key_columns(self):
+        # Columns that order and identify rows for keyset pagination
+        return [self.pk]
+
+    def read_page(self, after=None, page_size=None):
+        """
+        Read one page ordered by the primary key, starting after the key
+        tuple `after` (None for the first page). Keyset pagination keeps
+        every page an index range scan, however deep into the table.
+        Returns (records, next_key); next_key is None on the last page,
+        records is None when the read failed.
+        """
+        page_size = page_size or self.page_size
+        keys = sql.SQL(', ').join(map(sql.Identifier, self.key_columns()))
+        where = sql.SQL('')
+        params = []
+        if after is not None:
+            where = sql.SQL("WHERE ({keys}) > ({values})").format(
+                keys=keys,
+                values=sql.SQL(', ').join(sql.Placeholder() * len(after))
+            )
+            params.extend(after)
+        query = sql.SQL("SELECT * FROM {table} {where} ORDER BY {keys} LIMIT %s").format(
+            table=sql.Identifier(self.table_name),
+            where=where,
+            keys=keys
+        )
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, params + [page_size])
+                records = fetch_records(cursor, type(self).__name__)
         except Exception as e:
             print(f"Error reading from {self.table_name}: {e}")
+            return None, None
+        if len(records) < page_size:
+            return records, None
+        return records, tuple(records[-1][key] for key in self.key_columns())
+
+    def iter_rows(self, itersize=None):
+        """
+        Yield every row in key order through a named server-side cursor,
+        fetching itersize rows per round-trip so memory stays flat.
+        """
+        query = sql.SQL("SELECT * FROM {table} ORDER BY {keys}").format(
+            table=sql.Identifier(self.table_name),
+            keys=sql.SQL(', ').join(map(sql.Identifier, self.key_columns()))
+        )
+        return self.iter_query(query, itersize=itersize)
+
+    def iter_query(self, query, params=None, itersize=None):
+        """Stream the rows of any read-only query through a named server-side cursor."""
+        with self.connection() as conn:
+            # Server-side cursors only live inside a transaction
+            conn.autocommit = False
+            try:
+                with conn.cursor(name=f"{self.table_name}_stream") as cursor:
+                    cursor.itersize = itersize or self.itersize
+                    cursor.execute(query, params)
+                    make = None
+                    for row in cursor:
+                        if make is None:
+                            # A named cursor has no description until the first fetch
+                            make = record_class(type(self).__name__, [column[0] for column in cursor.description])._make
+                        yield make(row)
+            finally:
+                conn.rollback()
+                conn.autocommit = True
 
     def update(self, pk_value, data):
         set_clause = ', '.join([f"{col}=%s" for col in data.keys()])
         query = f"UPDATE {self.table_name} SET {set_clause} WHERE {self.pk}=%s"
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, list(data.values()) + [pk_value])
-                self.conn.commit()
+                conn.commit()
+                self.invalidate_cache()
                 return cursor.rowcount
         except Exception as e:
             print(f"Error updating {self.table_name}: {e}")
-            self.conn.rollback()
 
     def delete(self, pk_value):
         query = f"DELETE FROM {self.table_name} WHERE {self.pk}=%s"
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, (pk_value,))
-                self.conn.commit()
+                conn.commit()
+                self.invalidate_cache()
                 return cursor.rowcount
         except Exception as e:
             print(f"Error deleting from {self.table_name}: {e}")
-            self.conn.rollback()
+
+    def update_many(self, rows=None, data=None, where=None, params=None):
+        """
+        Update many rows in one transaction, either
+          rows: (key, data) pairs, applied with UPDATE ... FROM (VALUES ...)
+                (key is a (serviceid, mechanicid) tuple for servicemechanic), or
+          data + where: the same values for every row matching the SQL
+                predicate `where` (with %s placeholders filled from params).
+        Returns {'affected': rows, 'seconds': elapsed}, or None on error.
+        """
+        start = time.perf_counter()
+        try:
+            with self.transaction() as conn, conn.cursor() as cursor:
+                if rows is not None:
+                    affected = self._update_rows(cursor, rows)
+                elif data and where:
+                    query = sql.SQL("UPDATE {table} SET {assignments} WHERE ").format(
+                        table=sql.Identifier(self.table_name),
+                        assignments=sql.SQL(', ').join(
+                            sql.SQL("{} = %s").format(sql.Identifier(column)) for column in data
+                        )
+                    ) + sql.SQL(where)
+                    cursor.execute(query, list(data.values()) + list(params or []))
+                    affected = cursor.rowcount
+                else:
+                    raise ValueError("update_many needs rows, or data together with where")
+        except Exception as e:
+            print(f"Error updating {self.table_name}: {e}")
+            return None
+        self.invalidate_cache()
+        return {'affected': affected, 'seconds': time.perf_counter() - start}
+
+    def _update_rows(self, cursor, rows):
+        keys = self.key_columns()
+        table = self.schema()
+        # One statement shape per distinct set of updated columns
+        groups = {}
+        for key, data in rows:
+            key = tuple(key) if isinstance(key, (tuple, list)) else (key,)
+            groups.setdefault(tuple(data), []).append(key + tuple(data.values()))
+        affected = 0
+        if self.pool.backend != 'postgresql':
+            return self._update_rows_each(cursor, keys, groups)
+        for columns, values in groups.items():
+            names = keys + list(columns)
+            query = sql.SQL(
+                "UPDATE {table} AS t SET {assignments} FROM (VALUES %s) AS v ({names}) WHERE {match}"
+            ).format(
+                table=sql.Identifier(self.table_name),
+                assignments=sql.SQL(', ').join(
+                    sql.SQL("{column} = v.{column}").format(column=sql.Identifier(column)) for column in columns
+                ),
+                names=sql.SQL(', ').join(map(sql.Identifier, names)),
+                match=sql.SQL(' AND ').join(
+                    sql.SQL("t.{key} = v.{key}").format(key=sql.Identifier(key)) for key in keys
+                )
+            )
+            # VALUES has no column types of its own, so cast every value to its column's type
+            template = sql.SQL("({})").format(sql.SQL(', ').join(
+                sql.SQL("%s::" + table.column_info[name]['type']) for name in names
+            )).as_string(cursor)
+            for start in range(0, len(values), self.batch_size):
+                page = values[start:start + self.batch_size]
+                psycopg2.extras.execute_values(cursor, query, page, template=template, page_size=len(page))
+                affected += cursor.rowcount
+        return affected
+
+    def _update_rows_each(self, cursor, keys, groups):
+        # One UPDATE per row, for backends without UPDATE ... FROM (VALUES ...) casts
+        affected = 0
+        for columns, values in groups.items():
+            query = (f"UPDATE {self.table_name} SET {', '.join(f'{column} = %s' for column in columns)} "
+                     f"WHERE {' AND '.join(f'{key} = %s' for key in keys)}")
+            cursor.executemany(query, [row[len(keys):] + row[:len(keys)] for row in values])
+            affected += cursor.rowcount
+        return affected
+
+    def delete_many(self, keys=None, where=None, params=None):
+        """
+        Delete many rows in one transaction, either by a list of keys
+        (tuples for servicemechanic) or by the SQL predicate `where`.
+        Returns {'affected': rows, 'seconds': elapsed}, or None on error.
+        """
+        start = time.perf_counter()
+        try:
+            with self.transaction() as conn, conn.cursor() as cursor:
+                if keys is not None:
+                    affected = self._delete_keys(cursor, keys)
+                elif where:
+                    cursor.execute(sql.SQL("DELETE FROM {table} WHERE ").format(
+                        table=sql.Identifier(self.table_name)
+                    ) + sql.SQL(where), list(params or []))
+                    affected = cursor.rowcount
+                else:
+                    raise ValueError("delete_many needs keys or where")
+        except Exception as e:
+            print(f"Error deleting from {self.table_name}: {e}")
+            return None
+        self.invalidate_cache()
+        return {'affected': affected, 'seconds': time.perf_counter() - start}
+
+    def _delete_keys(self, cursor, keys):
+        key_columns = self.key_columns()
+        keys = [tuple(key) if isinstance(key, (tuple, list)) else (key,) for key in keys]
+        if self.pool.backend != 'postgresql':
+            cursor.executemany(f"DELETE FROM {self.table_name} WHERE "
+                               f"{' AND '.join(f'{key} = %s' for key in key_columns)}", keys)
+            return cursor.rowcount
+        table = self.schema()
+        query = sql.SQL("DELETE FROM {table} AS t USING unnest({arrays}) AS v ({names}) WHERE {match}").format(
+            table=sql.Identifier(self.table_name),
+            arrays=sql.SQL(', ').join(
+                sql.SQL("%s::" + table.column_info[column]['type'] + "[]") for column in key_columns
+            ),
+            names=sql.SQL(', ').join(map(sql.Identifier, key_columns)),
+            match=sql.SQL(' AND ').join(
+                sql.SQL("t.{key} = v.{key}").format(key=sql.Identifier(key)) for key in key_columns
+            )
+        )
+        affected = 0
+        for start in range(0, len(keys), self.batch_size):
+            page = keys[start:start + self.batch_size]
+            # One array parameter per key column
+            cursor.execute(query, [list(column) for column in zip(*page)])
+            affected += cursor.rowcount
+        return affected
+
+    def dependents(self):
+        # (child model class, child column) for every foreign key referencing this table
+        return [(child, column)
+                for child in BaseModel.__subclasses__()
+                for column, (table, _, _) in child.references.items()
+                if table == self.table_name]
+
+    def find_dependents(self, pk_value):
+        """
+        Return the names of child models that still reference the row,
+        checked with one indexed EXISTS probe per foreign key.
+        """
+        dependents = self.dependents()
+        if not dependents:
+            return []
+        query = sql.SQL("SELECT {checks}").format(
+            checks=sql.SQL(', ').join(
+                sql.SQL("EXISTS (SELECT 1 FROM {table} WHERE {column} = %s)").format(
+                    table=sql.Identifier(child.table_name),
+                    column=sql.Identifier(column)
+                )
+                for child, column in dependents
+            )
+        )
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, [pk_value] * len(dependents))
+                found = cursor.fetchone()
+        except Exception as e:
+            print(f"Error checking dependents of {self.table_name}: {e}")
+            return []
+        return [child.__name__ for (child, _), exists in zip(dependents, found) if exists]
+
+    def delete_cascade(self, pk_value):
+        """
+        Delete a row together with everything that depends on it, children
+        first, in a single transaction. Returns the total rows deleted.
+        """
+        try:
+            with self.transaction() as conn, conn.cursor() as cursor:
+                deleted = self._delete_where(cursor, self.pk, [pk_value])
+        except Exception as e:
+            print(f"Error deleting from {self.table_name}: {e}")
+            return None
+        for model in self.cascade_models():
+            model.invalidate_cache()
+        return deleted
+
+    def cascade_models(self):
+        # This model and every model that transitively depends on it
+        models = [self]
+        for child, _ in self.dependents():
+            models.extend(child().cascade_models())
+        return models
+
+    def _delete_where(self, cursor, column, values):
+        deleted = 0
+        dependents = self.dependents()
+        if dependents:
+            keys = values
+            if column != self.pk:
+                cursor.execute(sql.SQL("SELECT {pk} FROM {table} WHERE {column} = ANY(%s)").format(
+                    pk=sql.Identifier(self.pk),
+                    table=sql.Identifier(self.table_name),
+                    column=sql.Identifier(column)
+                ), (values,))
+                keys = [row[0] for row in cursor.fetchall()]
+            if keys:
+                for child, child_column in dependents:
+                    deleted += child()._delete_where(cursor, child_column, keys)
+        cursor.execute(sql.SQL("DELETE FROM {table} WHERE {column} = ANY(%s)").format(
+            table=sql.Identifier(self.table_name),
+            column=sql.Identifier(column)
+        ), (values,))
+        return deleted + cursor.rowcount
 
     def read_by_pk(self, pk_value):
+        found, record = self.cache.get(self.table_name, ('pk', pk_value))
+        if found:
+            return record
         query = f"SELECT * FROM {self.table_name} WHERE {self.pk}=%s"
         try:
-            with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, (pk_value,))
-                return cursor.fetchone()
+                record = fetch_record(cursor, type(self).__name__)
         except Exception as e:
             print(f"Error reading from {self.table_name}: {e}")
+            return None
+        self.cache.put(self.table_name, ('pk', pk_value), record)
+        return record
+
+    def cached_query(self, query, params):
+        """
+        Run a read-only query against this table, serving repeated identical
+        queries from the result cache until the table is written to.
+        """
+        key = ('query', query, tuple(tuple(param) if isinstance(param, list) else param for param in params))
+        found, records = self.cache.get(self.table_name, key)
+        if found:
+            return records
+        with self.connection() as conn, conn.cursor() as cursor:
+            if self.pool.backend == 'postgresql':
+                # Repeated query shapes skip parse and planning on the server
+                self.statements.execute(cursor, query, params)
+            else:
+                cursor.execute(query, params)
+            records = ResultSet.from_cursor(cursor, type(self).__name__)
+        self.cache.put(self.table_name, key, records)
+        return records
+
+    def invalidate_cache(self):
+        # Called after every write to the table
+        unit = UnitOfWork.current()
+        if unit is not None:
+            # Uncommitted; invalidated again when the unit of work ends
+            unit.written(self)
+        self.cache.invalidate(self.table_name)
+        get_report_refresher().table_changed(self.table_name)
+
+    def bulk_load(self, rows, chunk_size=None, validate=False):
+        """
+        Stream an iterable of dicts into the table with COPY FROM STDIN.
+        Rows are buffered chunk_size at a time, so memory use does not grow
+        with the input. Missing keys are loaded as NULL. With validate=True
+        each chunk goes through validate_batch and invalid rows are skipped.
+        Returns the number of rows loaded, or None on error; chunks copied
+        before an error stay loaded.
+        """
+        chunk_size = chunk_size or self.copy_chunk_size
+        query = sql.SQL("COPY {table} ({fields}) FROM STDIN").format(
+            table=sql.Identifier(self.table_name),
+            fields=sql.SQL(', ').join(map(sql.Identifier, self.columns))
+        )
+        loaded = 0
+        offset = 0
+        chunk = []
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        loaded += self._copy_chunk(cursor, query, chunk, offset, validate)
+                        offset += len(chunk)
+                        chunk = []
+                if chunk:
+                    loaded += self._copy_chunk(cursor, query, chunk, offset, validate)
+                conn.commit()
+        except Exception as e:
+            print(f"Error bulk loading into {self.table_name}: {e}")
+            # Chunks copied before the failure are already committed
+            if loaded:
+                self.invalidate_cache()
+            return None
+        if loaded:
+            self.invalidate_cache()
+        return loaded
+
+    def _copy_chunk(self, cursor, query, chunk, offset, validate):
+        errors = self.validate_batch(chunk) if validate else [[]] * len(chunk)
+        valid = []
+        for position, (row, row_errors) in enumerate(zip(chunk, errors), start=offset + 1):
+            if row_errors:
+                print(f"Skipping row {position}: {' '.join(row_errors)}")
+                continue
+            valid.append(row)
+        if not valid:
+            return 0
+        if self.pool.backend != 'postgresql':
+            # No COPY; an embedded database has no round-trips to save anyway
+            cursor.executemany(
+                f"INSERT INTO {self.table_name} ({', '.join(self.columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(self.columns))})",
+                [[row.get(column) for column in self.columns] for row in valid]
+            )
+            return len(valid)
+        buffer = io.StringIO()
+        for row in valid:
+            buffer.write('\t'.join(_copy_value(row.get(column)) for column in self.columns))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(query, buffer)
+        return len(valid)
+
+    def existing_keys(self, table, column, values):
+        """Return the subset of values present in table.column, in one query."""
+        if not values:
+            return set()
+        query = sql.SQL("SELECT {column} FROM {table} WHERE {column} = ANY(%s)").format(
+            column=sql.Identifier(column),
+            table=sql.Identifier(table)
+        )
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, (list(values),))
+            return {row[0] for row in cursor.fetchall()}
+
+    @classmethod
+    def check_fields(cls, data):
+        # Per-record checks that need no database access; override in child classes
+        return []
+
+    def validate_batch(self, records):
+        """
+        Validate many records at once. All referenced keys are resolved with
+        one = ANY(%s) query per parent table rather than one lookup per record.
+        NULL values are checked against the cached column nullability.
+        Returns one list of error messages per record (empty when valid).
+        """
+        records = list(records)
+        errors = [self.check_fields(record) for record in records]
+        try:
+            table = self.schema()
+        except Exception as e:
+            print(f"Error loading schema for {self.table_name}: {e}")
+            table = None
+        if table is not None:
+            for record, record_errors in zip(records, errors):
+                for column, value in record.items():
+                    if value is None and column in table.column_info and not table.nullable(column):
+                        record_errors.append(f"{column} cannot be empty.")
+        for column, (table, fk_column, label) in self.references.items():
+            values = {_key(record[column]) for record in records if record.get(column) is not None}
+            values.discard(None)
+            try:
+                existing = self.existing_keys(table, fk_column, values)
+            except Exception as e:
+                print(f"Error validating {column} against {table}: {e}")
+                existing = set()
+            for record, record_errors in zip(records, errors):
+                value = record.get(column)
+                if value is not None and _key(value) not in existing:
+                    record_errors.append(f"{label} with ID {value} does not exist.")
+        return errors
 
     def validate_data(self, data):
-        # Implement in child classes
-        return True, None
+        errors = self.validate_batch([data])[0]
+        return len(errors) == 0, errors
     
-    def generate_data(self, num_rows):
+    def generate_data(self, num_rows, key_ranges=None):
         """
         Generate random data for the table using SQL functions,
         handling various data types and foreign keys.
+        All rows are produced by a single set-based INSERT ... SELECT.
+        key_ranges ({column: (low, high)}) restricts the parent keys a
+        foreign key column may take, so parallel workers can be given
+        disjoint slices of the parent table. Returns the number of rows
+        inserted, fewer than num_rows when some collided with a unique key,
+        or None on error.
         """
+        key_ranges = key_ranges or {}
         try:
-            cursor = self.conn.cursor()
-
             # Get the list of columns excluding the primary key
             columns = self.columns.copy()
             if self.pk in columns:
                 columns.remove(self.pk)
 
-            # Retrieve data types for each column
-            data_types = []
-            for column in columns:
-                cursor.execute("""
-                    SELECT data_type 
-                    FROM information_schema.columns 
-                    WHERE table_name=%s AND column_name=%s
-                """, [self.table_name, column])
-                data_type = cursor.fetchone()[0]
-                data_types.append(data_type)
-
-            # Identify foreign key relationships
-            foreign_keys = {}
-            for column in columns:
-                cursor.execute("""
-                    SELECT 
-                        tc.constraint_name, 
-                        kcu.column_name AS fk_column, 
-                        ccu.table_name AS foreign_table, 
-                        ccu.column_name AS foreign_column
-                    FROM 
-                        information_schema.table_constraints AS tc 
-                        JOIN information_schema.key_column_usage AS kcu
-                            ON tc.constraint_name = kcu.constraint_name
-                        JOIN information_schema.constraint_column_usage AS ccu
-                            ON ccu.constraint_name = tc.constraint_name
-                    WHERE 
-                        tc.constraint_type = 'FOREIGN KEY' 
-                        AND tc.table_name = %s 
-                        AND kcu.column_name = %s
-                """, [self.table_name, column])
-                fk_info = cursor.fetchone()
-                if fk_info:
-                    foreign_keys[column] = {
-                        'foreign_table': fk_info[2],
-                        'foreign_column': fk_info[3]
-                    }
-
-            # Generate and execute INSERT statements for the specified number of rows
-            for _ in range(num_rows):
-                # Build value expressions for each column
-                value_expressions = []
-                for column, data_type in zip(columns, data_types):
-                    if column in foreign_keys:
-                        # For foreign keys, select a random existing value from the foreign table
-                        fk_table = foreign_keys[column]['foreign_table']
-                        fk_column = foreign_keys[column]['foreign_column']
-                        value_expr = sql.SQL("(SELECT {fk_column} FROM {fk_table} ORDER BY RANDOM() LIMIT 1)").format(
-                            fk_column=sql.Identifier(fk_column),
-                            fk_table=sql.Identifier(fk_table)
+            # Column types and foreign keys come from the cached catalog metadata
+            table = self.schema()
+            data_types = [table.data_type(column) for column in columns]
+            foreign_keys = {
+                column: {'foreign_table': foreign_table, 'foreign_column': foreign_column}
+                for column, (foreign_table, foreign_column) in table.foreign_keys.items()
+                if column in columns
+            }
+            # References the database cannot declare, e.g. servicemechanic.serviceid
+            # once servicerecord is partitioned (partitioning.py)
+            for column, (foreign_table, foreign_column, _) in self.references.items():
+                if column in columns and column not in foreign_keys:
+                    foreign_keys[column] = {'foreign_table': foreign_table, 'foreign_column': foreign_column}
+            if self.pool.backend != 'postgresql':
+                return self._generate_rows(num_rows, columns, data_types, foreign_keys, key_ranges)
+
+            # Build every row in one INSERT ... SELECT over generate_series. Foreign keys
+            # are picked from a sample of parent keys gathered once per statement.
+            params = {'num_rows': num_rows, 'sample_size': self.fk_sample_size}
+            sample_ctes = []
+            sample_names = []
+            value_expressions = []
+            for column, data_type in zip(columns, data_types):
+                if column in foreign_keys:
+                    sample_name = sql.Identifier(f"{column}_sample")
+                    fk_column = sql.Identifier(foreign_keys[column]['foreign_column'])
+                    key_filter = sql.SQL('')
+                    if column in key_ranges:
+                        key_filter = sql.SQL("WHERE {fk_column} BETWEEN {low} AND {high} ").format(
+                            fk_column=fk_column,
+                            low=sql.Placeholder(f"{column}_low"),
+                            high=sql.Placeholder(f"{column}_high")
                         )
-                    else:
-                        # Generate random data based on data type using SQL functions
-                        if data_type == 'integer':
-                            value_expr = sql.SQL('TRUNC(RANDOM() * 1000)::INTEGER')
-                        elif data_type == 'character varying':
-                            value_expr = sql.SQL("LEFT(MD5(RANDOM()::TEXT), 10)")
-                        elif data_type == 'text':
-                            value_expr = sql.SQL("LEFT(MD5(RANDOM()::TEXT), 20)")
-                        elif data_type == 'date':
-                            value_expr = sql.SQL("DATE '2024-01-01' + (RANDOM() * 365)::INT")
-                        elif data_type == 'boolean':
-                            value_expr = sql.SQL("(RANDOM() < 0.5)")
-                        elif data_type in ('double precision', 'numeric'):
-                            value_expr = sql.SQL("(RANDOM() * 1000)")
-                        elif data_type.startswith('timestamp'):
-                            value_expr = sql.SQL("TIMESTAMP '2024-01-01 00:00:00' + (RANDOM() * INTERVAL '365 days')")
-                        else:
-                            value_expr = sql.SQL('NULL')
-                    value_expressions.append(value_expr)
-
-                # Build the INSERT query using psycopg2.sql to safely include identifiers
-                insert_query = sql.SQL("INSERT INTO {table} ({fields}) VALUES ({values})").format(
-                    table=sql.Identifier(self.table_name),
-                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-                    values=sql.SQL(', ').join(value_expressions)
-                )
-                # Execute the INSERT query
-                cursor.execute(insert_query)
-
-            # Commit the transaction
-            self.conn.commit()
-            return True
+                        params[f"{column}_low"], params[f"{column}_high"] = key_ranges[column]
+                    sample_ctes.append(sql.SQL(
+                        "{sample} AS (SELECT ARRAY(SELECT {fk_column} FROM {fk_table} {key_filter}"
+                        "ORDER BY RANDOM() LIMIT %(sample_size)s) AS keys)"
+                    ).format(
+                        sample=sample_name,
+                        fk_column=fk_column,
+                        fk_table=sql.Identifier(foreign_keys[column]['foreign_table']),
+                        key_filter=key_filter
+                    ))
+                    sample_names.append(sample_name)
+                    value_expr = sql.SQL("{sample}.keys[1 + FLOOR(RANDOM() * CARDINALITY({sample}.keys))::INT]").format(
+                        sample=sample_name
+                    )
+                else:
+                    value_expr = sql.SQL(random_expression(data_type))
+                value_expressions.append(value_expr)
+
+            insert_query = sql.SQL(
+                "{with_clause}INSERT INTO {table} ({fields}) "
+                "SELECT {values} FROM generate_series(1, %(num_rows)s) AS g{samples} "
+                # Random values can collide with unique keys (vin, servicemechanic's pk)
+                "ON CONFLICT DO NOTHING"
+            ).format(
+                with_clause=sql.SQL("WITH {} ").format(sql.SQL(', ').join(sample_ctes)) if sample_ctes else sql.SQL(''),
+                table=sql.Identifier(self.table_name),
+                fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                values=sql.SQL(', ').join(value_expressions),
+                samples=sql.SQL('').join(sql.SQL(', {}').format(name) for name in sample_names)
+            )
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(insert_query, params)
+                inserted = cursor.rowcount
+
+                # Commit the transaction
+                conn.commit()
+                self.invalidate_cache()
+                return inserted
+        except Exception as e:
+            print(f"Error generating data for {self.table_name}: {e}")
+            return None
+
+
+    def _generate_rows(self, num_rows, columns, data_types, foreign_keys, key_ranges):
+        # generate_data for backends without generate_series, arrays and MD5:
+        # rows are made in Python and inserted chunk by chunk
+        with self.connection() as conn, conn.cursor() as cursor:
+            samples = {}
+            for column, foreign_key in foreign_keys.items():
+                query = f"SELECT {foreign_key['foreign_column']} FROM {foreign_key['foreign_table']}"
+                params = []
+                if column in key_ranges:
+                    query += f" WHERE {foreign_key['foreign_column']} BETWEEN %s AND %s"
+                    params.extend(key_ranges[column])
+                cursor.execute(query + " ORDER BY RANDOM() LIMIT %s", params + [self.fk_sample_size])
+                samples[column] = [row[0] for row in cursor.fetchall()] or [None]
+            query = (f"INSERT INTO {self.table_name} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(['%s'] * len(columns))}) ON CONFLICT DO NOTHING")
+            inserted = 0
+            for start in range(0, num_rows, self.copy_chunk_size):
+                cursor.executemany(query, [
+                    [random.choice(samples[column]) if column in samples else random_value(data_type)
+                     for column, data_type in zip(columns, data_types)]
+                    for _ in range(min(self.copy_chunk_size, num_rows - start))
+                ])
+                inserted += cursor.rowcount
+            conn.commit()
+        self.invalidate_cache()
+        return inserted
+
+    def generate_realistic(self, num_rows, key_ranges=None, generator=None, batch_rows=100000):
+        """
+        Generate num_rows rows with realistic values (see synthetic.py) and
+        stream them into the table with COPY, batch_rows rows per batch.
+        Foreign keys fan out over the parent rows, restricted to key_ranges
+        as in generate_data. Needs NumPy. Returns the number of rows loaded,
+        or None on error; batches copied before an error stay loaded.
+        """
+        key_ranges = key_ranges or {}
+        loaded = 0
+        try:
+            generator = generator or SyntheticData()
+            with self.connection() as conn, conn.cursor() as cursor:
+                parents = {column: self.synthetic_parents(cursor, column, key_ranges.get(column))
+                           for column in self.references}
+                batches = generator.batches(self.table_name, num_rows, parents, batch_rows=batch_rows,
+                                            reserve=lambda count: self.reserve_keys(cursor, count))
+                for batch in batches:
+                    loaded += self._copy_batch(cursor, batch)
+                conn.commit()
         except Exception as e:
             print(f"Error generating data for {self.table_name}: {e}")
-            self.conn.rollback()
-            return False
+            loaded = None
+        if loaded:
+            self.invalidate_cache()
+        return loaded
+
+    def synthetic_parents(self, cursor, column, key_range=None):
+        # Keys that generated rows may reference through a foreign key column
+        table, parent_column, _ = self.references[column]
+        query = f"SELECT {parent_column} FROM {table}"
+        params = []
+        if key_range:
+            query += f" WHERE {parent_column} BETWEEN %s AND %s"
+            params.extend(key_range)
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
+
+    def reserve_keys(self, cursor, count):
+        """Take count primary key values for rows that are inserted with their keys."""
+        if self.pool.backend == 'postgresql':
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                           (self.table_name, self.pk, count))
+            return [row[0] for row in cursor.fetchall()]
+        # SQLite continues after the largest key; the pool lets one caller at a time in
+        cursor.execute(f"SELECT coalesce(max({self.pk}), 0) FROM {self.table_name}")
+        start = cursor.fetchone()[0] + 1
+        return list(range(start, start + count))
+
+    def _copy_batch(self, cursor, batch):
+        # Load one {column: array} batch from the synthetic data generator
+        columns = list(batch)
+        if self.pool.backend != 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {self.table_name} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                copy_rows(batch)
+            )
+        else:
+            query = sql.SQL("COPY {table} ({fields}) FROM STDIN").format(
+                table=sql.Identifier(self.table_name),
+                fields=sql.SQL(', ').join(map(sql.Identifier, columns))
+            )
+            cursor.copy_expert(query, io.StringIO(copy_text(batch)))
+        return len(batch[columns[0]])
 
 
 class Car(BaseModel):
     table_name = 'car'
     pk = 'carid'
     columns = ['make', 'model', 'year', 'vin', 'ownerid']
+    references = {'ownerid': ('owner', 'ownerid', 'Owner')}
 
-    def validate_data(self, data):
+    @classmethod
+    def check_fields(cls, data):
         errors = []
         if 'year' in data:
-            if not isinstance(data['year'], int):
+            # CSV imports read every field as text
+            year = data['year']
+            if isinstance(year, str):
+                year = _key(year.strip())
+            if not isinstance(year, int) or isinstance(year, bool):
                 errors.append('Year must be an integer.')
-        if 'ownerid' in data:
-            if data['ownerid'] is not None:
-                owner = Owner()
-                owner_data = owner.read_by_pk(data['ownerid'])
-                if not owner_data:
-                    errors.append(f"Owner with ID {data['ownerid']} does not exist.")
-        return len(errors) == 0, errors
+        return errors
+
+    @classmethod
+    def search_query(cls, criteria):
+        year_from = int(criteria['year_from']) if criteria['year_from'] else None
+        year_to = int(criteria['year_to']) if criteria['year_to'] else None
+        return (cls.select()
+                .equals('make', criteria['make'] or None)
+                .between('year', year_from, year_to)
+                .build())
 
 
 class Owner(BaseModel):
@@ -220,59 +898,93 @@ class Mechanic(BaseModel):
         # Add validation if needed
         return True, None
 
+    @classmethod
+    def search_query(cls, criteria):
+        return (cls.select()
+                .equals('specialty', criteria['specialty'] or None)
+                .like('name', criteria['name_pattern'] or None)
+                .build())
+
 
 class ServiceRecord(BaseModel):
     table_name = 'servicerecord'
     pk = 'serviceid'
     columns = ['carid', 'servicedate', 'servicetype', 'servicecost']
-
-    def validate_data(self, data):
-        errors = []
-        if 'carid' in data:
-            car = Car()
-            car_data = car.read_by_pk(data['carid'])
-            if not car_data:
-                errors.append(f"Car with ID {data['carid']} does not exist.")
-        return len(errors) == 0, errors
+    references = {'carid': ('car', 'carid', 'Car')}
+
+    @classmethod
+    def search_query(cls, criteria):
+        return (cls.select()
+                .between('servicedate', criteria['date_from'] or None, criteria['date_to'] or None)
+                .equals('servicetype', criteria['servicetype'] or None)
+                .build())
+
+    @classmethod
+    def cost_totals_query(cls, criteria):
+        # Service count and total cost per car, most expensive first
+        limit = int(criteria['limit']) if criteria['limit'] else None
+        return (cls.select(['carid', 'count(*) AS services', 'sum(servicecost) AS total_cost'])
+                .between('servicedate', criteria['date_from'] or None, criteria['date_to'] or None)
+                .group_by('carid')
+                .order_by('total_cost', descending=True)
+                .limit(limit)
+                .build())
 
 
 class ServiceMechanic(BaseModel):
     table_name = 'servicemechanic'
     pk = ''
     columns = ['serviceid', 'mechanicid', 'hoursworked']
+    references = {
+        'serviceid': ('servicerecord', 'serviceid', 'ServiceRecord'),
+        'mechanicid': ('mechanic', 'mechanicid', 'Mechanic'),
+    }
+
+    def key_columns(self):
+        return ['serviceid', 'mechanicid']
 
     def create(self, data):
         placeholders = ', '.join(['%s'] * len(data))
-        cols = ', '.join(self.columns)
+        cols = ', '.join(data.keys())
         query = f"INSERT INTO {self.table_name} ({cols}) VALUES ({placeholders})"
         try:
-            with self.conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, list(data.values()))
-                self.conn.commit()
+                conn.commit()
+                self.invalidate_cache()
                 return cursor.rowcount
         except Exception as e:
             print(f"Error inserting into {self.table_name}: {e}")
-            self.conn.rollback()
+
+    def synthetic_parents(self, cursor, column, key_range=None):
+        if column != 'serviceid':
+            return super().synthetic_parents(cursor, column, key_range)
+        # Only services without mechanics, so new pairs cannot collide with the primary key
+        query = ("SELECT s.serviceid FROM servicerecord s WHERE NOT EXISTS "
+                 "(SELECT 1 FROM servicemechanic sm WHERE sm.serviceid = s.serviceid)")
+        params = []
+        if key_range:
+            query += " AND s.serviceid BETWEEN %s AND %s"
+            params.extend(key_range)
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
 
     def read_all(self):
         query = f"SELECT * FROM {self.table_name}"
         try:
-            with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query)
-                return cursor.fetchall()
+                return fetch_records(cursor, type(self).__name__)
         except Exception as e:
             print(f"Error reading from {self.table_name}: {e}")
 
-    def validate_data(self, data):
-        errors = []
-        if 'serviceid' in data:
-            service = ServiceRecord()
-            service_data = service.read_by_pk(data['serviceid'])
-            if not service_data:
-                errors.append(f"ServiceRecord with ID {data['serviceid']} does not exist.")
-        if 'mechanicid' in data:
-            mechanic = Mechanic()
-            mechanic_data = mechanic.read_by_pk(data['mechanicid'])
-            if not mechanic_data:
-                errors.append(f"Mechanic with ID {data['mechanicid']} does not exist.")
-        return len(errors) == 0, errors
+
+# Models by table name, in foreign key dependency order
+MODELS = {
+    model.table_name: model
+    for model in (Owner, Mechanic, Car, ServiceRecord, ServiceMechanic)
+}
+
+# Label every statement with the model method that issued it
+for model in (BaseModel, *MODELS.values()):
+    instrument_class(model)
@@ -0,0 +1,295 @@
+"""
+Range partitioning of servicerecord by servicedate, and a search executor
+that scans the partitions in parallel.
+
+partition_servicerecord() turns the table into a declaratively partitioned
+one in a single transaction: a partition per year (or per `months` months)
+plus a DEFAULT partition for dates outside them. Inserts through the parent
+are routed to their partition, so create, generate_data, COPY and the
+synthetic data engine work unchanged. PostgreSQL only enforces unique keys
+on a partitioned table when they include the partition key, so the primary
+key becomes (serviceid, servicedate) and servicedate becomes NOT NULL. A
+foreign key cannot reference serviceid alone any more, so KEY_TRIGGERS take
+over from the constraints: serviceid stays unique across partitions, and
+servicemechanic rows must point at an existing service, which cannot be
+deleted while they do.
+
+ParallelSearch runs the servicerecord search over a date range as one query
+per partition the range covers, concurrently on pooled connections, and
+concatenates the results in date order. psycopg2 releases the GIL while it
+waits on the server, so threads keep as many backends scanning as there are
+workers.
+"""
+import datetime
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+from cache import get_result_cache
+from database import get_pool, load_config
+from model import ServiceRecord
+from records import ResultSet
+from schema import get_schema_cache
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+PARTITIONED_TABLE = """
+CREATE TABLE servicerecord (
+    serviceid INTEGER NOT NULL DEFAULT nextval('servicerecord_serviceid_seq'),
+    carid INTEGER NOT NULL REFERENCES car (carid),
+    servicedate DATE NOT NULL,
+    servicetype VARCHAR(100),
+    servicecost NUMERIC(10, 2),
+    PRIMARY KEY (serviceid, servicedate)
+) PARTITION BY RANGE (servicedate)
+"""
+
+# Statement-level checks standing in for servicerecord's serviceid key and
+# servicemechanic's foreign key to it. Like a foreign key, the servicemechanic
+# check locks the services it references FOR KEY SHARE, so a concurrent delete
+# waits for it and then sees the new references. Explicit serviceids inserted
+# by concurrent transactions are not serialized; the sequence default is.
+KEY_TRIGGERS = """
+CREATE OR REPLACE FUNCTION servicerecord_check_keys() RETURNS trigger AS $$
+DECLARE
+    serviceid_value INTEGER;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT s.serviceid INTO serviceid_value
+        FROM servicerecord s JOIN (SELECT DISTINCT serviceid FROM new_rows) n ON n.serviceid = s.serviceid
+        GROUP BY s.serviceid HAVING count(*) > 1 LIMIT 1;
+        IF FOUND THEN
+            RAISE EXCEPTION 'duplicate serviceid % in servicerecord', serviceid_value
+                USING ERRCODE = 'unique_violation';
+        END IF;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT sm.serviceid INTO serviceid_value
+        FROM servicemechanic sm JOIN (SELECT DISTINCT serviceid FROM old_rows) o ON o.serviceid = sm.serviceid
+        WHERE NOT EXISTS (SELECT 1 FROM servicerecord s WHERE s.serviceid = sm.serviceid) LIMIT 1;
+        IF FOUND THEN
+            RAISE EXCEPTION 'serviceid % is still referenced from servicemechanic', serviceid_value
+                USING ERRCODE = 'foreign_key_violation';
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION servicemechanic_check_serviceid() RETURNS trigger AS $$
+DECLARE
+    serviceid_value INTEGER;
+BEGIN
+    PERFORM 1 FROM servicerecord WHERE serviceid IN (SELECT serviceid FROM new_rows) FOR KEY SHARE;
+    SELECT n.serviceid INTO serviceid_value FROM new_rows n
+    WHERE NOT EXISTS (SELECT 1 FROM servicerecord s WHERE s.serviceid = n.serviceid) LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'serviceid % does not exist in servicerecord', serviceid_value
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS servicerecord_keys_insert ON servicerecord;
+CREATE TRIGGER servicerecord_keys_insert AFTER INSERT ON servicerecord REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE servicerecord_check_keys();
+DROP TRIGGER IF EXISTS servicerecord_keys_update ON servicerecord;
+CREATE TRIGGER servicerecord_keys_update AFTER UPDATE ON servicerecord
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE servicerecord_check_keys();
+DROP TRIGGER IF EXISTS servicerecord_keys_delete ON servicerecord;
+CREATE TRIGGER servicerecord_keys_delete AFTER DELETE ON servicerecord REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE servicerecord_check_keys();
+DROP TRIGGER IF EXISTS servicemechanic_serviceid_insert ON servicemechanic;
+CREATE TRIGGER servicemechanic_serviceid_insert AFTER INSERT ON servicemechanic REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE servicemechanic_check_serviceid();
+DROP TRIGGER IF EXISTS servicemechanic_serviceid_update ON servicemechanic;
+CREATE TRIGGER servicemechanic_serviceid_update AFTER UPDATE ON servicemechanic REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE servicemechanic_check_serviceid();
+"""
+
+BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _month(value, months):
+    # First day of the partition containing value
+    month = (value.month - 1) // months * months + 1 if months < 12 else 1
+    return datetime.date(value.year, month, 1)
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    return datetime.date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_bounds(table='servicerecord'):
+    """Sorted (low, high) date ranges of the table's range partitions; [] when it is not partitioned."""
+    pool = get_pool()
+    if pool.backend != 'postgresql':
+        return []
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+            (table,)
+        )
+        bounds = [BOUND.search(row[0]) for row in cursor.fetchall()]
+    return sorted((datetime.date.fromisoformat(match.group(1)), datetime.date.fromisoformat(match.group(2)))
+                  for match in bounds if match)
+
+
+def partition_servicerecord(first=None, last=None, months=12):
+    """
+    Convert servicerecord into a table range-partitioned by servicedate,
+    keeping its rows, indexes, reports, change log triggers and (through
+    KEY_TRIGGERS) its key and servicemechanic's reference. Partitions of
+    `months` months cover first to last (dates; by default the years of the
+    existing rows through next year). Returns the number of partitions.
+    """
+    pool = get_pool()
+    if pool.backend != 'postgresql':
+        raise RuntimeError("partitioning needs the PostgreSQL backend")
+    if months < 1 or (months < 12 and 12 % months) or (months > 12 and months % 12):
+        raise ValueError("months must divide a year or be whole years")
+    today = datetime.date.today()
+    with pool.connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'servicerecord'::regclass")
+                if cursor.fetchone():
+                    raise RuntimeError("servicerecord is already partitioned")
+                cursor.execute("LOCK TABLE servicerecord IN ACCESS EXCLUSIVE MODE")
+                cursor.execute("SELECT min(servicedate), max(servicedate), count(*) - count(servicedate) "
+                               "FROM servicerecord")
+                oldest, newest, undated = cursor.fetchone()
+                if undated:
+                    raise RuntimeError(f"{undated} service records have no servicedate")
+                first = _month(first or oldest or today, months)
+                last = last or datetime.date(max((newest or today).year, today.year) + 1, 12, 31)
+                # Secondary indexes, rebuilt on the new table once the old one is gone
+                cursor.execute("SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+                               "AND tablename = 'servicerecord' AND indexname <> 'servicerecord_pkey'")
+                indexes = [row[0] for row in cursor.fetchall()]
+
+                cursor.execute("ALTER TABLE servicerecord RENAME TO servicerecord_unpartitioned")
+                cursor.execute(PARTITIONED_TABLE)
+                count = 0
+                low = first
+                while low <= last:
+                    high = _add_months(low, months)
+                    cursor.execute(
+                        sql.SQL("CREATE TABLE {} PARTITION OF servicerecord FOR VALUES FROM (%s) TO (%s)").format(
+                            sql.Identifier(f"servicerecord_{low:%Y_%m}")),
+                        (low, high)
+                    )
+                    count += 1
+                    low = high
+                cursor.execute("CREATE TABLE servicerecord_default PARTITION OF servicerecord DEFAULT")
+                cursor.execute("INSERT INTO servicerecord (serviceid, carid, servicedate, servicetype, servicecost) "
+                               "SELECT serviceid, carid, servicedate, servicetype, servicecost "
+                               "FROM servicerecord_unpartitioned")
+                cursor.execute("ALTER SEQUENCE servicerecord_serviceid_seq OWNED BY servicerecord.serviceid")
+                # Takes the reports and servicemechanic's foreign key with it
+                cursor.execute("DROP TABLE servicerecord_unpartitioned CASCADE")
+                for definition in indexes:
+                    cursor.execute(definition)
+                # Recreates the reports and the change log triggers
+                with open(SCHEMA_FILE) as f:
+                    cursor.execute(f.read())
+                cursor.execute(KEY_TRIGGERS)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    get_schema_cache().invalidate()
+    get_result_cache().invalidate('servicerecord')
+    get_parallel_search().invalidate()
+    return count + 1
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+class ParallelSearch:
+    """
+    The servicerecord search, split at the partition boundaries inside its
+    date range and run on up to `workers` connections at once. Results come
+    back ordered by servicedate, serviceid. Without partitions (or on SQLite)
+    it is a single query.
+    """
+
+    def __init__(self, workers=None, bounds_ttl=None):
+        config = load_config()
+        self.workers = workers or config['search_workers']
+        self.bounds_ttl = config['schema_ttl'] if bounds_ttl is None else bounds_ttl
+        self._executor = None
+        self._lock = threading.Lock()
+        self._boundaries = None
+        self._loaded_at = 0
+
+    def boundaries(self):
+        """Dates where one partition ends and the next starts, reloaded after bounds_ttl seconds."""
+        with self._lock:
+            if self._boundaries is None or time.monotonic() - self._loaded_at > self.bounds_ttl:
+                self._boundaries = sorted({date for bound in partition_bounds() for date in bound})
+                self._loaded_at = time.monotonic()
+            return self._boundaries
+
+    def invalidate(self):
+        with self._lock:
+            self._boundaries = None
+
+    def queries(self, criteria):
+        """(query, params) per partition-sized piece of the search, in date order."""
+        low, high = _date(criteria['date_from']), _date(criteria['date_to'])
+        splits = [date for date in self.boundaries() if (low is None or date > low) and (high is None or date <= high)]
+        starts = [low] + splits
+        ends = splits + [None]
+        queries = []
+        for start, end in zip(starts, ends):
+            query = (ServiceRecord.select()
+                     .where('servicedate', '>=', start)
+                     .where('servicedate', '<', end)
+                     .where('servicedate', '<=', high if end is None else None)
+                     .equals('servicetype', criteria['servicetype'] or None)
+                     .order_by('servicedate')
+                     .order_by('serviceid'))
+            queries.append(query.build())
+        return queries
+
+    def search(self, criteria):
+        """
+        Run ServiceRecord.search_query's search with the same criteria, one
+        query per partition, and return the results as one ResultSet.
+        """
+        model = ServiceRecord()
+        queries = self.queries(criteria)
+        if len(queries) <= 1 or self.workers <= 1:
+            parts = [model.cached_query(query, params) for query, params in queries]
+        else:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='search')
+            parts = list(self._executor.map(lambda query: model.cached_query(*query), queries))
+        return ResultSet.concat(parts)
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_parallel_search():
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = ParallelSearch()
+        return _search
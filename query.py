@@ -0,0 +1,171 @@
+"""
+Composable search queries, and reuse of server-side prepared statements.
+
+    query = (Query('car').equals('make', 'Toyota').between('year', 2015, None)
+             .order_by('year', descending=True).limit(50))
+    text, params = query.build()
+
+Filters given a None value are left out, so optional search criteria map
+straight onto builder calls. IN filters are sent as one array parameter
+(= ANY(%s)) and LIMIT as a parameter, so the SQL text depends only on which
+filters are present. StatementCache prepares each distinct text once per
+connection; later searches of the same shape only EXECUTE it, skipping
+parse and planning on the server.
+"""
+import itertools
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+from database import load_config
+
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+OPERATORS = ('=', '<>', '<', '<=', '>', '>=', 'LIKE', 'ILIKE')
+
+
+def _identifier(name):
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"invalid column name {name!r}")
+    return name
+
+
+def numbered(query):
+    # Turn psycopg2 %s placeholders into PostgreSQL's $1, $2, ...
+    parts = query.split('%s')
+    return parts[0] + ''.join(f"${index}{part}" for index, part in enumerate(parts[1:], start=1))
+
+
+class Query:
+    """SELECT over one table built from filters, grouping, ordering and a limit."""
+
+    def __init__(self, table, columns=None):
+        self.table = _identifier(table)
+        # Select list entries are SQL expressions, e.g. 'sum(servicecost) AS total_cost'
+        self.columns = list(columns) if columns else ['*']
+        self.conditions = []
+        self.params = []
+        self.groups = []
+        self.ordering = []
+        self.row_limit = None
+
+    def where(self, column, operator, value):
+        if value is None:
+            return self
+        operator = operator.upper()
+        if operator not in OPERATORS:
+            raise ValueError(f"unsupported operator {operator}")
+        self.conditions.append(f"{_identifier(column)} {operator} %s")
+        self.params.append(value)
+        return self
+
+    def equals(self, column, value):
+        return self.where(column, '=', value)
+
+    def between(self, column, low=None, high=None):
+        return self.where(column, '>=', low).where(column, '<=', high)
+
+    def like(self, column, pattern):
+        return self.where(column, 'LIKE', pattern)
+
+    def ilike(self, column, pattern):
+        return self.where(column, 'ILIKE', pattern)
+
+    def is_in(self, column, values):
+        if values is None:
+            return self
+        self.conditions.append(f"{_identifier(column)} = ANY(%s)")
+        self.params.append(list(values))
+        return self
+
+    def group_by(self, *columns):
+        self.groups.extend(map(_identifier, columns))
+        return self
+
+    def order_by(self, column, descending=False):
+        self.ordering.append(_identifier(column) + (' DESC' if descending else ''))
+        return self
+
+    def limit(self, count):
+        self.row_limit = None if count is None else int(count)
+        return self
+
+    def build(self):
+        """Return (query, params) with %s placeholders."""
+        query = f"SELECT {', '.join(self.columns)} FROM {self.table}"
+        params = list(self.params)
+        if self.conditions:
+            query += " WHERE " + " AND ".join(self.conditions)
+        if self.groups:
+            query += " GROUP BY " + ", ".join(self.groups)
+        if self.ordering:
+            query += " ORDER BY " + ", ".join(self.ordering)
+        if self.row_limit is not None:
+            query += " LIMIT %s"
+            params.append(self.row_limit)
+        return query, params
+
+
+class StatementCache:
+    """
+    Prepared statements per connection, keyed by query text. Keeps at most
+    max_statements per connection and deallocates the least recently used
+    one beyond that. Entries go away with their connection.
+    """
+
+    def __init__(self, max_statements):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._prepared = weakref.WeakKeyDictionary()   # connection -> OrderedDict(query -> name)
+        self._names = itertools.count(1)
+        self.counters = {'prepared': 0, 'reused': 0, 'deallocated': 0}
+
+    def prepare(self, cursor, query):
+        """Return the name of query's prepared statement on the cursor's connection, preparing it if needed."""
+        with self._lock:
+            statements = self._prepared.setdefault(cursor.connection, OrderedDict())
+            name = statements.get(query)
+            if name is not None:
+                statements.move_to_end(query)
+                self.counters['reused'] += 1
+                return name
+            name = f"stmt_{next(self._names)}"
+        cursor.execute(f"PREPARE {name} AS {numbered(query)}")
+        with self._lock:
+            statements[query] = name
+            self.counters['prepared'] += 1
+            evicted = []
+            while len(statements) > self.max_statements:
+                evicted.append(statements.popitem(last=False)[1])
+                self.counters['deallocated'] += 1
+        for old_name in evicted:
+            cursor.execute(f"DEALLOCATE {old_name}")
+        return name
+
+    def execute(self, cursor, query, params):
+        """Run query through a prepared statement on the cursor's connection."""
+        name = self.prepare(cursor, query)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def stats(self):
+        with self._lock:
+            stats = {'connections': len(self._prepared), 'max_statements': self.max_statements}
+            stats['statements'] = sum(len(statements) for statements in self._prepared.values())
+            stats.update(self.counters)
+            return stats
+
+
+_statements = None
+_statements_lock = threading.Lock()
+
+
+def get_statement_cache():
+    global _statements
+    with _statements_lock:
+        if _statements is None:
+            _statements = StatementCache(load_config()['statement_cache_size'])
+        return _statements
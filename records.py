@@ -0,0 +1,153 @@
+"""
+Compact row types for query results.
+
+record_class() generates one immutable record type per model and column
+list. A record is a tuple subclass without __dict__, so each row is a single
+allocation, read by position (row[0]), by name (row['make'], or row.make
+when the name is not also a tuple method) and convertible with dict(row),
+like psycopg2's DictRow, which costs a list plus a separate item array.
+
+ResultSet keeps a whole result column by column instead: integer columns
+without NULLs go into an array('q'), and repeated values of other columns
+share one object, so low-cardinality columns (make, servicetype, dates)
+cost a pointer per row. Records are built only while iterating or
+indexing, and column() / array() hand out whole columns for aggregation.
+"""
+from array import array
+
+
+class Record(tuple):
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    @classmethod
+    def _make(cls, values):
+        return tuple.__new__(cls, values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        # Only reached when name is not a regular attribute
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def __repr__(self):
+        return '{' + ', '.join(f"{name!r}: {value!r}" for name, value in zip(self._fields, self)) + '}'
+
+
+_classes = {}
+
+
+def record_class(name, fields):
+    """The record type for rows of the given columns, e.g. CarRecord."""
+    fields = tuple(fields)
+    cls = _classes.get((name, fields))
+    if cls is None:
+        cls = type(f"{name}Record", (Record,), {
+            '__slots__': (),
+            '_fields': fields,
+            '_index': {field: index for index, field in enumerate(fields)},
+        })
+        _classes[(name, fields)] = cls
+    return cls
+
+
+def _field_names(cursor):
+    return [column[0] for column in cursor.description]
+
+
+def fetch_records(cursor, name='Row'):
+    """fetchall() as a list of records."""
+    rows = cursor.fetchall()
+    make = record_class(name, _field_names(cursor))._make
+    return [make(row) for row in rows]
+
+
+def fetch_record(cursor, name='Row'):
+    """fetchone() as a record, or None."""
+    row = cursor.fetchone()
+    return None if row is None else record_class(name, _field_names(cursor))._make(row)
+
+
+def _pack(values):
+    if values and all(type(value) is int for value in values):
+        try:
+            return array('q', values)
+        except OverflowError:
+            return list(values)
+    # Repeated values share one object
+    seen = {}
+    try:
+        return [seen.setdefault(value, value) for value in values]
+    except TypeError:
+        return list(values)
+
+
+class ResultSet:
+    """A query result stored as one packed sequence per column."""
+    __slots__ = ('names', 'columns', 'record')
+
+    def __init__(self, names, columns, record):
+        self.names = list(names)
+        self.columns = columns
+        self.record = record
+
+    @classmethod
+    def from_cursor(cls, cursor, name='Row'):
+        rows = cursor.fetchall()
+        names = _field_names(cursor)
+        columns = [_pack(column) for column in zip(*rows)] if rows else [[] for _ in names]
+        return cls(names, columns, record_class(name, names))
+
+    @classmethod
+    def concat(cls, parts):
+        """One ResultSet with the rows of several over the same columns, in order."""
+        first = parts[0]
+        if len(parts) == 1:
+            return first
+        columns = [_pack([value for part in parts for value in part.columns[index]])
+                   for index in range(len(first.names))]
+        return cls(first.names, columns, first.record)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        return map(self.record._make, zip(*self.columns))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.record._make(row) for row in zip(*(column[index] for column in self.columns))]
+        return self.record._make(column[index] for column in self.columns)
+
+    def column(self, name):
+        return self.columns[self.names.index(name)]
+
+    def array(self, name, typecode='d'):
+        """A column as a typed array, e.g. servicecost as doubles; the column must have no NULLs."""
+        column = self.column(name)
+        if isinstance(column, array) and column.typecode == typecode:
+            return column
+        return array(typecode, column)
+
+    def __repr__(self):
+        return f"<ResultSet {len(self)} rows: {', '.join(self.names)}>"
@@ -0,0 +1,146 @@
+"""
+Aggregate reports over the service history.
+
+Each report is a materialized view created by schema.sql, with a unique
+index so it can be refreshed CONCURRENTLY: readers keep seeing the previous
+contents while a refresh runs. Writes through the models mark the reports
+built on the written table as stale; stale reports are refreshed in a
+background thread report_refresh_delay seconds later, so a burst of writes
+costs one refresh. Reading a stale report refreshes it first. When the
+views are missing (schema.sql not applied), refreshes are switched off.
+"""
+import threading
+import time
+
+from database import get_pool, load_config
+from records import fetch_records
+
+
+REPORTS = {
+    'car_service_costs': {
+        'title': 'Service Cost Totals per Car',
+        'sources': ('servicerecord',),
+        'order': 'total_cost DESC NULLS LAST, carid',
+    },
+    'mechanic_hours': {
+        'title': 'Hours Worked per Mechanic',
+        'sources': ('mechanic', 'servicemechanic'),
+        'order': 'hours DESC NULLS LAST, mechanicid',
+    },
+    'monthly_service_types': {
+        'title': 'Monthly Service Counts by Type',
+        'sources': ('servicerecord',),
+        'order': 'month DESC NULLS LAST, services DESC',
+    },
+}
+
+
+class ReportRefresher:
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._stale = set()
+        self._timer = None
+        self.last_refresh = {}   # report -> {'at', 'seconds'}
+        self.counters = {'refreshes': 0, 'failures': 0}
+        self._missing = None
+
+    def missing(self):
+        """Names of the report views not in the database, looked up once."""
+        if get_pool().backend != 'postgresql':
+            # Materialized views exist only on PostgreSQL
+            return set(REPORTS)
+        with self._lock:
+            if self._missing is None:
+                try:
+                    with get_pool().connection() as conn, conn.cursor() as cursor:
+                        cursor.execute("SELECT name FROM unnest(%s) AS name WHERE to_regclass(name) IS NULL",
+                                       (list(REPORTS),))
+                        self._missing = {row[0] for row in cursor.fetchall()}
+                except Exception as e:
+                    print(f"Error looking up the report views, report refresh is off: {e}")
+                    self._missing = set(REPORTS)
+            return self._missing
+
+    def table_changed(self, table):
+        """Mark the reports built on table as stale and schedule their refresh."""
+        names = {name for name, report in REPORTS.items() if table in report['sources']} - self.missing()
+        if not names:
+            return
+        with self._lock:
+            self._stale.update(names)
+            if self._stale and self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Refresh every stale report now."""
+        with self._lock:
+            names, self._stale = self._stale, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for name in sorted(names):
+            self.refresh(name)
+
+    def refresh(self, name):
+        if name in self.missing():
+            return False
+        start = time.perf_counter()
+        try:
+            with get_pool().connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+        except Exception as e:
+            print(f"Error refreshing report {name}: {e}")
+            with self._lock:
+                self.counters['failures'] += 1
+            return False
+        with self._lock:
+            self.counters['refreshes'] += 1
+            self.last_refresh[name] = {'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                       'seconds': round(time.perf_counter() - start, 3)}
+        return True
+
+    def read(self, name, limit=None):
+        """Return the rows of a report, refreshing it first if it is stale."""
+        report = REPORTS[name]
+        if get_pool().backend != 'postgresql':
+            raise RuntimeError("reports need the PostgreSQL backend")
+        if name in self.missing():
+            raise RuntimeError(f"report {name} does not exist; apply schema.sql to create it")
+        with self._lock:
+            stale = name in self._stale
+            self._stale.discard(name)
+        if stale:
+            self.refresh(name)
+        query = f"SELECT * FROM {name} ORDER BY {report['order']}"
+        params = []
+        if limit:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        with get_pool().connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return fetch_records(cursor, name)
+
+    def stats(self):
+        with self._lock:
+            stats = {'stale': sorted(self._stale), 'delay': self.delay}
+            if self._missing:
+                stats['missing'] = sorted(self._missing)
+            stats.update(self.counters)
+            for name, refresh in self.last_refresh.items():
+                stats[f"{name}_last_refresh"] = f"{refresh['at']} ({refresh['seconds']} s)"
+            return stats
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_report_refresher():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = ReportRefresher(load_config()['report_refresh_delay'])
+        return _refresher
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from database import get_pool, load_config
+
+
+# Columns, primary/unique keys and foreign keys of every table in the current
+# schema, fetched in one round-trip. psycopg2 decodes the json columns.
+SCHEMA_QUERY = """
+    SELECT
+        c.relname AS table_name,
+        (SELECT json_agg(json_build_object(
+                    'name', a.attname,
+                    'type', format_type(a.atttypid, a.atttypmod),
+                    'nullable', NOT a.attnotnull,
+                    'has_default', a.atthasdef
+                ) ORDER BY a.attnum)
+           FROM pg_attribute a
+          WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped) AS columns,
+        (SELECT json_agg(json_build_object(
+                    'type', con.contype,
+                    'columns', (SELECT json_agg(att.attname ORDER BY k.ord)
+                                  FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                                  JOIN pg_attribute att
+                                    ON att.attrelid = con.conrelid AND att.attnum = k.attnum),
+                    'foreign_table', fc.relname,
+                    'foreign_columns', (SELECT json_agg(att.attname ORDER BY k.ord)
+                                          FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+                                          JOIN pg_attribute att
+                                            ON att.attrelid = con.confrelid AND att.attnum = k.attnum)
+                ))
+           FROM pg_constraint con
+           LEFT JOIN pg_class fc ON fc.oid = con.confrelid
+          WHERE con.conrelid = c.oid AND con.contype IN ('p', 'u', 'f')) AS constraints
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+"""
+
+
+class TableSchema:
+    def __init__(self, name, columns, constraints):
+        self.name = name
+        self.column_info = {column['name']: column for column in columns or []}
+        self.column_names = [column['name'] for column in columns or []]
+        self.pk = []
+        self.unique = []
+        self.foreign_keys = {}
+        for constraint in constraints or []:
+            if constraint['type'] == 'p':
+                self.pk = constraint['columns']
+            elif constraint['type'] == 'u':
+                self.unique.append(constraint['columns'])
+            elif constraint['type'] == 'f' and len(constraint['columns']) == 1:
+                self.foreign_keys[constraint['columns'][0]] = (
+                    constraint['foreign_table'], constraint['foreign_columns'][0]
+                )
+
+    def data_type(self, column):
+        # Type name without modifiers, matching information_schema.columns.data_type
+        type_name = self.column_info[column]['type']
+        if type_name.startswith('timestamp'):
+            return type_name
+        return type_name.split('(')[0]
+
+    def nullable(self, column):
+        return self.column_info[column]['nullable']
+
+    def writable_columns(self):
+        # Everything except primary key columns filled in by a default (serials)
+        return [name for name in self.column_names
+                if name not in self.pk or not self.column_info[name]['has_default']]
+
+
+class SchemaCache:
+    """
+    Memoized catalog metadata. Entries are reloaded after `ttl` seconds or
+    after an explicit invalidate(), e.g. following a migration.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tables = None
+        self._loaded_at = 0.0
+
+    def load(self):
+        pool = get_pool()
+        if pool.backend == 'sqlite':
+            rows = pool.catalog()
+        else:
+            with pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(SCHEMA_QUERY)
+                rows = cursor.fetchall()
+        return {name: TableSchema(name, columns, constraints) for name, columns, constraints in rows}
+
+    def tables(self):
+        with self._lock:
+            if self._tables is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._tables = self.load()
+                self._loaded_at = time.monotonic()
+            return self._tables
+
+    def table(self, table_name):
+        tables = self.tables()
+        if table_name not in tables:
+            raise LookupError(f"Table {table_name} not found in the database schema")
+        return tables[table_name]
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_schema_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SchemaCache(load_config()['schema_ttl'])
+        return _cache
@@ -0,0 +1,149 @@
+CREATE TABLE IF NOT EXISTS owner (
+    ownerid SERIAL PRIMARY KEY,
+    firstname VARCHAR(50),
+    lastname VARCHAR(50),
+    phone VARCHAR(20),
+    email VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS car (
+    carid SERIAL PRIMARY KEY,
+    make VARCHAR(50),
+    model VARCHAR(50),
+    year INTEGER,
+    vin VARCHAR(17) UNIQUE,
+    ownerid INTEGER REFERENCES owner (ownerid)
+);
+
+CREATE TABLE IF NOT EXISTS mechanic (
+    mechanicid SERIAL PRIMARY KEY,
+    name VARCHAR(100),
+    specialty VARCHAR(100),
+    phone VARCHAR(20)
+);
+
+CREATE TABLE IF NOT EXISTS servicerecord (
+    serviceid SERIAL PRIMARY KEY,
+    carid INTEGER NOT NULL REFERENCES car (carid),
+    servicedate DATE,
+    servicetype VARCHAR(100),
+    servicecost NUMERIC(10, 2)
+);
+
+CREATE TABLE IF NOT EXISTS servicemechanic (
+    serviceid INTEGER NOT NULL REFERENCES servicerecord (serviceid),
+    mechanicid INTEGER NOT NULL REFERENCES mechanic (mechanicid),
+    hoursworked NUMERIC(5, 2),
+    PRIMARY KEY (serviceid, mechanicid)
+);
+
+CREATE INDEX IF NOT EXISTS car_ownerid_idx ON car (ownerid);
+CREATE INDEX IF NOT EXISTS servicerecord_carid_idx ON servicerecord (carid);
+CREATE INDEX IF NOT EXISTS servicemechanic_mechanicid_idx ON servicemechanic (mechanicid);
+
+-- Aggregate reports (reports.py); the unique indexes allow REFRESH ... CONCURRENTLY
+CREATE MATERIALIZED VIEW IF NOT EXISTS car_service_costs AS
+SELECT carid, count(*) AS services, sum(servicecost) AS total_cost, max(servicedate) AS last_service
+FROM servicerecord
+GROUP BY carid;
+CREATE UNIQUE INDEX IF NOT EXISTS car_service_costs_carid_idx ON car_service_costs (carid);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mechanic_hours AS
+SELECT m.mechanicid, m.name, count(sm.serviceid) AS services, sum(sm.hoursworked) AS hours
+FROM mechanic m
+LEFT JOIN servicemechanic sm ON sm.mechanicid = m.mechanicid
+GROUP BY m.mechanicid;
+CREATE UNIQUE INDEX IF NOT EXISTS mechanic_hours_mechanicid_idx ON mechanic_hours (mechanicid);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS monthly_service_types AS
+SELECT date_trunc('month', servicedate)::date AS month, servicetype, count(*) AS services,
+       sum(servicecost) AS total_cost
+FROM servicerecord
+GROUP BY 1, 2;
+CREATE UNIQUE INDEX IF NOT EXISTS monthly_service_types_month_idx ON monthly_service_types (month, servicetype);
+
+-- Change feed (changefeed.py): an append-only log of the row changes of car,
+-- servicerecord and servicemechanic, written by statement-level triggers and
+-- announced on the change_log channel. Readers order by (txid, changeid).
+CREATE TABLE IF NOT EXISTS change_log (
+    changeid BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    tablename VARCHAR(63) NOT NULL,
+    operation CHAR(1) NOT NULL,
+    rowkey JSONB NOT NULL,
+    data JSONB,
+    changedat TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS change_log_txid_idx ON change_log (txid, changeid);
+
+CREATE TABLE IF NOT EXISTS change_offsets (
+    subscriber VARCHAR(100) PRIMARY KEY,
+    txid BIGINT NOT NULL,
+    changeid BIGINT NOT NULL,
+    updatedat TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Arguments: the key columns of the table. Inserts log the new row, updates
+-- the changed columns only, deletes just the key.
+CREATE OR REPLACE FUNCTION log_changes() RETURNS trigger AS $$
+DECLARE
+    logged BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO change_log (tablename, operation, rowkey, data)
+        SELECT TG_TABLE_NAME, 'I', (SELECT jsonb_object_agg(k, r.doc -> k) FROM unnest(TG_ARGV) AS k), r.doc
+        FROM (SELECT to_jsonb(n) AS doc FROM new_rows n) r;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (tablename, operation, rowkey)
+        SELECT TG_TABLE_NAME, 'D', (SELECT jsonb_object_agg(k, r.doc -> k) FROM unnest(TG_ARGV) AS k)
+        FROM (SELECT to_jsonb(o) AS doc FROM old_rows o) r;
+    ELSE
+        INSERT INTO change_log (tablename, operation, rowkey, data)
+        SELECT TG_TABLE_NAME, 'U', n.key,
+               (SELECT jsonb_object_agg(e.key, e.value) FROM jsonb_each(n.doc) e
+                WHERE o.doc -> e.key IS DISTINCT FROM e.value)
+        FROM (SELECT r.doc, (SELECT jsonb_object_agg(k, r.doc -> k) FROM unnest(TG_ARGV) AS k) AS key
+              FROM (SELECT to_jsonb(t) AS doc FROM new_rows t) r) n
+        JOIN (SELECT r.doc, (SELECT jsonb_object_agg(k, r.doc -> k) FROM unnest(TG_ARGV) AS k) AS key
+              FROM (SELECT to_jsonb(t) AS doc FROM old_rows t) r) o ON o.key = n.key
+        WHERE n.doc IS DISTINCT FROM o.doc;
+    END IF;
+    GET DIAGNOSTICS logged = ROW_COUNT;
+    IF logged > 0 THEN
+        PERFORM pg_notify('change_log', TG_TABLE_NAME);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS car_log_insert ON car;
+CREATE TRIGGER car_log_insert AFTER INSERT ON car REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('carid');
+DROP TRIGGER IF EXISTS car_log_update ON car;
+CREATE TRIGGER car_log_update AFTER UPDATE ON car REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('carid');
+DROP TRIGGER IF EXISTS car_log_delete ON car;
+CREATE TRIGGER car_log_delete AFTER DELETE ON car REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('carid');
+
+DROP TRIGGER IF EXISTS servicerecord_log_insert ON servicerecord;
+CREATE TRIGGER servicerecord_log_insert AFTER INSERT ON servicerecord REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid');
+DROP TRIGGER IF EXISTS servicerecord_log_update ON servicerecord;
+CREATE TRIGGER servicerecord_log_update AFTER UPDATE ON servicerecord
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid');
+DROP TRIGGER IF EXISTS servicerecord_log_delete ON servicerecord;
+CREATE TRIGGER servicerecord_log_delete AFTER DELETE ON servicerecord REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid');
+
+DROP TRIGGER IF EXISTS servicemechanic_log_insert ON servicemechanic;
+CREATE TRIGGER servicemechanic_log_insert AFTER INSERT ON servicemechanic REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid', 'mechanicid');
+DROP TRIGGER IF EXISTS servicemechanic_log_update ON servicemechanic;
+CREATE TRIGGER servicemechanic_log_update AFTER UPDATE ON servicemechanic
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid', 'mechanicid');
+DROP TRIGGER IF EXISTS servicemechanic_log_delete ON servicemechanic;
+CREATE TRIGGER servicemechanic_log_delete AFTER DELETE ON servicemechanic REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE PROCEDURE log_changes('serviceid', 'mechanicid');
@@ -0,0 +1,318 @@
+"""
+Embedded SQLite backend, so the model layer runs without a PostgreSQL server
+(local development, CI benchmarks).
+
+Selected with backend = sqlite in database.ini or DB_BACKEND=sqlite;
+sqlite_path is a database file or :memory:. The tables and indexes of
+schema.sql are created on first use. Connections accept the psycopg2
+dialect the models are written in: %s and %(name)s placeholders,
+= ANY(%s) with a list, ::type casts, ILIKE, psycopg2.sql composables,
+named cursors and the autocommit switch. PostgreSQL-only features (COPY,
+server-side prepared statements, EXPLAIN ANALYZE, the materialized view
+reports, pg_stat_statements, LISTEN/NOTIFY) are not available; the models
+fall back to plain statements where they can. The change log triggers are
+recreated as SQLite row triggers.
+"""
+import datetime
+import decimal
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from psycopg2 import sql
+
+from instrumentation import InstrumentedCursorMixin
+
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+PLACEHOLDER = re.compile(r"%%|%\((\w+)\)s|%s")
+CAST = re.compile(r"::\s*(?:double precision|character varying|timestamp(?: with(?:out)? time zone)?|[A-Za-z_]+)"
+                  r"(?:\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?(?:\[\])?")
+ANY = re.compile(r"=\s*ANY\s*\(\s*$", re.IGNORECASE)
+ILIKE = re.compile(r"\bILIKE\b", re.IGNORECASE)
+
+# Catalog type names as PostgreSQL's format_type() spells them
+TYPE_NAMES = {'varchar': 'character varying', 'int': 'integer', 'serial': 'integer', 'float': 'double precision',
+              'real': 'double precision', 'bool': 'boolean'}
+
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, datetime.datetime.isoformat)
+
+
+def _render(query):
+    # psycopg2 needs a server connection to render composables, so do it here
+    if isinstance(query, sql.Composed):
+        return ''.join(_render(part) for part in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return '.'.join('"' + name.replace('"', '""') + '"' for name in query.strings)
+    if isinstance(query, sql.Placeholder):
+        return f"%({query.name})s" if query.name else '%s'
+    if isinstance(query, sql.Literal):
+        value = query.wrapped
+        return "'" + str(value).replace("'", "''") + "'" if isinstance(value, str) else str(value)
+    return str(query)
+
+
+def translate(query, params=None):
+    """Turn a psycopg2 query and its parameters into SQLite's."""
+    text = query if isinstance(query, str) else _render(query)
+    text = ILIKE.sub('LIKE', CAST.sub('', text))
+    if isinstance(params, dict):
+        return PLACEHOLDER.sub(lambda match: '%' if match.group(0) == '%%' else f":{match.group(1)}", text), params
+    params = list(params or [])
+    parts = []
+    args = []
+    position = 0
+    index = 0
+    for match in PLACEHOLDER.finditer(text):
+        parts.append(text[position:match.start()])
+        position = match.end()
+        if match.group(0) == '%%':
+            parts.append('%')
+            continue
+        value = params[index]
+        index += 1
+        if isinstance(value, (list, tuple)) and ANY.search(parts[-1]):
+            # x = ANY(%s) with an array becomes x IN (?, ?, ...)
+            parts[-1] = ANY.sub('IN (', parts[-1])
+            parts.append(', '.join(['?'] * len(value)))
+            args.extend(value)
+        else:
+            parts.append('?')
+            args.append(value)
+    parts.append(text[position:])
+    return ''.join(parts), args
+
+
+class _TranslatingCursor(sqlite3.Cursor):
+    itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def execute(self, query, params=None):
+        text, args = translate(query, params)
+        return super().execute(text, args)
+
+    def executemany(self, query, params_list):
+        params_list = list(params_list)
+        if not params_list:
+            return self
+        text, _ = translate(query, params_list[0])
+        return super().executemany(text, [translate(query, params)[1] for params in params_list])
+
+
+class SQLiteCursor(InstrumentedCursorMixin, _TranslatingCursor):
+    pass
+
+
+class SQLiteConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._autocommit = True
+        self.row_factory = sqlite3.Row
+
+    def cursor(self, name=None, cursor_factory=None):
+        # Named (server-side) cursors and DictCursor have no SQLite counterpart;
+        # rows are sqlite3.Row, which also supports row['column']
+        return super().cursor(SQLiteCursor)
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            super().commit()
+        self._autocommit = value
+        if not value:
+            self.execute('BEGIN')
+
+    def commit(self):
+        super().commit()
+        if not self._autocommit:
+            self.execute('BEGIN')
+
+    def rollback(self):
+        super().rollback()
+        if not self._autocommit:
+            self.execute('BEGIN')
+
+
+def _split(path):
+    # Statements of an SQL file; semicolons inside $$ function bodies do not end one
+    with open(path) as f:
+        text = '\n'.join(line for line in f if not line.lstrip().startswith('--'))
+    statements = ['']
+    for index, part in enumerate(text.split('$$')):
+        if index % 2:
+            statements[-1] += f"$${part}$$"
+            continue
+        pieces = part.split(';')
+        statements[-1] += pieces[0]
+        statements.extend(pieces[1:])
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def schema_statements(path=SCHEMA_FILE):
+    """
+    CREATE TABLE/INDEX statements of schema.sql in SQLite syntax, without the
+    materialized views and the PL/pgSQL change log triggers (see change_triggers).
+    """
+    statements = _split(path)
+    views = {match.group(1) for statement in statements
+             for match in [re.search(r"MATERIALIZED VIEW (?:IF NOT EXISTS )?(\w+)", statement)] if match}
+    result = []
+    for statement in statements:
+        target = re.search(r"\bON (\w+)", statement)
+        if 'MATERIALIZED VIEW' in statement or (target and target.group(1) in views):
+            continue
+        if re.match(r"(CREATE (OR REPLACE )?FUNCTION|(CREATE|DROP) TRIGGER)\b", statement):
+            continue
+        statement = re.sub(r"\b(BIG)?SERIAL PRIMARY KEY\b", 'INTEGER PRIMARY KEY', statement)
+        # One connection writes at a time, so changeid alone orders the change log
+        result.append(statement.replace('DEFAULT txid_current()', 'DEFAULT 0'))
+    return result
+
+
+def change_triggers(conn, path=SCHEMA_FILE):
+    """
+    Row-level SQLite equivalents of the log_changes() triggers in schema.sql,
+    for the tables as they exist in conn.
+    """
+    result = []
+    for statement in _split(path):
+        match = re.match(r"CREATE TRIGGER (\w+) AFTER (INSERT|UPDATE|DELETE) ON (\w+)\b.*log_changes\(([^)]*)\)",
+                         statement, re.DOTALL)
+        if not match:
+            continue
+        name, event, table, arguments = match.groups()
+        keys = re.findall(r"'(\w+)'", arguments)
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+        def as_json(row, names):
+            return 'json_object(' + ', '.join(f"'{column}', {row}.{column}" for column in names) + ')'
+
+        if event == 'INSERT':
+            when, values = '', f"'I', {as_json('NEW', keys)}, {as_json('NEW', columns)}"
+        elif event == 'DELETE':
+            when, values = '', f"'D', {as_json('OLD', keys)}, NULL"
+        else:
+            changed = ' UNION ALL '.join(f"SELECT '{column}' AS name, NEW.{column} AS value "
+                                         f"WHERE NEW.{column} IS NOT OLD.{column}" for column in columns)
+            when = 'WHEN ' + ' OR '.join(f"NEW.{column} IS NOT OLD.{column}" for column in columns)
+            values = f"'U', {as_json('NEW', keys)}, (SELECT json_group_object(name, value) FROM ({changed}))"
+        result.append(f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} {when} BEGIN "
+                      f"INSERT INTO change_log (tablename, operation, rowkey, data) VALUES ('{table}', {values}); END")
+    return result
+
+
+class SQLitePool:
+    """
+    Stand-in for database.ConnectionPool. SQLite has one writer at a time, and
+    a :memory: database exists only in its connection, so every caller shares
+    one connection, one thread at a time.
+    """
+    backend = 'sqlite'
+
+    def __init__(self, config):
+        self.path = config['sqlite_path']
+        self._lock = threading.RLock()
+        self._conn = None
+        self._closed = False
+        self.counters = {'borrowed': 0}
+
+    def fill(self):
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                       factory=SQLiteConnection)
+                conn.execute('PRAGMA foreign_keys = ON')
+                for statement in schema_statements():
+                    conn.execute(statement)
+                for statement in change_triggers(conn):
+                    conn.execute(statement)
+                self._conn = conn
+
+    def getconn(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("connection pool is closed")
+        self._lock.acquire()
+        try:
+            self.fill()
+        except Exception:
+            self._lock.release()
+            raise
+        self.counters['borrowed'] += 1
+        return self._conn
+
+    def putconn(self, conn):
+        if conn.in_transaction and conn.autocommit:
+            conn.rollback()
+        self._lock.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        stats = {'backend': self.backend, 'path': self.path, 'open': self._conn is not None}
+        stats.update(self.counters)
+        return stats
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def catalog(self):
+        """(table, columns, constraints) per table, shaped like schema.SCHEMA_QUERY's rows."""
+        with self.connection() as conn:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            result = []
+            for table in tables:
+                columns = []
+                constraints = []
+                info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+                key = [row['name'] for row in sorted(info, key=lambda row: row['pk']) if row['pk']]
+                for row in info:
+                    type_name = row['type'].lower()
+                    base, _, modifier = type_name.partition('(')
+                    base = TYPE_NAMES.get(base.strip(), base.strip())
+                    # INTEGER PRIMARY KEY is the rowid, assigned like a serial
+                    serial = key == [row['name']] and base == 'integer'
+                    columns.append({
+                        'name': row['name'],
+                        'type': base + ('(' + modifier if modifier else ''),
+                        'nullable': not row['notnull'] and not row['pk'],
+                        'has_default': row['dflt_value'] is not None or serial,
+                    })
+                if key:
+                    constraints.append({'type': 'p', 'columns': key})
+                for index in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+                    if index['unique'] and index['origin'] == 'u':
+                        names = [row['name'] for row in conn.execute(f'PRAGMA index_info("{index["name"]}")')]
+                        constraints.append({'type': 'u', 'columns': names})
+                for row in conn.execute(f'PRAGMA foreign_key_list("{table}")').fetchall():
+                    constraints.append({'type': 'f', 'columns': [row['from']], 'foreign_table': row['table'],
+                                        'foreign_columns': [row['to']]})
+                result.append((table, columns, constraints))
+            return result
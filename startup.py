@@ -0,0 +1,29 @@
+"""
+Startup timings, measured from when this module is first imported (main.py
+imports it before anything else): time to the first menu, to the first
+model query and the outcome of the background warm-up.
+"""
+import threading
+import time
+
+
+_started = time.perf_counter()
+_lock = threading.Lock()
+_marks = {}
+
+
+def mark(event, **details):
+    """Record the first occurrence of event, in ms since startup."""
+    if event in _marks:
+        return
+    with _lock:
+        _marks.setdefault(event, dict(ms=round((time.perf_counter() - _started) * 1000, 3), **details))
+
+
+def elapsed():
+    return time.perf_counter() - _started
+
+
+def timings():
+    with _lock:
+        return {event: dict(values) for event, values in _marks.items()}
@@ -0,0 +1,323 @@
+"""
+Realistic synthetic rows, generated client-side in column batches with NumPy.
+
+generate_data fills columns with SQL-side RANDOM() and MD5 values: fast, but
+makes and VINs come out as hex strings and years as 0-999, so searches and
+indexes see nothing like real cardinalities. SyntheticData draws every
+column of a batch at once from the distributions in PROFILE:
+
+- categorical values (names, makes, specialties, service types) follow a
+  Zipf law over their vocabulary, listed most common first
+- car years are normal around year_mean; VINs use the VIN alphabet, the
+  maker's WMI, the model year code and a valid check digit, with the carid
+  as serial number so they never collide
+- service dates lean towards the end of their range (a beta distribution),
+  costs are log-normal around a median per service type
+- foreign keys fan out unevenly: every parent row gets a log-normal weight,
+  so a few owners have many cars and a few cars many services
+
+BaseModel.generate_realistic streams the batches into the table with COPY.
+Needs NumPy (pip install numpy).
+"""
+
+FIRST_NAMES = ['Oleksandr', 'Andrii', 'Olena', 'Dmytro', 'Iryna', 'Serhii', 'Natalia', 'Maksym', 'Tetiana',
+               'Volodymyr', 'Yulia', 'Mykola', 'Kateryna', 'Ivan', 'Oksana', 'Viktor', 'Anna', 'Yurii',
+               'Svitlana', 'Bohdan', 'Mariia', 'Taras', 'Liudmyla', 'Roman', 'Halyna', 'Petro', 'Sofiia']
+LAST_NAMES = ['Melnyk', 'Shevchenko', 'Bondarenko', 'Kovalenko', 'Boiko', 'Tkachenko', 'Kravchenko',
+              'Kovalchuk', 'Koval', 'Oliinyk', 'Shevchuk', 'Polishchuk', 'Ivanenko', 'Lysenko', 'Tkachuk',
+              'Savchenko', 'Rudenko', 'Petrenko', 'Marchenko', 'Moroz', 'Kuzmenko', 'Pavlenko', 'Karpenko']
+PHONE_PREFIXES = ['+38067', '+38050', '+38093', '+38097', '+38063', '+38066', '+38095', '+38068', '+38073',
+                  '+38099', '+38096', '+38098']
+
+PROFILE = {
+    'owner': {
+        'first_names': FIRST_NAMES,
+        'last_names': LAST_NAMES,
+        'name_zipf': 0.8,
+        'phone_prefixes': PHONE_PREFIXES,
+        'email_domains': ['gmail.com', 'ukr.net', 'i.ua', 'outlook.com', 'meta.ua'],
+    },
+    'mechanic': {
+        'first_names': FIRST_NAMES,
+        'last_names': LAST_NAMES,
+        'name_zipf': 0.8,
+        'phone_prefixes': PHONE_PREFIXES,
+        'specialties': ['General Maintenance', 'Engine Repair', 'Brakes', 'Diagnostics', 'Suspension',
+                        'Electrical', 'Tires', 'Transmission', 'Air Conditioning', 'Bodywork'],
+        'specialty_zipf': 1.0,
+    },
+    'car': {
+        # make -> (world manufacturer identifier, models)
+        'makes': {
+            'Toyota': ('JTD', ['Corolla', 'Camry', 'RAV4', 'Yaris', 'Land Cruiser']),
+            'Volkswagen': ('WVW', ['Golf', 'Passat', 'Polo', 'Tiguan', 'Jetta']),
+            'Renault': ('VF1', ['Logan', 'Megane', 'Duster', 'Clio']),
+            'Skoda': ('TMB', ['Octavia', 'Fabia', 'Superb', 'Kodiaq']),
+            'Hyundai': ('KMH', ['Tucson', 'Elantra', 'Accent', 'Santa Fe']),
+            'Ford': ('WF0', ['Focus', 'Fiesta', 'Mondeo', 'Kuga']),
+            'Kia': ('KNA', ['Sportage', 'Ceed', 'Rio', 'Sorento']),
+            'Nissan': ('JN1', ['Qashqai', 'X-Trail', 'Leaf', 'Juke']),
+            'BMW': ('WBA', ['3 Series', '5 Series', 'X3', 'X5']),
+            'Mercedes-Benz': ('WDD', ['C-Class', 'E-Class', 'GLC', 'Sprinter']),
+            'Audi': ('WAU', ['A4', 'A6', 'Q5', 'Q7']),
+            'Honda': ('JHM', ['Civic', 'Accord', 'CR-V']),
+            'Mazda': ('JM1', ['Mazda3', 'Mazda6', 'CX-5']),
+            'Chevrolet': ('1G1', ['Aveo', 'Lacetti', 'Cruze']),
+            'Peugeot': ('VF3', ['308', '3008', '508']),
+            'Tesla': ('5YJ', ['Model 3', 'Model Y', 'Model S']),
+        },
+        'make_zipf': 1.1,
+        'year_mean': 2013,
+        'year_sd': 6,
+        'year_min': 1995,
+        'year_max': 2025,
+        'fanout_sigma': 0.8,   # cars per owner
+    },
+    'servicerecord': {
+        # service type -> (median cost, log-normal sigma)
+        'types': {
+            'Oil Change': (60, 0.25),
+            'Inspection': (90, 0.2),
+            'Tire Rotation': (40, 0.3),
+            'Brake Pads': (180, 0.35),
+            'Wheel Alignment': (100, 0.25),
+            'Battery Replacement': (150, 0.25),
+            'Air Filter': (35, 0.3),
+            'Coolant Flush': (120, 0.3),
+            'AC Service': (140, 0.35),
+            'Suspension Repair': (450, 0.5),
+            'Transmission Service': (300, 0.4),
+            'Engine Repair': (1200, 0.6),
+        },
+        'type_zipf': 1.0,
+        'date_from': '2015-01-01',
+        'date_to': '2025-12-31',
+        'recency': 2.0,        # beta(recency, 1): higher leans more towards date_to
+        'fanout_sigma': 1.0,   # services per car
+    },
+    'servicemechanic': {
+        'mechanics_per_service': [0.65, 0.27, 0.08],   # P(1), P(2), P(3) mechanics
+        'hours_shape': 2.0,
+        'hours_scale': 1.0,
+        'fanout_sigma': 0.5,   # services per mechanic
+    },
+}
+
+VIN_ALPHABET = b'0123456789ABCDEFGHJKLMNPRSTUVWXYZ'
+# Model year codes (position 10), repeating every 30 years from 1980
+VIN_YEARS = b'ABCDEFGHJKLMNPRSTVWXY123456789'
+VIN_VALUES = dict(zip(b'0123456789ABCDEFGHJKLMNPRSTUVWXYZ', [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 1, 2, 3, 4, 5, 6, 7, 8,
+                                                             1, 2, 3, 4, 5, 7, 9, 2, 3, 4, 5, 6, 7, 8, 9]))
+VIN_WEIGHTS = [8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Realistic data generation needs the numpy package (pip install numpy)")
+    return numpy
+
+
+class _Parents:
+    """Keys of a parent table and the weight each is drawn with."""
+
+    def __init__(self, np, rng, keys, sigma):
+        self.np = np
+        self.rng = rng
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.cumulative = np.cumsum(rng.lognormal(0.0, sigma, len(self.keys)))
+        self.order = None
+        self.taken = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def draw_index(self, size):
+        return self.np.searchsorted(self.cumulative, self.rng.random(size) * self.cumulative[-1], side='right')
+
+    def draw(self, size):
+        return self.keys[self.draw_index(size)]
+
+    def take(self, size):
+        # Each key once, in random order, across calls
+        if self.order is None:
+            self.order = self.rng.permutation(self.keys)
+        keys = self.order[self.taken:self.taken + size]
+        self.taken += len(keys)
+        return keys
+
+
+class SyntheticData:
+    # Tables whose rows need their primary keys up front (the VIN embeds the carid)
+    keyed = ('car',)
+
+    def __init__(self, profile=None, seed=None):
+        """profile overrides PROFILE settings per table, e.g. {'car': {'year_mean': 2018}}."""
+        self.np = _numpy()
+        self.rng = self.np.random.default_rng(seed)
+        self.profile = {table: dict(settings) for table, settings in PROFILE.items()}
+        for table, settings in (profile or {}).items():
+            self.profile[table].update(settings)
+
+    def batches(self, table, rows, parents=None, reserve=None, batch_rows=100000):
+        """
+        Yield {column: array} batches of new rows for table, rows in total
+        (fewer for servicemechanic once every service has mechanics).
+        parents maps each foreign key column to the parent keys to draw from;
+        reserve(count) returns primary keys for the tables in keyed.
+        """
+        if table not in self.profile:
+            raise ValueError(f"No synthetic data profile for {table}")
+        settings = self.profile[table]
+        weighted = {}
+        for column, keys in (parents or {}).items():
+            if not len(keys):
+                raise ValueError(f"no parent rows for {column} to reference")
+            weighted[column] = _Parents(self.np, self.rng, keys, settings.get('fanout_sigma', 1.0))
+        generate = getattr(self, f"_{table}")
+        produced = 0
+        while produced < rows:
+            size = min(batch_rows, rows - produced)
+            keys = reserve(size) if table in self.keyed else None
+            batch = generate(size, settings, weighted, keys)
+            count = len(next(iter(batch.values())))
+            if not count:
+                break
+            produced += count
+            yield batch
+
+    def _zipf(self, values, exponent, size):
+        # Indexes into values; the first values are the most common
+        np = self.np
+        weights = 1.0 / np.arange(1, len(values) + 1) ** exponent
+        return self.rng.choice(len(values), size=size, p=weights / weights.sum())
+
+    def _pick(self, values, exponent, size):
+        return self.np.asarray(values)[self._zipf(values, exponent, size)]
+
+    def _digits(self, size, count):
+        np = self.np
+        return np.char.zfill(self.rng.integers(0, 10 ** count, size).astype(str), count)
+
+    def _phones(self, settings, size):
+        np = self.np
+        return np.char.add(self._pick(settings['phone_prefixes'], 0.5, size), self._digits(size, 7))
+
+    def _owner(self, size, settings, parents, keys):
+        np = self.np
+        first = self._pick(settings['first_names'], settings['name_zipf'], size)
+        last = self._pick(settings['last_names'], settings['name_zipf'], size)
+        number = self.rng.integers(1, 1000, size).astype(str)
+        domain = self._pick(settings['email_domains'], 1.0, size)
+        email = np.char.add(np.char.add(np.char.lower(first), '.'), np.char.lower(last))
+        email = np.char.add(np.char.add(np.char.add(email, number), '@'), domain)
+        return {'firstname': first, 'lastname': last, 'phone': self._phones(settings, size), 'email': email}
+
+    def _mechanic(self, size, settings, parents, keys):
+        np = self.np
+        first = self._pick(settings['first_names'], settings['name_zipf'], size)
+        last = self._pick(settings['last_names'], settings['name_zipf'], size)
+        return {
+            'name': np.char.add(np.char.add(first, ' '), last),
+            'specialty': self._pick(settings['specialties'], settings['specialty_zipf'], size),
+            'phone': self._phones(settings, size),
+        }
+
+    def _car(self, size, settings, parents, keys):
+        np = self.np
+        makes = list(settings['makes'])
+        make_index = self._zipf(makes, settings['make_zipf'], size)
+        # Models of every make in one array; a car's model is uniform within its make
+        model_counts = np.array([len(settings['makes'][make][1]) for make in makes])
+        model_offsets = np.concatenate(([0], np.cumsum(model_counts)[:-1]))
+        models = np.array([model for make in makes for model in settings['makes'][make][1]])
+        model_index = model_offsets[make_index] + (self.rng.random(size) * model_counts[make_index]).astype(np.int64)
+        year = np.clip(np.rint(self.rng.normal(settings['year_mean'], settings['year_sd'], size)),
+                       settings['year_min'], settings['year_max']).astype(np.int64)
+        keys = np.asarray(keys, dtype=np.int64)
+        return {
+            'carid': keys,
+            'make': np.array(makes)[make_index],
+            'model': models[model_index],
+            'year': year,
+            'vin': self._vins(settings, make_index, year, keys),
+            'ownerid': parents['ownerid'].draw(size),
+        }
+
+    def _vins(self, settings, make_index, year, keys):
+        np = self.np
+        size = len(keys)
+        alphabet = np.frombuffer(VIN_ALPHABET, dtype=np.uint8)
+        wmi = np.array([list(settings['makes'][make][0].encode()) for make in settings['makes']], dtype=np.uint8)
+        chars = np.zeros((size, 17), dtype=np.uint8)
+        chars[:, 0:3] = wmi[make_index]
+        chars[:, 3:8] = alphabet[self.rng.integers(0, len(alphabet), (size, 5))]
+        chars[:, 9] = np.frombuffer(VIN_YEARS, dtype=np.uint8)[(year - 1980) % len(VIN_YEARS)]
+        serial = keys.copy()
+        for position in range(16, 9, -1):
+            chars[:, position] = alphabet[serial % len(alphabet)]
+            serial //= len(alphabet)
+        values = np.zeros(256, dtype=np.int64)
+        values[list(VIN_VALUES)] = list(VIN_VALUES.values())
+        check = (values[chars] * np.array(VIN_WEIGHTS)).sum(axis=1) % 11
+        chars[:, 8] = np.where(check == 10, ord('X'), ord('0') + check)
+        return chars.view('S17').ravel().astype('U17')
+
+    def _servicerecord(self, size, settings, parents, keys):
+        np = self.np
+        types = list(settings['types'])
+        type_index = self._zipf(types, settings['type_zipf'], size)
+        median = np.array([settings['types'][name][0] for name in types], dtype=np.float64)
+        sigma = np.array([settings['types'][name][1] for name in types], dtype=np.float64)
+        cost = median[type_index] * np.exp(sigma[type_index] * self.rng.standard_normal(size))
+        first = np.datetime64(settings['date_from'], 'D')
+        span = (np.datetime64(settings['date_to'], 'D') - first).astype(np.int64)
+        days = np.floor(self.rng.beta(settings['recency'], 1.0, size) * (span + 1)).astype(np.int64)
+        return {
+            'carid': parents['carid'].draw(size),
+            'servicedate': first + np.minimum(days, span),
+            'servicetype': np.array(types)[type_index],
+            'servicecost': np.clip(np.round(cost, 2), 0.01, 99999999.99),
+        }
+
+    def _servicemechanic(self, size, settings, parents, keys):
+        np = self.np
+        mechanics = parents['mechanicid']
+        shares = settings['mechanics_per_service']
+        most = min(len(shares), len(mechanics))
+        per_service = np.minimum(self.rng.choice(len(shares), size=size, p=np.array(shares) / sum(shares)) + 1, most)
+        # Whole services only, up to size rows
+        services = parents['serviceid'].take(int(np.searchsorted(np.cumsum(per_service), size, side='right')))
+        per_service = per_service[:len(services)]
+        rows = int(per_service.sum())
+        # Mechanics of a service are start, start + step, ... (mod count): distinct while (most - 1) * step < count
+        first = mechanics.draw_index(len(services))
+        step = self.rng.integers(1, max(1, (len(mechanics) - 1) // max(1, most - 1)) + 1, len(services))
+        starts = np.repeat(np.cumsum(per_service) - per_service, per_service)
+        position = np.arange(rows) - starts
+        index = (np.repeat(first, per_service) + position * np.repeat(step, per_service)) % len(mechanics)
+        hours = np.round(self.rng.gamma(settings['hours_shape'], settings['hours_scale'], rows) * 4) / 4
+        return {
+            'serviceid': np.repeat(services, per_service),
+            'mechanicid': mechanics.keys[index],
+            'hoursworked': np.clip(hours, 0.25, 999.75),
+        }
+
+
+def _text(values):
+    if values.dtype.kind == 'f':
+        return [f"{value:.2f}" for value in values.tolist()]
+    # Dates render as YYYY-MM-DD; the vocabularies contain no tabs or backslashes to escape
+    return values.astype(str).tolist()
+
+
+def copy_text(batch):
+    """A batch in COPY text format."""
+    lines = map('\t'.join, zip(*(_text(values) for values in batch.values())))
+    return '\n'.join(lines) + '\n'
+
+
+def copy_rows(batch):
+    """A batch as tuples of Python values (dates as datetime.date), for executemany."""
+    return list(zip(*(values.tolist() for values in batch.values())))
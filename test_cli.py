@@ -0,0 +1,95 @@
+"""
+The command line against the embedded SQLite backend: stdout must stay
+JSON and failures must exit non-zero.
+
+    python -m pytest -q test_cli.py
+"""
+import json
+
+import pytest
+
+import benchmark
+import cli
+from cache import get_result_cache
+from database import close_pool
+from model import Car, Mechanic, Owner, ServiceRecord
+
+
+@pytest.fixture(autouse=True)
+def sqlite_db(monkeypatch, tmp_path):
+    monkeypatch.setenv('DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('DB_SQLITE_PATH', ':memory:')
+    monkeypatch.setenv('DB_SLOW_QUERY_LOG', str(tmp_path / 'slow_queries.log'))
+    close_pool()
+    yield
+    close_pool()
+    for table in ('owner', 'car', 'mechanic', 'servicerecord', 'servicemechanic'):
+        get_result_cache().invalidate(table)
+
+
+def run(capsys, *argv):
+    status = cli.main(list(argv))
+    captured = capsys.readouterr()
+    # Every line of stdout is a JSON document, whatever went wrong
+    return status, [json.loads(line) for line in captured.out.splitlines()], captured.err
+
+
+def test_create_and_read(capsys):
+    status, out, _ = run(capsys, 'create', 'owner', '{"firstname": "Ann", "lastname": "Lee"}')
+    assert status == 0
+    pk = out[0]['created']
+    status, out, _ = run(capsys, 'read', 'owner', '--pk', str(pk))
+    assert status == 0
+    assert out[0]['lastname'] == 'Lee'
+
+
+def test_read_missing_row(capsys):
+    status, out, _ = run(capsys, 'read', 'owner', '--pk', '42')
+    assert status == 1
+    assert out[0]['error']
+
+
+def test_create_servicemechanic_any_key_order(capsys):
+    Owner().generate_data(1)
+    Car().generate_data(1)
+    Mechanic().generate_data(1)
+    ServiceRecord().generate_data(1)
+    serviceid = ServiceRecord().read_all()[0].serviceid
+    mechanicid = Mechanic().read_all()[0].mechanicid
+    data = json.dumps({'hoursworked': 2.5, 'mechanicid': mechanicid, 'serviceid': serviceid})
+    status, out, _ = run(capsys, 'create', 'servicemechanic', data)
+    assert status == 0
+    status, out, _ = run(capsys, 'read', 'servicemechanic')
+    assert [(row['serviceid'], row['mechanicid'], row['hoursworked']) for row in out] == [(serviceid, mechanicid, 2.5)]
+
+
+def test_import_diagnostics_go_to_stderr(capsys, tmp_path):
+    path = tmp_path / 'cars.jsonl'
+    path.write_text(json.dumps({'make': 'Ford', 'model': 'T', 'year': 1920, 'vin': 'V1', 'ownerid': 99}) + '\n')
+    status, out, err = run(capsys, 'import', 'car', str(path))
+    assert status == 1
+    assert out[0]['error'] == 'no valid rows'
+    assert 'Skipping row 1' in err
+
+
+def test_dataset_invalid_count(capsys):
+    status, out, _ = run(capsys, 'dataset', 'owner=x')
+    assert status == 1
+    assert 'owner=x' in out[0]['error']
+
+
+def test_report_without_views(capsys):
+    status, out, _ = run(capsys, 'report', 'car_service_costs')
+    assert status == 1
+    assert out[0]['report'] == 'car_service_costs'
+    assert 'PostgreSQL' in out[0]['error']
+
+
+def test_benchmark_failure(capsys, monkeypatch):
+    def fail(argv):
+        raise RuntimeError("read_by_pk returned an error")
+
+    monkeypatch.setattr(benchmark, 'main', fail)
+    status, out, _ = run(capsys, 'benchmark', '--sqlite')
+    assert status == 1
+    assert 'read_by_pk' in out[0]['error']
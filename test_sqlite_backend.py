@@ -0,0 +1,140 @@
+"""
+The model layer against the embedded SQLite backend; needs no PostgreSQL.
+
+    python -m pytest -q test_sqlite_backend.py
+"""
+import pytest
+
+from cache import get_result_cache
+from controller import Controller
+from database import close_pool
+from dataset import generate_dataset
+from export import export_parquet, table_query
+from model import Car, Mechanic, Owner, ServiceMechanic, ServiceRecord
+
+
+@pytest.fixture(autouse=True)
+def sqlite_db(monkeypatch, tmp_path):
+    # A fresh :memory: database per test, and no slow query log in the checkout
+    monkeypatch.setenv('DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('DB_SQLITE_PATH', ':memory:')
+    monkeypatch.setenv('DB_SLOW_QUERY_LOG', str(tmp_path / 'slow_queries.log'))
+    close_pool()
+    yield
+    close_pool()
+    for table in ('owner', 'car', 'mechanic', 'servicerecord', 'servicemechanic'):
+        get_result_cache().invalidate(table)
+
+
+def test_crud():
+    owner = Owner()
+    pk = owner.create({'firstname': 'Ann', 'lastname': 'Lee', 'phone': '555', 'email': 'ann@example.com'})
+    assert owner.read_by_pk(pk)['lastname'] == 'Lee'
+    assert owner.update(pk, {'phone': '556'}) == 1
+    assert owner.read_by_pk(pk)['phone'] == '556'
+    assert owner.delete(pk) == 1
+    assert owner.read_by_pk(pk) is None
+
+
+def test_search():
+    owner_id = Owner().create({'firstname': 'Ann', 'lastname': 'Lee', 'phone': '555', 'email': 'a@example.com'})
+    car = Car()
+    for make, year, vin in [('Toyota', 2012, 'VIN1'), ('Toyota', 2019, 'VIN2'), ('Ford', 2015, 'VIN3')]:
+        car.create({'make': make, 'model': 'X', 'year': year, 'vin': vin, 'ownerid': owner_id})
+    records = car.cached_query(*Car.search_query({'make': 'Toyota', 'year_from': '2015', 'year_to': ''}))
+    assert [record.vin for record in records] == ['VIN2']
+    records = Owner().cached_query(*Owner.search_query({'lastname': 'Lee', 'firstname': ''}))
+    assert len(records) == 1
+
+
+def test_generate_data():
+    assert Owner().generate_data(20) == 20
+    assert Car().generate_data(30) == 30
+    assert Mechanic().generate_data(5) == 5
+    assert ServiceRecord().generate_data(40) == 40
+    # Colliding (serviceid, mechanicid) pairs are skipped, and not counted
+    inserted = ServiceMechanic().generate_data(100)
+    assert 0 < inserted <= 100
+    with ServiceMechanic().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM servicemechanic")
+        assert cursor.fetchone()[0] == inserted
+
+
+def test_generate_dataset_in_process():
+    results = generate_dataset({'owner': 10, 'car': 20, 'servicerecord': 30}, workers=4, progress=None)
+    assert all(result['success'] for result in results.values())
+    assert results['car']['rows'] == 20
+    assert len(Car().read_all()) == 20
+    assert len(ServiceRecord().read_all()) == 30
+
+
+def test_read_page():
+    Owner().generate_data(25)
+    owner = Owner()
+    seen = []
+    after = None
+    while True:
+        records, after = owner.read_page(after, page_size=10)
+        seen.extend(record.ownerid for record in records)
+        if after is None:
+            break
+    assert seen == sorted(seen)
+    assert len(seen) == 25
+
+
+class ScriptedView:
+    """Answers Controller.add_service_record's prompts without a terminal."""
+
+    def __init__(self, record, assignments):
+        self.record = record
+        self.assignments = assignments
+        self.messages = []
+
+    def get_service_record_input(self):
+        return dict(self.record)
+
+    def get_mechanic_assignments(self):
+        return [dict(assignment) for assignment in self.assignments]
+
+    def show_message(self, message):
+        self.messages.append(message)
+
+
+def test_add_service_record_with_mechanics():
+    Owner().generate_data(2)
+    Car().generate_data(2)
+    Mechanic().generate_data(3)
+    carid = Car().read_all()[0].carid
+    mechanics = [record.mechanicid for record in Mechanic().read_all()][:2]
+    controller = Controller(warm_up=False)
+    # Assignments come from the view as mechanicid, hoursworked; serviceid is added last
+    controller.view = ScriptedView(
+        {'carid': carid, 'servicedate': '2024-05-01', 'servicetype': 'Oil change', 'servicecost': 80.0},
+        [{'mechanicid': mechanics[0], 'hoursworked': 1.5}, {'mechanicid': mechanics[1], 'hoursworked': 2.0}],
+    )
+    controller.add_service_record()
+    assert 'added with 2 mechanic(s)' in controller.view.messages[-1]
+    serviceid = ServiceRecord().read_all()[0].serviceid
+    with ServiceMechanic().connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT serviceid, mechanicid, hoursworked FROM servicemechanic ORDER BY mechanicid")
+        rows = [tuple(row) for row in cursor.fetchall()]
+    assert rows == sorted([(serviceid, mechanics[0], 1.5), (serviceid, mechanics[1], 2.0)], key=lambda row: row[1])
+
+
+def test_export_parquet_types(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    Owner().generate_data(1)
+    Car().generate_data(1)
+    carid = Car().read_all()[0].carid
+    record = ServiceRecord()
+    # The first batch has only NULL costs; the file must still type the column numeric(10, 2)
+    for cost in (None, None, 12.5, 80.1):
+        record.create({'carid': carid, 'servicedate': '2024-05-01', 'servicetype': 'Check', 'servicecost': cost})
+    path = tmp_path / 'servicerecord.parquet'
+    assert export_parquet(record, table_query(record), None, str(path), batch_size=2) == 4
+    table = pq.read_table(str(path))
+    assert table.schema.field('servicecost').type == pa.decimal128(10, 2)
+    assert table.schema.field('servicedate').type == pa.date32()
+    assert table.schema.field('carid').type == pa.int32()
+    assert [str(cost) for cost in table.column('servicecost').to_pylist()] == ['None', 'None', '12.50', '80.10']
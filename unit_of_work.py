@@ -0,0 +1,121 @@
+"""
+One connection and one transaction shared by the model operations of a block.
+
+    with UnitOfWork():
+        serviceid = ServiceRecord().create(record)
+        for assignment in assignments:
+            ServiceMechanic().create(dict(assignment, serviceid=serviceid))
+
+While a unit of work is open on a thread, Model.connection() and
+Model.transaction() hand out its connection instead of a pooled one, and the
+commits the models issue after each write are deferred to a single COMMIT
+when the block exits (ROLLBACK if it raises). By default every model
+operation runs under its own savepoint, so one that fails, and reports it as
+usual by returning None, is undone alone and the rest of the unit can still
+commit.
+Use savepoint() to undo several operations together. Writes run
+immediately, not queued, so generated keys and foreign key checks inside
+the unit see the earlier writes. Result caches and reports of the written
+tables are invalidated once the unit has ended.
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+
+from database import get_pool
+
+
+class _Joined:
+    """The unit's connection as one model operation sees it."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        # The unit of work commits once, at the end
+        pass
+
+    def rollback(self):
+        # Undoing the operation is left to its savepoint
+        pass
+
+
+class UnitOfWork:
+    _local = threading.local()
+
+    def __init__(self, savepoints=True):
+        # savepoints=False saves two round-trips per operation, but then any
+        # failed operation aborts the whole unit
+        self.savepoints = savepoints
+        self.conn = None
+        self._borrowed = None
+        self._names = itertools.count(1)
+        self._written = {}   # table -> model instance, for invalidation at the end
+        self.failed = False
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, 'unit', None)
+
+    def __enter__(self):
+        if self.current() is not None:
+            raise RuntimeError("a unit of work is already open on this thread; use savepoint()")
+        self._borrowed = get_pool().connection()
+        self.conn = self._borrowed.__enter__()
+        self.conn.autocommit = False
+        self._local.unit = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._local.unit = None
+        try:
+            if exc_type is None and not self.failed:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+                if exc_type is None:
+                    # PostgreSQL would silently turn the COMMIT into a ROLLBACK
+                    raise RuntimeError("unit of work rolled back because an operation failed")
+        finally:
+            try:
+                self.conn.autocommit = True
+            finally:
+                self._borrowed.__exit__(None, None, None)
+                self.conn = None
+                for model in self._written.values():
+                    model.invalidate_cache()
+        return False
+
+    @contextmanager
+    def savepoint(self):
+        """Undo everything done in the block if it raises, then re-raise."""
+        name = f"uow_{next(self._names)}"
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield _Joined(self.conn)
+        except Exception:
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"RELEASE SAVEPOINT {name}")
+
+    @contextmanager
+    def operation(self):
+        # Connection for one model operation
+        if self.savepoints:
+            with self.savepoint() as conn:
+                yield conn
+            return
+        try:
+            yield _Joined(self.conn)
+        except Exception:
+            self.failed = True
+            raise
+
+    def written(self, model):
+        self._written.setdefault(model.table_name, model)
@@ -7,7 +7,13 @@ class View:
         print("4. Delete Data")
         print("5. Generate Random Data")
         print("6. Search Data")
-        print("7. Quit")
+        print("7. Import Data")
+        print("8. Pool and Cache Stats")
+        print("9. Generate Dataset")
+        print("10. Export Data")
+        print("11. Reports")
+        print("12. Query Statistics")
+        print("13. Quit")
         return input("Enter your choice: ")
 
     def show_table_menu(self):
@@ -60,6 +66,15 @@ class View:
         data['hoursworked'] = float(input("Enter hours worked: "))
         return data
 
+    def get_mechanic_assignments(self):
+        assignments = []
+        while True:
+            mechanicid = input("Assign mechanic ID (leave blank to finish): ")
+            if not mechanicid:
+                return assignments
+            hoursworked = float(input("Enter hours worked: "))
+            assignments.append({'mechanicid': int(mechanicid), 'hoursworked': hoursworked})
+
     def get_pk_input(self, table_name):
         pk_value = input(f"Enter {table_name} ID: ")
         return int(pk_value)
@@ -69,11 +84,34 @@ class View:
             print("No records found.")
             return
         for record in records:
-            print(dict(record))
+            # Records print in dict form without building a dict per row
+            print(record)
+
+    def get_next_page(self):
+        return input("Press Enter for the next page or 'q' to stop: ").strip().lower() != 'q'
+
+    def confirm_cascade(self, table_name, dependents):
+        answer = input(f"{table_name} is referenced by {', '.join(dependents)}. Delete them too? (y/N): ")
+        return answer.strip().lower() == 'y'
 
     def show_message(self, message):
         print(message)
 
+    def show_stats(self, title, stats):
+        print(f"\n{title}:")
+        for key, value in stats.items():
+            print(f"  {key}: {value}")
+
+    def show_query_stats(self, operations):
+        print("\nQuery Timings (slowest total first):")
+        if not operations:
+            print("  No statements recorded yet.")
+        for name, stats in operations.items():
+            print(f"  {name}: {stats['calls']} calls, {stats['errors']} errors, {stats['rows']} rows, "
+                  f"total {stats['total_ms']:.1f} ms, p50 {stats['p50_ms']:.2f} / p95 {stats['p95_ms']:.2f} / "
+                  f"p99 {stats['p99_ms']:.2f} ms")
+            print("    " + "  ".join(f"{bucket}: {count}" for bucket, count in stats['histogram'].items() if count))
+
     def get_update_data(self, table_name, record):
         data = {}
         for key in record.keys():
@@ -88,14 +126,63 @@ class View:
         count = input("Enter the number of random records to generate: ")
         return int(count)
 
+    def get_import_path(self):
+        return input("Enter path to CSV or JSONL file: ")
+
+    def get_dataset_counts(self, table_names):
+        counts = {}
+        for table_name in table_names:
+            count = input(f"Rows for {table_name} (leave blank for none): ")
+            counts[table_name] = int(count) if count else 0
+        return counts
+
+    def get_realistic_choice(self):
+        answer = input("Realistic names, makes, dates and costs (needs numpy)? (y/N): ")
+        return answer.strip().lower() == 'y'
+
+    def select_report(self, reports):
+        print("\nSelect Report:")
+        for number, report in enumerate(reports, start=1):
+            print(f"{number}. {report['title']}")
+        print(f"{len(reports) + 1}. Back to Main Menu")
+        return input("Enter your choice: ")
+
+    def get_report_limit(self):
+        limit = input("Enter number of rows to show (leave blank for all): ")
+        return int(limit) if limit else None
+
     def select_search_query(self):
         print("\nSelect Search Query:")
         print("1. Search Cars by Make and Year Range")
         print("2. Search Mechanics by Specialty and Name Pattern")
         print("3. Search Service Records by Date Range and Service Type")
-        print("4. Back to Main Menu")
+        print("4. Service Cost Totals per Car")
+        print("5. Back to Main Menu")
         return input("Enter your choice: ")
 
+    def get_search_action(self):
+        answer = input("Press Enter to show results, 'e' for the EXPLAIN ANALYZE plan, 'x' to export: ")
+        return {'e': 'explain', 'x': 'export'}.get(answer.strip().lower(), 'show')
+
+    def get_export_path(self):
+        return input("Enter output file (.csv, .jsonl or .parquet): ")
+
+    def show_plan_summary(self, summary):
+        print(f"\nPlanning time: {summary['planning_ms']:.2f} ms, execution time: {summary['execution_ms']:.2f} ms")
+        print(f"Buffers: {summary['shared_hit_blocks']} hit, {summary['shared_read_blocks']} read")
+        for scan in summary['scans']:
+            target = scan['relation'] or ''
+            if scan['index']:
+                target += f" using {scan['index']}"
+            print(f"  {scan['node']} on {target}: estimated {scan['estimated_rows']} rows, actual {scan['actual_rows']}")
+        if summary['seq_scans']:
+            print(f"Sequential scans on: {', '.join(summary['seq_scans'])}")
+
+    def confirm_create_index(self, index):
+        answer = input(f"Missing index {index['name']} on {index['table']} "
+                       f"USING {index['method']} ({index['columns']}). Create it? (y/N): ")
+        return answer.strip().lower() == 'y'
+
     def get_car_search_input(self):
         make = input("Enter car make (leave blank for any): ")
         year_from = input("Enter start year (leave blank for any): ")
@@ -112,3 +199,9 @@ class View:
         date_to = input("Enter end date (YYYY-MM-DD, leave blank for any): ")
         servicetype = input("Enter service type (leave blank for any): ")
         return {'date_from': date_from, 'date_to': date_to, 'servicetype': servicetype}
+
+    def get_cost_totals_input(self):
+        date_from = input("Enter start date (YYYY-MM-DD, leave blank for any): ")
+        date_to = input("Enter end date (YYYY-MM-DD, leave blank for any): ")
+        limit = input("Enter number of cars to show (leave blank for all): ")
+        return {'date_from': date_from, 'date_to': date_to, 'limit': limit}